@@ -1,7 +1,12 @@
 # backend/main.py
 
+import os
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 # Import routers
 from routers.render import router as render_router
@@ -10,7 +15,34 @@ from routers.score import router as score_router
 from routers.lyrics import router as lyrics_router
 from routers.audio import router as audio_router
 
-app = FastAPI()
+from services.ffmpeg import ffmpeg_capabilities, ffmpeg_capabilities_summary
+from services.jobs import job_recover, start_job_maintenance, close_job_store
+from services.loudness import shutdown_loudness_pool
+from services.metrics import metrics_text
+from services.pitch import shutdown_pitch_pool
+from services.separation import shutdown_separation_engine
+from services.whisper_models import preload_whisper_models
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# probe ffmpeg once (filters, encoders, soxr) so every filter chain is built right the first time
+	ffmpeg_capabilities()
+	# jobs left queued/running by a previous process are failed (or re-queued) before serving
+	job_recover()
+	start_job_maintenance()
+	# WHISPER_PRELOAD=small,medium loads those models in the background so the first request is warm
+	preload = [s for s in os.environ.get("WHISPER_PRELOAD", "").split(",") if s.strip()]
+	if preload:
+		threading.Thread(target=preload_whisper_models, args=(preload,), daemon=True).start()
+	yield
+	shutdown_separation_engine()
+	shutdown_loudness_pool()
+	shutdown_pitch_pool()
+	close_job_store()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS 설정: 프론트엔드 개발 서버(http://localhost:5173)에서의 요청을 허용
 origins = [
@@ -32,7 +64,12 @@ def read_root():
 
 @app.get("/api/status")
 def get_status():
-	return {"status": "ok", "message": "Backend is running!"}
+	return {"status": "ok", "message": "Backend is running!", "ffmpeg": ffmpeg_capabilities_summary()}
+
+@app.get("/api/metrics")
+def get_metrics():
+	# Prometheus text format: stage latency histograms, job gauges, rusage, cache hit ratios
+	return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
 
 # Include all routers
 app.include_router(render_router, prefix="/api")
@@ -43,4 +80,4 @@ app.include_router(audio_router, prefix="/api")
 
 if __name__ == "__main__":
 	import uvicorn
-	uvicorn.run(app, host="0.0.0.0", port=8000, lifespan="off")
\ No newline at end of file
+	uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,18 +1,31 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pathlib import Path
-import subprocess
+import asyncio
 import tempfile
 import shutil
 import json
-from typing import Dict, Any, Optional
+import math
+import os
+import re
+import zipfile
+from typing import Dict, Any, List, Optional
 
 from services.files import create_temp_dir, safe_rmtree, safe_unlink
-from services.ffmpeg import resolve_binaries
+from services.ffmpeg import audio_output_args, has_filter, resolve_binaries, resample_filter, run_process, run_process_sync, stream_process
+from services.loudness import album_loudness, measure_loudness, measure_loudness_batch, measurement_get, measurement_id, measurement_put
+from services.metrics import stage_timer
+from services.peaks import ensure_peaks, get_peaks_summary, render_peaks
+from services.uploads import UploadNotFound, acquire_audio_input, ingest_upload, upload_get, upload_release
+from services.workspace import WorkspaceFull
 
 router = APIRouter()
 
 _FFMPEG_EXE, _FFPROBE_EXE = resolve_binaries()
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_STREAM_CHUNK = 64 * 1024
+_BATCH_MAX_TRACKS = 50
 
 
 def _extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
@@ -32,47 +45,30 @@ def _measure_lufs_first_pass(input_path: Path, target_i: float = -14.0, target_t
 	Run ffmpeg loudnorm in analysis mode to measure integrated loudness (LUFS), true-peak, and LRA.
 	Returns a dict with keys like input_i, input_tp, input_lra, input_thresh, target_offset, etc.
 	"""
-	def _run_with_filter(filter_expr: str):
-		cmd_local = [
-			_FFMPEG_EXE,
-			"-hide_banner",
-			"-nostats",
-			"-i",
-			str(input_path),
-			"-filter:a",
-			filter_expr,
-			"-f",
-			"null",
-			"-",
-		]
-		return subprocess.run(
-			cmd_local,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			text=True,
-			encoding="utf-8",
-			errors="ignore",
-		)
-
-	# First try high-precision soxr
-	filter_soxr = (
-		"aresample=48000:resampler=soxr:precision=28,"
+	# resampler (soxr when the build has it) comes from the capability registry, so this runs exactly once
+	filter_expr = (
+		f"{resample_filter(48000)},"
 		f"loudnorm=I={target_i}:TP={target_tp}:LRA={target_lra}:print_format=json"
 	)
-	proc = _run_with_filter(filter_soxr)
+	cmd = [
+		_FFMPEG_EXE,
+		"-hide_banner",
+		"-nostats",
+		"-i",
+		str(input_path),
+		"-filter:a",
+		filter_expr,
+		"-f",
+		"null",
+		"-",
+	]
+	# called from the threadpool (_measure_cached), so the blocking wrapper is fine here
+	proc = run_process_sync(cmd, tail_lines=80)
 
-	# If soxr not available or failed, fallback to default resampler
-	if proc.returncode != 0 or not _extract_json_from_text((proc.stderr or "") + (proc.stdout or "")):
-		filter_fallback = (
-			"aresample=48000,"
-			f"loudnorm=I={target_i}:TP={target_tp}:LRA={target_lra}:print_format=json"
-		)
-		proc = _run_with_filter(filter_fallback)
-
-	combined = (proc.stderr or "") + "\n" + (proc.stdout or "")
-	if proc.returncode != 0:
+	combined = proc["stderr_tail"]
+	if proc["returncode"] != 0:
 		# include tail of stderr to help diagnose
-		tail = "\n".join((proc.stderr or combined).splitlines()[-50:])
+		tail = "\n".join(combined.splitlines()[-50:])
 		raise RuntimeError(f"ffmpeg loudnorm analysis failed: {tail}")
 	json_data = _extract_json_from_text(combined)
 	if not json_data:
@@ -82,6 +78,35 @@ def _measure_lufs_first_pass(input_path: Path, target_i: float = -14.0, target_t
 	return json_data
 
 
+def _measure_loudness(input_path: Path, engine: str, target_i: float = -14.0, target_tp: float = -1.5, target_lra: float = 11.0, include_curves: bool = False) -> Dict[str, Any]:
+	"""Pass 1 with the in-process BS.1770 meter ("native", default) or ffmpeg loudnorm ("ffmpeg"); same keys either way."""
+	with stage_timer("loudness"):
+		if engine == "ffmpeg":
+			return _measure_lufs_first_pass(input_path, target_i=target_i, target_tp=target_tp, target_lra=target_lra)
+		return measure_loudness(_FFMPEG_EXE, input_path, target_i=target_i, target_tp=target_tp, target_lra=target_lra, include_curves=include_curves)
+
+
+def _measure_cached(audio: Dict[str, Any], engine: str, target_i: float, target_tp: float, target_lra: float, include_curves: bool = False):
+	"""Returns (measurement_id, measured, cache_hit); curves are never cached, so asking for them always measures."""
+	mid = measurement_id(audio["audio_id"], engine, target_i, target_tp, target_lra)
+	if not include_curves:
+		cached = measurement_get(mid)
+		if cached is not None:
+			return mid, cached["measured"], True
+	measured = _measure_loudness(audio["path"], engine, target_i, target_tp, target_lra, include_curves=include_curves)
+	measurement_put(mid, audio["audio_id"], engine, {"target_i": target_i, "target_tp": target_tp, "target_lra": target_lra}, measured)
+	return mid, measured, False
+
+
+def _second_pass_measurement(audio: Dict[str, Any], measured: Dict[str, Any], target_i: float, target_tp: float, target_lra: float):
+	"""Returns (measured, cache_hit) usable for loudnorm's second pass. The native meter only predicts the
+	linear case; dynamic mode needs the target_offset from loudnorm's own first pass."""
+	if measured.get("target_offset") is not None:
+		return measured, True
+	_, measured, cache_hit = _measure_cached(audio, "ffmpeg", target_i, target_tp, target_lra)
+	return measured, cache_hit
+
+
 def _build_loudnorm_filter_second_pass(measured: Dict[str, Any], target_i: float = -14.0, target_tp: float = -1.5, target_lra: float = 11.0) -> str:
 	# loudnorm second pass expects these measured params (note case sensitivity)
 	input_i = measured.get("input_i") or measured.get("measured_I")
@@ -98,38 +123,68 @@ def _build_loudnorm_filter_second_pass(measured: Dict[str, Any], target_i: float
 	)
 
 
+async def _acquire_audio(file: Optional[UploadFile], audio_id: Optional[str]) -> Dict[str, Any]:
+	try:
+		return await acquire_audio_input(file, audio_id)
+	except UploadNotFound:
+		raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+	except ValueError:
+		raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
+
+
+@router.post("/audio/uploads")
+async def create_upload(file: UploadFile = File(...)):
+	"""
+	오디오를 한 번만 업로드하고 audio_id(SHA-256)를 받습니다. 같은 내용은 한 번만 저장됩니다.
+	다른 엔드포인트에 file 대신 audio_id를 넘기면 다시 업로드하지 않고 재사용합니다.
+	"""
+	info = await ingest_upload(file)
+	return {
+		"audio_id": info["audio_id"],
+		"filename": info["filename"],
+		"size": info["size"],
+		"deduplicated": info["deduplicated"],
+	}
+
+
+@router.get("/audio/uploads/{audio_id}")
+def get_upload(audio_id: str):
+	info = upload_get(audio_id)
+	if info is None:
+		raise HTTPException(status_code=404, detail="upload not found")
+	return {"audio_id": info["audio_id"], "filename": info["filename"], "size": info["size"], "refs": info["refs"]}
+
+
 @router.post("/audio/measure-lufs")
-async def measure_lufs(file: UploadFile = File(...)):
+async def measure_lufs(
+	file: Optional[UploadFile] = File(None),
+	audio_id: Optional[str] = None,
+	engine: str = "native",  # native | ffmpeg
+	curves: bool = True,  # momentary/short-term loudness every 100 ms (native engine)
+	target_lufs: float = -14.0,  # targets only shape the output_* estimate; pass the ones normalize will use
+	target_tp: float = -1.5,
+	target_lra: float = 11.0,
+):
+	if engine not in ("native", "ffmpeg"):
+		raise HTTPException(status_code=400, detail="engine must be native or ffmpeg")
 	if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
 		raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다. ffmpeg 또는 imageio-ffmpeg를 설치하세요.")
 
-	# Save upload to temp file
-	tmp_dir = create_temp_dir("lufs_measure_")
-	input_path = tmp_dir / (Path(file.filename).name or "input")
+	audio = await _acquire_audio(file, audio_id)
 	try:
-		with input_path.open("wb") as f:
-			while True:
-				chunk = await file.read(1024 * 1024)
-				if not chunk:
-					break
-				f.write(chunk)
-
-		measured = _measure_lufs_first_pass(input_path)
-		return measured
+		mid, measured, _ = await run_in_threadpool(_measure_cached, audio, engine, target_lufs, target_tp, target_lra, curves)
+		return dict(measured, audio_id=audio["audio_id"], measurement_id=mid)
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 	finally:
-		try:
-			safe_unlink(input_path)
-			safe_rmtree(tmp_dir)
-		except Exception:
-			pass
+		upload_release(audio["audio_id"])
 
 
 @router.post("/audio/normalize")
 async def normalize_audio(
 	bg: BackgroundTasks,
-	file: UploadFile = File(...),
+	file: Optional[UploadFile] = File(None),
+	audio_id: Optional[str] = None,
 	target_lufs: float = -14.0,
 	target_tp: float = -1.5,
 	target_lra: float = 11.0,
@@ -138,29 +193,51 @@ async def normalize_audio(
 	compress_ratio: float = 3.0,
 	compress_attack_ms: int = 20,
 	compress_release_ms: int = 200,
+	engine: str = "native",  # pass-1 meter: native | ffmpeg
+	measurement_id: Optional[str] = None,  # from /audio/measure-lufs; skips pass 1
+	format: str = "wav",  # wav | flac | opus | mp3
+	bitrate: Optional[str] = None,  # opus/mp3 only, e.g. 128k
+	stream: bool = False,  # flac/opus/mp3: pipe ffmpeg stdout to the client instead of writing a temp file
 ):
 	"""
 	두 패스 loudnorm을 이용하여 -14 LUFS(기본값)로 정규화된 오디오를 반환합니다.
-	반환 포맷은 WAV(PCM 16-bit) 입니다.
+	반환 포맷은 format으로 고릅니다: wav(PCM 16-bit, 기본값), flac, opus, mp3. 출력은 48 kHz입니다.
+	measure-lufs가 돌려준 measurement_id(또는 같은 audio/engine/target의 캐시)가 있으면 1패스 측정을 건너뜁니다.
+	stream=true이면 2패스 ffmpeg 출력을 임시 파일 없이 바로 스트리밍합니다(flac/opus/mp3만; wav는 헤더 크기 때문에 항상 임시 파일을 거칩니다).
 	"""
+	if engine not in ("native", "ffmpeg"):
+		raise HTTPException(status_code=400, detail="engine must be native or ffmpeg")
+	try:
+		output_args, output_format = audio_output_args(format, bitrate)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
 	if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
 		raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다. ffmpeg 또는 imageio-ffmpeg를 설치하세요.")
 
-	tmp_dir = create_temp_dir("normalize_")
-	input_path = tmp_dir / (Path(file.filename).name or "input")
-	output_path = tmp_dir / f"{Path(file.filename).stem or 'output'}_norm.wav"
+	cached = measurement_get(measurement_id) if measurement_id else None
+	if measurement_id and cached is None and file is None and not audio_id:
+		raise HTTPException(status_code=404, detail="measurement_id에 해당하는 측정값이 없습니다. 파일 또는 audio_id와 함께 다시 요청하세요.")
+	audio = await _acquire_audio(file, audio_id or (cached or {}).get("audio_id"))
+	if cached is not None and cached["audio_id"] != audio["audio_id"]:
+		cached = None
+	input_path = audio["path"]
+	output_name = f"{Path(audio['filename']).stem or 'output'}_norm.{output_format['ext']}"
+	tmp_dir: Optional[Path] = None
+	# in stream mode the response generator owns the upload reference and releases it when done
+	streaming = False
 
 	try:
-		# Save upload
-		with input_path.open("wb") as f:
-			while True:
-				chunk = await file.read(1024 * 1024)
-				if not chunk:
-					break
-				f.write(chunk)
-
-		# Pass 1: measure
-		measured = _measure_lufs_first_pass(input_path, target_i=target_lufs, target_tp=target_tp, target_lra=target_lra)
+		# Pass 1: reuse the measurement when it was taken with this engine for these targets. Only input_*
+		# would carry over to other targets; target_offset comes from a pass at the targets themselves,
+		# so anything else is measured again (under its own measurement id).
+		targets = {"target_i": target_lufs, "target_tp": target_tp, "target_lra": target_lra}
+		if cached is not None and cached["targets"] == targets and cached["engine"] == engine:
+			mid, measured, cache_hit = measurement_id, cached["measured"], True
+		else:
+			mid, measured, cache_hit = await run_in_threadpool(_measure_cached, audio, engine, target_lufs, target_tp, target_lra)
+		if measured.get("target_offset") is None:
+			measured, offset_hit = await run_in_threadpool(_second_pass_measurement, audio, measured, target_lufs, target_tp, target_lra)
+			cache_hit = cache_hit and offset_hit
 		# Pass 2: apply with measured params
 		filter_second = _build_loudnorm_filter_second_pass(measured, target_i=target_lufs, target_tp=target_tp, target_lra=target_lra)
 		# Build optional pre-compression to better approach desired LRA
@@ -171,71 +248,263 @@ async def normalize_audio(
 			pre_chain.append(
 				f"acompressor=threshold={compress_threshold_db}dB:ratio={compress_ratio}:attack={compress_attack_ms}:release={compress_release_ms}"
 			)
-		# Match measurement path: apply high-quality resample before loudnorm
-		chain = ["aresample=48000:resampler=soxr:precision=28"] + pre_chain + [filter_second]
+		# Match measurement path: same resampler before loudnorm
+		chain = [resample_filter(48000)] + pre_chain + [filter_second]
 		apply_filter = ",".join(chain)
-		cmd2 = [
-			_FFMPEG_EXE,
-			"-y",
-			"-hide_banner",
-			"-i",
-			str(input_path),
-			"-filter:a",
-			apply_filter,
-			"-c:a",
-			"pcm_s16le",
-			str(output_path),
-		]
-		proc2 = subprocess.run(
-			cmd2,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			text=True,
-			encoding="utf-8",
-			errors="ignore",
-		)
-		if proc2.returncode != 0 or not output_path.exists():
-			# Fallback without soxr (in case filter not supported)
-			chain_fb = ["aresample=48000"] + pre_chain + [filter_second]
-			apply_filter_fb = ",".join(chain_fb)
-			cmd2_fb = [
-				_FFMPEG_EXE,
-				"-y",
-				"-hide_banner",
-				"-i",
-				str(input_path),
-				"-filter:a",
-				apply_filter_fb,
-				"-c:a",
-				"pcm_s16le",
-				str(output_path),
-			]
-			proc2 = subprocess.run(
-				cmd2_fb,
-				stdout=subprocess.PIPE,
-				stderr=subprocess.PIPE,
-				text=True,
-				encoding="utf-8",
-				errors="ignore",
-			)
-			if proc2.returncode != 0 or not output_path.exists():
-				detail = (proc2.stderr or "").splitlines()[-50:]
-				raise HTTPException(status_code=500, detail="ffmpeg loudnorm failed: " + "\n".join(detail))
+		headers = {"X-Measurement-Id": mid, "X-Measurement-Cache": "hit" if cache_hit else "miss", "X-Audio-Id": audio["audio_id"]}
+		cmd2 = [_FFMPEG_EXE, "-y", "-hide_banner", "-i", str(input_path), "-filter:a", apply_filter, "-vn", *output_args]
+
+		# WAV is always rendered to a temp file: see AUDIO_OUTPUT_FORMATS
+		if stream and output_format["streamable"]:
+			chunks = stream_process(cmd2[:3] + ["-v", "error"] + cmd2[3:] + ["pipe:1"], chunk_size=_STREAM_CHUNK)
+			# wait for the first bytes so a failing ffmpeg still turns into a 500 instead of an empty 200
+			try:
+				first = await chunks.__anext__()
+			except StopAsyncIteration:
+				raise HTTPException(status_code=500, detail="ffmpeg loudnorm produced no output")
+			except RuntimeError as e:
+				raise HTTPException(status_code=500, detail="ffmpeg loudnorm failed: " + str(e))
+
+			async def _pipe():
+				try:
+					yield first
+					async for chunk in chunks:
+						yield chunk
+				finally:
+					# client gone or output done: closing the generator kills ffmpeg if it is still running
+					await chunks.aclose()
+					upload_release(audio["audio_id"])
+
+			streaming = True
+			headers["Content-Disposition"] = f'attachment; filename="{output_name}"'
+			return StreamingResponse(_pipe(), media_type=output_format["media_type"], headers=headers)
+
+		tmp_dir = create_temp_dir("normalize_")
+		output_path = tmp_dir / output_name
+		with stage_timer("encode"):
+			proc2 = await run_process(cmd2 + [str(output_path)])
+		if proc2["returncode"] != 0 or not output_path.exists():
+			raise HTTPException(status_code=500, detail="ffmpeg loudnorm failed: " + proc2["stderr_tail"])
 
 		def _cleanup():
 			try:
 				safe_unlink(output_path)
-				safe_unlink(input_path)
 				safe_rmtree(tmp_dir)
 			except Exception:
 				pass
 
 		bg.add_task(_cleanup)
-		return FileResponse(path=str(output_path), filename=str(output_path.name), media_type="audio/wav")
+		return FileResponse(
+			path=str(output_path),
+			filename=output_name,
+			media_type=output_format["media_type"],
+			headers=headers,
+		)
 
 	except HTTPException:
-		safe_rmtree(tmp_dir)
+		if tmp_dir is not None:
+			safe_rmtree(tmp_dir)
 		raise
 	except Exception as e:
-		safe_rmtree(tmp_dir)
+		if tmp_dir is not None:
+			safe_rmtree(tmp_dir)
 		raise HTTPException(status_code=500, detail=str(e))
+	finally:
+		if not streaming:
+			upload_release(audio["audio_id"])
+
+
+def _gain_filter(gain_db: float, input_tp: float, target_tp: float):
+	"""Batch second pass: a plain gain (the album's in album mode, the track's own in track mode); a limiter
+	is added only when the gain would push the track over target_tp. Returns (filter, limited)."""
+	chain = [resample_filter(48000), f"volume={gain_db:.2f}dB"]
+	limited = math.isfinite(input_tp) and input_tp + gain_db > target_tp and has_filter("alimiter")
+	if limited:
+		# alimiter only sees sample peaks: run it 4x oversampled (like loudnorm) and aim a little under target_tp;
+		# the output stage resamples back to 48 kHz
+		chain += ["aresample=192000", f"alimiter=limit={10 ** ((target_tp - 0.5) / 20.0):.4f}:attack=5:release=50:level=false"]
+	return ",".join(chain), limited
+
+
+async def _encode_track(input_path: Path, filter_expr: str, output_args: List[str], output_path: Path) -> None:
+	cmd = [_FFMPEG_EXE, "-y", "-hide_banner", "-v", "error", "-i", str(input_path), "-filter:a", filter_expr, "-vn", *output_args, str(output_path)]
+	with stage_timer("encode"):
+		proc = await run_process(cmd, tail_lines=20)
+	if proc["returncode"] != 0 or not output_path.exists():
+		raise RuntimeError("ffmpeg failed: " + proc["stderr_tail"])
+
+
+@router.post("/audio/normalize-batch")
+async def normalize_batch(
+	bg: BackgroundTasks,
+	files: List[UploadFile] = File([]),
+	audio_ids: Optional[str] = None,  # comma-separated, appended after the uploaded files
+	mode: str = "track",  # track: each track to target_lufs | album: one gain from the album loudness
+	target_lufs: float = -14.0,
+	target_tp: float = -1.5,
+	target_lra: float = 11.0,
+	format: str = "wav",
+	bitrate: Optional[str] = None,
+):
+	"""
+	여러 트랙(앨범)을 한 번에 측정하고 정규화합니다. 측정은 프로세스 풀에서 병렬로 실행됩니다(native 미터).
+	트랙별 및 앨범 전체 통합 라우드니스를 계산하고, mode=track이면 트랙마다 target_lufs까지의 게인을, mode=album이면
+	앨범 라우드니스 기준의 단일 게인을 모든 트랙에 적용합니다. 게인이 target_tp를 넘기는 트랙에만 리미터를 겁니다
+	(loudnorm을 쓰지 않으므로 target_lra로 다이내믹을 줄이지는 않습니다). 정규화된 파일과 report.json을 담은 ZIP을 반환합니다.
+	"""
+	if mode not in ("track", "album"):
+		raise HTTPException(status_code=400, detail="mode must be track or album")
+	try:
+		output_args, output_format = audio_output_args(format, bitrate)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
+		raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다. ffmpeg 또는 imageio-ffmpeg를 설치하세요.")
+	ids = [a.strip() for a in (audio_ids or "").split(",") if a.strip()]
+	if not (files or ids):
+		raise HTTPException(status_code=400, detail="files 또는 audio_ids가 필요합니다.")
+	if len(files or []) + len(ids) > _BATCH_MAX_TRACKS:
+		raise HTTPException(status_code=400, detail=f"한 번에 최대 {_BATCH_MAX_TRACKS}개 트랙까지 처리할 수 있습니다.")
+
+	audios: List[Dict[str, Any]] = []
+	tmp_dir: Optional[Path] = None
+	try:
+		for f in files or []:
+			audios.append(await _acquire_audio(f, None))
+		for a in ids:
+			audios.append(await _acquire_audio(None, a))
+
+		targets = {"target_i": target_lufs, "target_tp": target_tp, "target_lra": target_lra}
+		results = await run_in_threadpool(measure_loudness_batch, _FFMPEG_EXE, [a["path"] for a in audios], target_lufs, target_tp, target_lra)
+		tracks: List[Dict[str, Any]] = []
+		blocks = []
+		for i, (audio, measured) in enumerate(zip(audios, results)):
+			track = {"index": i + 1, "audio_id": audio["audio_id"], "filename": audio["filename"]}
+			if isinstance(measured, Exception):
+				track["error"] = str(measured)
+			else:
+				blocks.append(measured.pop("gating_blocks"))
+				mid = measurement_id(audio["audio_id"], "native", target_lufs, target_tp, target_lra)
+				measurement_put(mid, audio["audio_id"], "native", targets, measured)
+				track.update(measurement_id=mid, measured=measured)
+			tracks.append(track)
+		if not blocks:
+			raise HTTPException(status_code=500, detail="모든 트랙의 라우드니스 측정에 실패했습니다: " + tracks[0]["error"])
+
+		album = album_loudness(blocks)
+		album_gain = target_lufs - album["integrated"] if math.isfinite(album["integrated"]) else 0.0
+		tmp_dir = create_temp_dir("normalize_batch_", heavy=True)
+		jobs = []
+		for audio, track in zip(audios, tracks):
+			if "error" in track:
+				continue
+			measured = track["measured"]
+			input_i, input_tp = float(measured["input_i"]), float(measured["input_tp"])
+			if mode == "album":
+				gain_db = album_gain
+			else:
+				gain_db = target_lufs - input_i if math.isfinite(input_i) else 0.0
+			filter_expr, limited = _gain_filter(gain_db, input_tp, target_tp)
+			# no loudnorm here, so its predicted output_*/offset would not describe the file
+			track["measured"] = {k: v for k, v in measured.items() if k.startswith("input_") or k == "duration"}
+			track.update(gain_db=round(gain_db, 2), limited=limited)
+			name = f"{track['index']:02d}_{Path(audio['filename']).stem or 'track'}_norm.{output_format['ext']}"
+			track["output"] = name
+			jobs.append((track, audio["path"], filter_expr, tmp_dir / name))
+
+		# second passes are separate ffmpeg processes, at most one per core at a time
+		slots = asyncio.Semaphore(os.cpu_count() or 1)
+
+		async def _encode(track, path, expr, out):
+			async with slots:
+				try:
+					await _encode_track(path, expr, output_args, out)
+				except Exception as e:
+					track["error"] = str(e)
+					track.pop("output", None)
+
+		await asyncio.gather(*(_encode(*job) for job in jobs))
+		report = {
+			"mode": mode,
+			"format": output_format["name"],
+			"targets": targets,
+			"album": {
+				"input_i": round(album["integrated"], 2) if math.isfinite(album["integrated"]) else None,
+				"input_thresh": round(album["threshold"], 2),
+				"gain_db": round(album_gain, 2) if mode == "album" else None,
+			},
+			"tracks": tracks,
+		}
+		zip_path = tmp_dir / "normalized.zip"
+		with stage_timer("zip"), zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+			for track in tracks:
+				if "output" in track:
+					zf.write(tmp_dir / track["output"], arcname=track["output"])
+					safe_unlink(tmp_dir / track["output"])
+			zf.writestr("report.json", json.dumps(report, ensure_ascii=False, indent=2))
+
+		cleanup_dir = tmp_dir
+		bg.add_task(safe_rmtree, cleanup_dir)
+		tmp_dir = None
+		return FileResponse(
+			path=str(zip_path),
+			filename="normalized.zip",
+			media_type="application/zip",
+			headers={"X-Album-Loudness": str(report["album"]["input_i"])},
+		)
+	except HTTPException:
+		raise
+	except WorkspaceFull:
+		raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+	except Exception as e:
+		raise HTTPException(status_code=500, detail=str(e))
+	finally:
+		if tmp_dir is not None:
+			safe_rmtree(tmp_dir)
+		for audio in audios:
+			upload_release(audio["audio_id"])
+
+
+@router.post("/audio/peaks")
+async def build_peaks(file: Optional[UploadFile] = File(None), audio_id: Optional[str] = None):
+	"""
+	오디오를 한 번 디코딩하여 다중 해상도 min/max 피크 피라미드를 만들고 content hash로 캐시합니다.
+	반환된 audio_hash로 GET /audio/peaks/{audio_hash} 를 호출하여 원하는 줌 레벨의 바이너리를 받습니다.
+	audio_hash는 업로드 저장소의 audio_id와 같은 값입니다.
+	"""
+	audio = await _acquire_audio(file, audio_id)
+	try:
+		return await run_in_threadpool(ensure_peaks, _FFMPEG_EXE, audio["path"], audio["audio_id"])
+	except Exception as e:
+		raise HTTPException(status_code=500, detail=str(e))
+	finally:
+		upload_release(audio["audio_id"])
+
+
+@router.get("/audio/peaks/{audio_hash}/info")
+def peaks_info(audio_hash: str):
+	if not _HASH_RE.match(audio_hash):
+		raise HTTPException(status_code=400, detail="invalid audio hash")
+	summary = get_peaks_summary(audio_hash)
+	if summary is None:
+		raise HTTPException(status_code=404, detail="peaks not found")
+	return summary
+
+
+@router.get("/audio/peaks/{audio_hash}")
+def get_peaks(
+	audio_hash: str,
+	samples_per_pixel: int = 256,
+	bits: int = 8,
+	start: float = 0.0,
+	end: Optional[float] = None,
+):
+	"""audiowaveform 호환 .dat(v1) 바이너리: int32 version, uint32 flags(1=8bit), int32 sample_rate, int32 samples_per_pixel, uint32 length, (min,max)*length"""
+	if not _HASH_RE.match(audio_hash):
+		raise HTTPException(status_code=400, detail="invalid audio hash")
+	if bits not in (8, 16):
+		raise HTTPException(status_code=400, detail="bits must be 8 or 16")
+	payload = render_peaks(audio_hash, samples_per_pixel, bits=bits, start=start, end=end)
+	if payload is None:
+		raise HTTPException(status_code=404, detail="peaks not found")
+	return Response(content=payload, media_type="application/octet-stream", headers={"Cache-Control": "public, max-age=31536000, immutable"})
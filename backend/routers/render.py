@@ -1,79 +1,110 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path
-import subprocess
 import tempfile
 import shutil
+import os
 import threading
-import re
-from typing import Dict, Any, Optional
-
-from services.ffmpeg import resolve_binaries, probe_duration_seconds
-from services.files import create_temp_dir, safe_rmtree, safe_unlink
-from services.jobs import job_get, job_set, job_update
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from services.ffmpeg import (
+    resolve_binaries,
+    probe_duration_seconds,
+    ffmpeg_capabilities,
+    has_encoder,
+    ENCODER_PROFILES,
+    DEFAULT_ENCODER_PROFILE,
+    get_encoder_profile,
+    profile_geometry,
+    encoder_args,
+    run_process,
+    run_process_sync,
+    PROGRESS_ARGS,
+    progress_seconds,
+    progress_speed,
+)
+from services.files import acquire_temp_dir, create_temp_dir, safe_rmtree, safe_unlink
+from services.visualization import build_visualization_filter, parse_color, resolve_layers
+from services.metrics import observe_stage, stage_timer
+from services.jobs import job_cancel, job_get, job_set, job_update, job_submit, job_queue_info, job_process_started, job_sse_stream, job_touch, register_job_resumer
+from services.uploads import UploadNotFound, acquire_audio_input, upload_acquire, upload_release
+from services.workspace import WorkspaceFull
 
 
 router = APIRouter()
 
 _FFMPEG_EXE, _FFPROBE_EXE = resolve_binaries()
-_TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+\.?\d*)")
 
 
 @router.post("/render-waveform")
 async def render_waveform(
     bg: BackgroundTasks,
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    audio_id: Optional[str] = None,
     width: int = 1280,
     height: int = 720,
     color: str = "0x5ac8fa",
     background: str = "0x0b1020",
     fps: int = 30,
+    profile: str = DEFAULT_ENCODER_PROFILE,  # preview | balanced | archive
 ):
     if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
         raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다. ffmpeg 또는 imageio-ffmpeg를 설치하세요.")
+    if not has_encoder("libx264"):
+        raise HTTPException(status_code=500, detail="ffmpeg 빌드에 libx264 인코더가 없습니다. imageio-ffmpeg 번들 ffmpeg를 사용하세요.")
+    try:
+        enc_profile = get_encoder_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    width, height, fps = profile_geometry(enc_profile, width, height, fps)
+    try:
+        audio = await acquire_audio_input(file, audio_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
 
-    tmp_dir = create_temp_dir("wave_render_")
-    input_path = tmp_dir / (Path(file.filename).name or "input")
+    try:
+        tmp_dir = create_temp_dir("wave_render_", heavy=True)
+    except WorkspaceFull:
+        upload_release(audio["audio_id"])
+        raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+    input_path = audio["path"]
     output_path = tmp_dir / "output.mp4"
 
     try:
-        with input_path.open("wb") as f:
-            while True:
-                chunk = await file.read(1024 * 1024)
-                if not chunk:
-                    break
-                f.write(chunk)
-
-        filter_complex = (
-            f"color=c={background}:s={width}x{height}:r={fps}[bg];"
-            f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:mode=line:colors={color}[sw];"
-            f"[bg][sw]overlay=format=rgb"
-        )
+        filter_complex = build_visualization_filter(width, height, fps, background, [("line", parse_color(color))])
 
         cmd = [
             _FFMPEG_EXE,
+            *PROGRESS_ARGS,
             "-y",
             "-i",
             str(input_path),
             "-filter_complex",
             filter_complex,
+            "-map", "[vout]",
             "-map", "0:a",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
+            *encoder_args(enc_profile),
             "-c:a", "aac",
             "-shortest",
             str(output_path),
         ]
 
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.returncode != 0 or not output_path.exists():
-            detail = proc.stderr.decode(errors="ignore")[-2000:]
+        started = time.time()
+        frames = [0]
+        with stage_timer("encode"):
+            proc = await run_process(cmd, on_progress=lambda block: _track_frames(block, frames))
+        if proc["returncode"] != 0 or not output_path.exists():
+            detail = proc["stderr_tail"][-2000:]
             raise HTTPException(status_code=500, detail=f"ffmpeg 실패: {detail}")
+        encode_fps = _encode_fps(frames[0], time.time() - started)
 
         def _cleanup():
             try:
                 safe_unlink(output_path)
-                safe_unlink(input_path)
                 safe_rmtree(tmp_dir)
             except Exception:
                 pass
@@ -81,8 +112,13 @@ async def render_waveform(
         bg.add_task(_cleanup)
         return FileResponse(
             path=str(output_path),
-            filename=f"waveform_{Path(file.filename).stem or 'output'}.mp4",
+            filename=f"waveform_{Path(audio['filename']).stem or 'output'}.mp4",
             media_type="video/mp4",
+            headers={
+                "X-Encoder-Profile": enc_profile["name"],
+                "X-Encode-FPS": f"{encode_fps:.1f}",
+                "X-Audio-Id": audio["audio_id"],
+            },
         )
 
     except HTTPException:
@@ -91,6 +127,8 @@ async def render_waveform(
     except Exception as e:
         safe_rmtree(tmp_dir)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload_release(audio["audio_id"])
 
 
 def _run_ffmpeg_async(job_id: str, input_path: Path, output_path: Path, width: int, height: int, color: str, background: str, fps: int):
@@ -99,18 +137,16 @@ def _run_ffmpeg_async(job_id: str, input_path: Path, output_path: Path, width: i
 
         duration = probe_duration_seconds(_FFPROBE_EXE, input_path) or 0.0
 
-        filter_complex = (
-            f"color=c={background}:s={width}x{height}:r={fps}[bg];"
-            f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:mode=line:colors={color}[sw];"
-            f"[bg][sw]overlay=format=rgb"
-        )
+        filter_complex = build_visualization_filter(width, height, fps, background, [("line", parse_color(color))])
         cmd = [
             _FFMPEG_EXE,
+            *PROGRESS_ARGS,
             "-y",
             "-i",
             str(input_path),
             "-filter_complex",
             filter_complex,
+            "-map", "[vout]",
             "-map", "0:a",
             "-c:v", "libx264",
             "-pix_fmt", "yuv420p",
@@ -119,28 +155,12 @@ def _run_ffmpeg_async(job_id: str, input_path: Path, output_path: Path, width: i
             str(output_path),
         ]
 
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="ignore",
-        )
-        if not proc.stderr:
-            raise RuntimeError("ffmpeg stderr stream not available")
-        for line in proc.stderr:
-            match = _TIME_RE.search(line)
-            if match and duration and duration > 0:
-                hours = float(match.group(1))
-                minutes = float(match.group(2))
-                seconds = float(match.group(3))
-                current = hours * 3600 + minutes * 60 + seconds
-                progress = max(0.0, min(1.0, current / duration))
-                job_update(job_id, {"progress": progress})
-        proc.wait()
-
-        if proc.returncode == 0 and output_path.exists():
+        def _on_progress(block: Dict[str, str]) -> None:
+            _report_progress(job_id, progress_seconds(block), duration, progress_speed(block))
+
+        proc = run_process_sync(cmd, on_progress=_on_progress, on_start=job_process_started(job_id))
+
+        if proc["returncode"] == 0 and output_path.exists():
             job_update(job_id, {"status": "completed", "progress": 1.0})
         else:
             job_update(job_id, {"status": "failed", "error": "ffmpeg failed"})
@@ -148,49 +168,165 @@ def _run_ffmpeg_async(job_id: str, input_path: Path, output_path: Path, width: i
         job_update(job_id, {"status": "failed", "error": str(e)})
 
 
-def _run_ffmpeg_async_with_visualizations(job_id: str, input_path: Path, output_path: Path, width: int, height: int, color: str, background: str, fps: int, visualization_types: str, visualization_colors: str):
+_PARALLEL_PREROLL_SECONDS = 2.0  # audio history fed before each cut so scrolling/windowed layers match
+_PARALLEL_MIN_SEGMENT_SECONDS = 20.0
+
+
+def _track_frames(block: Dict[str, str], frames: List[int]) -> None:
+    frame = block.get("frame", "")
+    if frame.isdigit():
+        frames[0] = int(frame)
+
+
+def _report_progress(job_id: str, seconds: Optional[float], duration: float, speed: Optional[float], ceiling: float = 1.0) -> None:
+    # rounded so that progress watchers only hear about visible changes
+    if seconds is None or duration <= 0:
+        return
+    updates: Dict[str, Any] = {"progress": round(max(0.0, min(ceiling, seconds / duration)), 3)}
+    if speed is not None:
+        updates["speed"] = round(speed, 2)
+    job_update(job_id, updates)
+
+
+def _encode_fps(frames: int, seconds: float) -> float:
+    return frames / seconds if seconds > 0 else 0.0
+
+
+def _auto_segment_count(duration: float) -> int:
+    cores = os.cpu_count() or 1
+    by_length = int(duration // _PARALLEL_MIN_SEGMENT_SECONDS)
+    return max(1, min(cores // 2 or 1, by_length))
+
+
+def _render_segment(
+    index: int,
+    input_path: Path,
+    seg_path: Path,
+    start: float,
+    end: float,
+    fps: int,
+    filter_complex: str,
+    video_args: List[str],
+    on_time,
+    on_start=None,
+) -> None:
+    # Seek a little earlier than the cut, render, then trim the pre-roll frames away so every
+    # segment starts on an exact frame boundary (round(start * fps)).
+    seek = max(0.0, start - _PARALLEL_PREROLL_SECONDS)
+    first_frame = int(round(start * fps))
+    pre_frames = first_frame - int(round(seek * fps))
+    n_frames = int(round(end * fps)) - first_frame
+    graph = (
+        f"{filter_complex};"
+        f"[vout]trim=start_frame={pre_frames}:end_frame={pre_frames + n_frames},setpts=PTS-STARTPTS[vseg]"
+    )
+    cmd = [
+        _FFMPEG_EXE,
+        *PROGRESS_ARGS,
+        "-y",
+        "-ss", f"{seek:.3f}",
+        "-t", f"{end - seek + 1.0 / fps:.3f}",
+        "-i", str(input_path),
+        "-filter_complex", graph,
+        "-map", "[vseg]",
+        "-an",
+        *video_args,
+        str(seg_path),
+    ]
+    def _on_progress(block: Dict[str, str]) -> None:
+        current = progress_seconds(block)
+        if current is not None:
+            on_time(index, max(0.0, current - (start - seek)), progress_speed(block))
+
+    proc = run_process_sync(cmd, on_progress=_on_progress, on_start=on_start, tail_lines=10)
+    if proc["returncode"] != 0 or not seg_path.exists():
+        raise RuntimeError(f"segment {index} failed: {proc['stderr_tail']}")
+
+
+def _run_parallel_render(job_id: str, input_path: Path, output_path: Path, duration: float, fps: int, filter_complex: str, segments: int, enc_profile: Dict[str, Any]) -> None:
+    work_dir = output_path.parent / "segments"
+    work_dir.mkdir(exist_ok=True)
+    bounds = [duration * i / segments for i in range(segments + 1)]
+    seg_paths = [work_dir / f"seg_{i:03d}.mp4" for i in range(segments)]
+    done = [0.0] * segments
+    speeds = [0.0] * segments
+    lock = threading.Lock()
+
+    def _on_time(index: int, seconds: float, speed: Optional[float]) -> None:
+        # segments encode side by side, so the job advances at the sum of their speeds
+        with lock:
+            done[index] = min(seconds, bounds[index + 1] - bounds[index])
+            speeds[index] = speed or 0.0
+            encoded, total_speed = sum(done), sum(speeds)
+        _report_progress(job_id, 0.95 * encoded, duration, total_speed or None, ceiling=0.95)
+
+    # every segment uses identical encoder settings so the concat demuxer can stream-copy them
+    video_args = encoder_args(enc_profile, threads=max(1, (os.cpu_count() or 1) // segments))
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        futures = [
+            pool.submit(_render_segment, i, input_path, seg_paths[i], bounds[i], bounds[i + 1], fps, filter_complex, video_args, _on_time, job_process_started(job_id))
+            for i in range(segments)
+        ]
+        for fut in futures:
+            fut.result()
+
+    # Stitch video without re-encoding; audio is muxed once from the original input.
+    list_path = work_dir / "segments.txt"
+    list_path.write_text("".join(f"file '{p.as_posix()}'\n" for p in seg_paths), encoding="utf-8")
+    cmd = [
+        _FFMPEG_EXE,
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", str(list_path),
+        "-i", str(input_path),
+        "-map", "0:v",
+        "-map", "1:a",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-shortest",
+        str(output_path),
+    ]
+    proc = run_process_sync(cmd, on_start=job_process_started(job_id), tail_lines=10)
+    safe_rmtree(work_dir)
+    if proc["returncode"] != 0 or not output_path.exists():
+        raise RuntimeError(f"ffmpeg concat failed: {proc['stderr_tail']}")
+
+
+def _run_ffmpeg_async_with_visualizations(job_id: str, input_path: Path, output_path: Path, width: int, height: int, color: str, background: str, fps: int, visualization_types: str, visualization_colors: str, parallel_segments: int = 1, profile: str = DEFAULT_ENCODER_PROFILE):
     try:
         job_update(job_id, {"status": "running", "progress": 0.0})
 
+        enc_profile = get_encoder_profile(profile)
+        width, height, fps = profile_geometry(enc_profile, width, height, fps)
+        job_update(job_id, {"profile": enc_profile["name"], "render_size": f"{width}x{height}", "render_fps": fps})
+
         duration = probe_duration_seconds(_FFPROBE_EXE, input_path) or 0.0
-        vis_types = [v.strip() for v in visualization_types.split(',') if v.strip()]
-        vis_colors = [c.strip() for c in visualization_colors.split(',') if c.strip()]
-        
-        # Create color mapping
-        color_map = {}
-        for i, vis_type in enumerate(vis_types):
-            if i < len(vis_colors):
-                color_map[vis_type] = vis_colors[i]
-            else:
-                color_map[vis_type] = color  # fallback to default color
-
-        # Create filter complex based on selected visualizations - simplified single visualization approach
-        filter_parts = [f"color=c={background}:s={width}x{height}:r={fps}[bg]"]
-        
-        # For now, handle only the first selected visualization to avoid complexity
-        primary_vis = vis_types[0] if vis_types else 'line'
-        primary_color = color_map.get(primary_vis, color)
-        
-        if primary_vis == 'line':
-            # Use basic showwaves without mode option for maximum compatibility
-            filter_parts.append(f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:colors={primary_color}[vis]")
-        elif primary_vis == 'bars':
-            # Remove mode=bar option for better compatibility
-            filter_parts.append(f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:colors={primary_color}[vis]")
-        elif primary_vis == 'spectrum':
-            # Use basic showwaves without mode option for maximum compatibility
-            filter_parts.append(f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:colors={primary_color}[vis]")
-        else:
-            # Default to basic showwaves
-            filter_parts.append(f"[0:a]aformat=channel_layouts=mono,showwaves=s={width}x{height}:colors={primary_color}[vis]")
-        
-        # Simple overlay
-        filter_parts.append("[bg][vis]overlay=format=rgb[output]")
-        filter_complex = ";".join(filter_parts)
-        current_bg = "output"
+        # All layers share one decode (asplit) and one encode; each keeps its own color.
+        layers = resolve_layers(visualization_types, visualization_colors, color, ffmpeg_capabilities()["filters"])
+        filter_complex = build_visualization_filter(width, height, fps, background, layers)
+        current_bg = "vout"
+        job_update(job_id, {"layers": [name for name, _ in layers]})
+
+        segments = _auto_segment_count(duration) if parallel_segments <= 0 else parallel_segments
+        segments = min(segments, int(duration // _PARALLEL_MIN_SEGMENT_SECONDS)) if duration > 0 else 1
+        started = time.time()
+        if segments > 1:
+            job_update(job_id, {"segments": segments})
+            _run_parallel_render(job_id, input_path, output_path, duration, fps, filter_complex, segments, enc_profile)
+            elapsed = time.time() - started
+            observe_stage("encode", elapsed)
+            job_update(job_id, {
+                "status": "completed",
+                "progress": 1.0,
+                "encode_seconds": round(elapsed, 2),
+                "encode_fps": round(_encode_fps(int(round(duration * fps)), elapsed), 1),
+            })
+            return
 
         cmd = [
             _FFMPEG_EXE,
+            *PROGRESS_ARGS,
             "-y",
             "-i",
             str(input_path),
@@ -198,8 +334,7 @@ def _run_ffmpeg_async_with_visualizations(job_id: str, input_path: Path, output_
             filter_complex,
             "-map", f"[{current_bg}]",
             "-map", "0:a",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
+            *encoder_args(enc_profile),
             "-c:a", "aac",
             "-shortest",
             str(output_path),
@@ -209,36 +344,27 @@ def _run_ffmpeg_async_with_visualizations(job_id: str, input_path: Path, output_
         print(f"FFmpeg command: {' '.join(cmd)}")
         print(f"Filter complex: {filter_complex}")
 
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="ignore",
-        )
-        
-        stderr_output = []
-        if proc.stderr:
-            for line in proc.stderr:
-                stderr_output.append(line)
-                match = _TIME_RE.search(line)
-                if match and duration and duration > 0:
-                    hours = float(match.group(1))
-                    minutes = float(match.group(2))
-                    seconds = float(match.group(3))
-                    current = hours * 3600 + minutes * 60 + seconds
-                    progress = max(0.0, min(1.0, current / duration))
-                    job_update(job_id, {"progress": progress})
-        
-        proc.wait()
-
-        if proc.returncode == 0 and output_path.exists():
-            job_update(job_id, {"status": "completed", "progress": 1.0})
+        frames = [0]
+
+        def _on_progress(block: Dict[str, str]) -> None:
+            _track_frames(block, frames)
+            _report_progress(job_id, progress_seconds(block), duration, progress_speed(block))
+
+        proc = run_process_sync(cmd, on_progress=_on_progress, on_start=job_process_started(job_id), tail_lines=10)
+
+        if proc["returncode"] == 0 and output_path.exists():
+            elapsed = time.time() - started
+            observe_stage("encode", elapsed)
+            job_update(job_id, {
+                "status": "completed",
+                "progress": 1.0,
+                "encode_seconds": round(elapsed, 2),
+                "encode_fps": round(_encode_fps(frames[0] or int(round(duration * fps)), elapsed), 1),
+            })
         else:
             error_msg = "ffmpeg failed"
-            if stderr_output:
-                error_msg = f"ffmpeg failed: {''.join(stderr_output[-10:])}"  # Last 10 lines
+            if proc["stderr_tail"]:
+                error_msg = f"ffmpeg failed: {proc['stderr_tail']}"  # Last 10 lines
             job_update(job_id, {"status": "failed", "error": error_msg})
     except Exception as e:
         job_update(job_id, {"status": "failed", "error": str(e)})
@@ -246,7 +372,8 @@ def _run_ffmpeg_async_with_visualizations(job_id: str, input_path: Path, output_
 
 @router.post("/render/start")
 async def render_start(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    audio_id: Optional[str] = None,
     width: int = 1280,
     height: int = 720,
     color: str = "0x5ac8fa",
@@ -254,65 +381,151 @@ async def render_start(
     fps: int = 30,
     visualization_types: str = Query("line"),  # comma-separated list
     visualization_colors: str = Query(""),  # comma-separated colors for each visualization type
+    priority: int = 0,
+    parallel_segments: int = 1,  # 1 = single pass, 0 = auto (by length and cores), N = split into N segments
+    profile: str = DEFAULT_ENCODER_PROFILE,  # preview | balanced | archive
 ):
     if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
         raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다. ffmpeg 또는 imageio-ffmpeg를 설치하세요.")
+    if not has_encoder("libx264"):
+        raise HTTPException(status_code=500, detail="ffmpeg 빌드에 libx264 인코더가 없습니다. imageio-ffmpeg 번들 ffmpeg를 사용하세요.")
+    if profile.lower() not in ENCODER_PROFILES:
+        raise HTTPException(status_code=400, detail=f"unknown encoder profile: {profile}")
+    try:
+        audio = await acquire_audio_input(file, audio_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
 
-    tmp_dir = create_temp_dir("wave_job_")
-    input_path = tmp_dir / (Path(file.filename).name or "input")
+    try:
+        tmp_dir = create_temp_dir("wave_job_", heavy=True)
+    except WorkspaceFull:
+        upload_release(audio["audio_id"])
+        raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+    input_path = audio["path"]
     output_path = tmp_dir / "output.mp4"
 
-    with input_path.open("wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            f.write(chunk)
-
     import uuid
     job_id = str(uuid.uuid4())
+    params = {
+        "width": width,
+        "height": height,
+        "color": color,
+        "background": background,
+        "fps": fps,
+        "visualization_types": visualization_types,
+        "visualization_colors": visualization_colors,
+        "priority": priority,
+        "parallel_segments": parallel_segments,
+        "profile": profile.lower(),
+    }
     job_set(job_id, {
+        "type": "render",
         "status": "queued",
         "progress": 0.0,
         "tmp_dir": str(tmp_dir),
         "input_path": str(input_path),
+        "audio_id": audio["audio_id"],
         "output_path": str(output_path),
+        "params": params,
         "error": None,
     })
+    job_touch(job_id)
+
+    _submit_render_job(job_id, input_path, output_path, params)
+
+    return {"job_id": job_id, "audio_id": audio["audio_id"]}
 
-    thread = threading.Thread(
-        target=_run_ffmpeg_async_with_visualizations,
-        args=(job_id, input_path, output_path, width, height, color, background, fps, visualization_types, visualization_colors),
-        daemon=True,
+
+def _submit_render_job(job_id: str, input_path: Path, output_path: Path, params: Dict[str, Any]) -> None:
+    job_submit(
+        "render", job_id, _run_ffmpeg_async_with_visualizations,
+        job_id, input_path, output_path,
+        params["width"], params["height"], params["color"], params["background"], params["fps"],
+        params["visualization_types"], params["visualization_colors"], params.get("parallel_segments", 1),
+        params.get("profile", DEFAULT_ENCODER_PROFILE),
+        priority=params.get("priority", 0),
     )
-    thread.start()
 
-    return {"job_id": job_id}
 
+def _resume_render_job(job_id: str, job: Dict[str, Any]) -> None:
+    # leftover work directories are adopted as idle at startup: pin this one before the sweeper takes it
+    # (raising here makes job_recover fail the job and reclaim its files)
+    if not acquire_temp_dir(Path(job["tmp_dir"])):
+        raise RuntimeError("work directory no longer exists")
+    # upload references live in memory, so a re-queued job takes its reference again
+    if job.get("audio_id"):
+        upload_acquire(job["audio_id"])
+    job_touch(job_id)
+    _submit_render_job(job_id, Path(job["input_path"]), Path(job["output_path"]), job["params"])
 
-@router.get("/render/progress")
-def render_progress(job_id: str = Query(...)):
-    job = job_get(job_id)
-    if not job:
-        return JSONResponse({"error": "job not found"}, status_code=404)
+
+register_job_resumer("render", _resume_render_job)
+
+
+def _render_status(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    queue = job_queue_info(job_id)
     return {
         "status": job.get("status"),
         "progress": job.get("progress"),
         "error": job.get("error"),
+        "queue_position": queue["queue_position"],
+        "eta": queue["eta"],
+        "speed": job.get("speed"),
+        "profile": job.get("profile"),
+        "encode_fps": job.get("encode_fps"),
     }
 
 
+@router.get("/render/progress")
+def render_progress(job_id: str = Query(...)):
+    job = job_get(job_id)
+    if not job:
+        return JSONResponse({"error": "job not found"}, status_code=404)
+    job_touch(job_id)
+    return _render_status(job_id, job)
+
+
+@router.get("/render/events")
+def render_events(job_id: str = Query(...)):
+    """Server-Sent Events carrying the /render/progress payload each time it changes; closes once the job ends."""
+    job = job_get(job_id)
+    if not job or job.get("type") != "render":
+        return JSONResponse({"error": "job not found"}, status_code=404)
+    return StreamingResponse(
+        job_sse_stream(job_id, lambda current: _render_status(job_id, current)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete("/render/{job_id}")
+def render_cancel(job_id: str):
+    """Stop a queued/running render (ffmpeg processes are killed, files and the queue slot freed) or discard a finished one."""
+    job = job_get(job_id)
+    if not job or job.get("type") != "render":
+        raise HTTPException(status_code=404, detail="job not found")
+    previous = job_cancel(job_id)
+    was_active = previous is not None and previous.get("status") in ("queued", "running")
+    return {"job_id": job_id, "status": "cancelled" if was_active else "discarded", "previous_status": (previous or job).get("status")}
+
+
 @router.get("/render/result")
 def render_result(bg: BackgroundTasks, job_id: str = Query(...)):
     job = job_get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
     status = job.get("status")
-    output_path = Path(job.get("output_path"))
-    tmp_dir = Path(job.get("tmp_dir"))
-    input_path = Path(job.get("input_path"))
-
-    if status != "completed" or not output_path.exists():
+    # cancelled and evicted jobs have had their files reclaimed (tmp_dir/audio_id are None by now)
+    if status in ("cancelled", "failed"):
+        raise HTTPException(status_code=410, detail=f"job {status}: {job.get('error') or ''}".rstrip(": "))
+    output_path = Path(job["output_path"]) if job.get("output_path") else None
+    tmp_dir = Path(job["tmp_dir"]) if job.get("tmp_dir") else None
+    input_path = Path(job["input_path"]) if job.get("input_path") else None
+    audio_id = job.get("audio_id")
+
+    if status != "completed" or output_path is None or not output_path.exists():
         raise HTTPException(status_code=400, detail="job not completed")
 
     def _cleanup():
@@ -320,8 +533,12 @@ def render_result(bg: BackgroundTasks, job_id: str = Query(...)):
             from services.jobs import job_pop
             job_pop(job_id)
             safe_unlink(output_path)
-            safe_unlink(input_path)
-            safe_rmtree(tmp_dir)
+            if audio_id:
+                upload_release(audio_id)
+            elif input_path is not None:
+                safe_unlink(input_path)
+            if tmp_dir is not None:
+                safe_rmtree(tmp_dir)
         except Exception:
             pass
 
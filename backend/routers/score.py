@@ -1,17 +1,34 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path
 import subprocess
 import tempfile
+import threading
 import shutil
 import time
 import datetime
-import math
 import os
 import zipfile
-from typing import Optional
+import asyncio
+import uuid
+from contextlib import contextmanager, nullcontext
+from itertools import accumulate
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from services.files import create_temp_dir, safe_rmtree
+from services.ffmpeg import run_process_sync
+from services.files import acquire_temp_dir, create_temp_dir, safe_rmtree, safe_unlink
+from services.jobs import (
+	job_add_cancel_hook, job_append_log, job_cancel, job_cpu_budget, job_get, job_pop, job_queue_info, job_raise_if_cancelled,
+	job_set, job_sse_stream, job_submit, job_touch, job_update, register_job_resumer,
+)
+from services.metrics import stage_timer
+from services.musicxml import music21_available, music21_musicxml, write_musicxml
+from services.notes import segment_notes
+from services.pitch import DEFAULT_PITCH_ENGINE, pitch_engine_available, pitch_engines, track_pitch
+from services.separation import separate_file, terminate_separation_worker
+from services.stem_cache import sha256_file, stem_cache_key, stem_cache_fetch
+from services.uploads import UploadNotFound, acquire_audio_input, upload_acquire, upload_release
+from services.workspace import WorkspaceFull
 
 router = APIRouter()
 
@@ -22,116 +39,131 @@ except Exception:
 	_DEMUCS_AVAILABLE = False
 
 
-def _hz_to_midi(hz: float) -> Optional[int]:
-	try:
-		if hz <= 0 or not math.isfinite(hz):
-			return None
-		return int(round(69 + 12 * math.log2(hz / 440.0)))
-	except Exception:
-		return None
+# Pipeline stages and their share of the progress bar. Demucs dominates (its own progress is forwarded)
+# unless the stem cache hits; pyin is the next biggest.
+_SCORE_STAGES = (
+	("separate", 0.45),
+	("decode", 0.05),
+	("pitch", 0.30),
+	("notes", 0.02),
+	("midi", 0.01),
+	("musicxml", 0.05),
+	("pdf", 0.10),
+	("zip", 0.02),
+)
+_BOUNDS = list(accumulate([0.0] + [share for _, share in _SCORE_STAGES]))
+_STAGE_SPANS: Dict[str, Tuple[float, float]] = {
+	name: (round(lo, 3), round(hi, 3)) for (name, _), lo, hi in zip(_SCORE_STAGES, _BOUNDS, _BOUNDS[1:])
+}
+# Stages that can be re-run on a finished job from the artifacts kept in its workspace.
+RETRYABLE_SCORE_STAGES = ("pdf",)
+# native: services/musicxml.py writes straight from the note events; music21: re-parse the MIDI (optional)
+MUSICXML_ENGINES = ("native", "music21")
+# MIDI and MusicXML share this tempo, so note event seconds map onto the same beat grid in both
+_SCORE_TEMPO_BPM = 120
 
 
-@router.post("/audio/generate-score")
-async def generate_score(
-	file: UploadFile = File(...),
-	model: str = "demucs:4stems",
-	min_note_ms: int = 120,
-	voicing_thresh: float = 0.6,
-):
-	"""
-	보컬 기준 악보 생성: Demucs로 보컬 추출 → f0 추정(librosa.pyin) → MIDI + MusicXML 생성하여 ZIP 반환
-	"""
-	if not _DEMUCS_AVAILABLE:
-		raise HTTPException(status_code=500, detail="Demucs가 설치되지 않았습니다.")
+def _set_stage(job_id: str, stage: str, entry: Dict[str, Any], **updates: Any) -> None:
+	stages = dict((job_get(job_id) or {}).get("stages") or {})
+	stages[stage] = entry
+	job_update(job_id, dict(updates, stage=stage, stages=stages))
 
-	# temp workspace
-	tmp_dir = create_temp_dir("score_")
-	input_path = tmp_dir / (Path(file.filename).name or "input")
-	stems_dir = tmp_dir / "stems"
-	stems_dir.mkdir(exist_ok=True)
 
+def _stage_progress(job_id: Optional[str], stage: str, fraction: float) -> None:
+	if job_id:
+		lo, hi = _STAGE_SPANS[stage]
+		job_update(job_id, {"progress": round(lo + (hi - lo) * max(0.0, min(1.0, fraction)), 3)})
+
+
+@contextmanager
+def _score_stage(job_id: Optional[str], stage: str, metric: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+	"""Run one pipeline stage. For a job, moves progress into the stage's span and records status and
+	wall time under job["stages"]; the caller may set the yielded outcome's status to "skipped" or
+	"failed" (with an error) for a stage that ended without raising."""
+	outcome: Dict[str, Any] = {"status": "done"}
+	if job_id:
+		job_raise_if_cancelled(job_id)
+		_set_stage(job_id, stage, {"status": "running"}, progress=_STAGE_SPANS[stage][0])
+	started = time.perf_counter()
 	try:
-		start_ts = time.time()
-		def tlog(msg: str):
-			print(f"[score {datetime.datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
-
-		tlog("received request: saving upload…")
-		# save upload
-		with input_path.open("wb") as f:
-			while True:
-				chunk = await file.read(1024 * 1024)
-				if not chunk:
-					break
-				f.write(chunk)
-
-		# run demucs to extract vocals only (faster: specify two-stem? demucs doesn't support 2-stem default, so extract all and take vocals)
-		from demucs import separate as demucs_separate
-		demucs_model = "htdemucs" if "4stems" in model else "htdemucs_ft"
-		tlog(f"running Demucs (-n {demucs_model})…")
-		cmd = [
-			"python", "-m", "demucs.separate",
-			"-n", demucs_model,
-			"-d", "cpu",
-			"-o", str(stems_dir),
-			str(input_path),
-		]
-		proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="ignore")
-		if proc.returncode != 0:
-			tail = (proc.stderr or "")[-2000:]
-			tlog("Demucs failed:\n" + tail)
+		with stage_timer(metric) if metric else nullcontext():
+			yield outcome
+	except BaseException as e:
+		if job_id:
+			error = getattr(e, "detail", None) or str(e) or type(e).__name__
+			_set_stage(job_id, stage, {"status": "failed", "seconds": round(time.perf_counter() - started, 2), "error": error}, failed_stage=stage)
+		raise
+	if job_id:
+		_set_stage(job_id, stage, dict(outcome, seconds=round(time.perf_counter() - started, 2)), progress=_STAGE_SPANS[stage][1])
+
+
+def _score_pipeline(tmp_dir: Path, input_path: Path, model: str, min_note_ms: int, voicing_thresh: float, start_ts: float, tlog: Callable[[str], None], audio_id: Optional[str] = None, source_name: Optional[str] = None, pitch_engine: str = DEFAULT_PITCH_ENGINE, job_id: Optional[str] = None, musicxml_engine: str = "native") -> Path:
+	"""Demucs vocals → f0 (pitch_engine) → MIDI/MusicXML/PDF; returns the ZIP path inside tmp_dir.
+	With job_id, per-stage progress and timings go to the job and the artifacts stay in tmp_dir."""
+	source_name = source_name or Path(input_path).name
+	# run demucs to extract vocals only (demucs has no 2-stem default, so all stems are cached and vocals taken)
+	demucs_model = "htdemucs" if "4stems" in model else "htdemucs_ft"
+	cache_key = stem_cache_key(audio_id or sha256_file(input_path), demucs_model)
+
+	def _on_worker(pid: int) -> None:
+		# cancelling the job kills the Demucs worker running it
+		job_add_cancel_hook(job_id, lambda: terminate_separation_worker(pid))
+
+	def _separate(work_dir: Path) -> None:
+		tlog(f"running Demucs ({demucs_model})…")
+		try:
+			separate_file(
+				input_path, demucs_model, work_dir,
+				progress=lambda fraction: _stage_progress(job_id, "separate", fraction),
+				on_start=_on_worker if job_id else None,
+			)
+		except Exception as e:
+			tlog(f"Demucs failed: {e}")
 			raise HTTPException(status_code=500, detail="Demucs 실행 실패")
 
-		# find vocals wav
-		vocals_path = None
-		for p in stems_dir.rglob("*.wav"):
-			if p.stem.lower() == "vocals":
-				vocals_path = p
-				break
-		if not vocals_path:
-			tlog("no vocals.wav found in Demucs output")
-			raise HTTPException(status_code=500, detail="보컬 파일을 찾지 못했습니다.")
-		tlog(f"found vocals: {vocals_path.name}")
-
-		# f0 estimation with librosa.pyin
-		import librosa
-		import numpy as np
-		tlog("loading vocals and estimating f0 (pyin)…")
+	with _score_stage(job_id, "separate") as outcome:
+		stems, cache_hit = stem_cache_fetch(cache_key, _separate, tmp_dir / "stems")
+		outcome["cache_hit"] = cache_hit
+	if cache_hit:
+		tlog(f"stem cache hit ({demucs_model}); Demucs skipped")
+
+	vocals_path = stems.get("vocals")
+	if not vocals_path:
+		tlog("no vocals.wav found in Demucs output")
+		raise HTTPException(status_code=500, detail="보컬 파일을 찾지 못했습니다.")
+	tlog(f"found vocals: {vocals_path.name}")
+
+	# f0 estimation (pyin by default; see services/pitch.py for the faster engines)
+	import librosa
+	tlog(f"loading vocals and estimating f0 ({pitch_engine})…")
+	with _score_stage(job_id, "decode", "decode"):
 		y, sr = librosa.load(str(vocals_path), sr=22050, mono=True)
-		frame_length = 2048
-		hop_length = 256
-		f0, voiced_flag, _ = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr, frame_length=frame_length, hop_length=hop_length)
-		times = librosa.times_like(f0, sr=sr, hop_length=hop_length)
-
-		# Build note events from f0 sequence
-		min_frames = max(1, int((min_note_ms / 1000.0) * sr / hop_length))
-		events = []  # (start_time, end_time, midi_note)
-		cur_note = None
-		cur_start = 0.0
-		last_idx = 0
-		for idx, (hz, voiced) in enumerate(zip(f0, voiced_flag)):
-			midi = _hz_to_midi(hz if voiced else 0.0)
-			if cur_note is None:
-				cur_note = midi
-				cur_start = float(times[idx])
-				last_idx = idx
-				continue
-			# change detection
-			if midi != cur_note:
-				length_frames = idx - last_idx
-				if cur_note is not None and length_frames >= min_frames:
-					events.append((cur_start, float(times[idx]), int(cur_note)))
-				cur_note = midi
-				cur_start = float(times[idx])
-				last_idx = idx
-		# flush
-		if cur_note is not None and (len(times) - 1 - last_idx) >= min_frames:
-			events.append((cur_start, float(times[-1]), int(cur_note)))
-
-		# Create MIDI using mido
+	frame_length = 2048
+	hop_length = 256
+	with _score_stage(job_id, "pitch", pitch_engine) as outcome:
+		# chunked across this job's share of the cores (see job_cpu_budget); cancelling the job drops the
+		# chunks it still has queued in the shared pyin pool
+		cancel = threading.Event()
+		if job_id:
+			job_add_cancel_hook(job_id, cancel.set)
+		f0, voiced_prob, _ = track_pitch(
+			y, sr, engine=pitch_engine, hop_length=hop_length, frame_length=frame_length,
+			workers=job_cpu_budget(job_id), cancel=cancel,
+		)
+		outcome["engine"] = pitch_engine
+
+	# Build note events from the f0 track (frames below voicing_thresh are rests)
+	with _score_stage(job_id, "notes") as outcome:
+		events = segment_notes(f0, voiced_prob, hop_length / sr, voicing_thresh=voicing_thresh, min_note_ms=min_note_ms)
+		outcome["notes"] = len(events)
+	tlog(f"segmented {len(events)} notes from {len(f0)} f0 frames")
+
+	# Create MIDI using mido
+	with _score_stage(job_id, "midi"):
 		from mido import Message, MidiFile, MidiTrack, bpm2tempo
 		midi = MidiFile()
 		track = MidiTrack(); midi.tracks.append(track)
-		tempo = bpm2tempo(120)
+		tempo = bpm2tempo(_SCORE_TEMPO_BPM)
 		track.append(Message('program_change', program=0, time=0))
 		# time mapping
 		ticks_per_beat = midi.ticks_per_beat
@@ -146,248 +178,344 @@ async def generate_score(
 			current_tick = start_ticks + dur_ticks
 		midi_path = tmp_dir / "vocal_melody.mid"
 		midi.save(str(midi_path))
-		tlog(f"MIDI written: {midi_path.name}")
+	tlog(f"MIDI written: {midi_path.name}")
 
-		# Convert MIDI to MusicXML via music21 (optional)
-		musicxml_path = None
-		try:
-			from music21 import converter  # type: ignore
-			s = converter.parse(str(midi_path))
-			musicxml_path = tmp_dir / "vocal_melody.musicxml"
-			s.write('musicxml', fp=str(musicxml_path))
-			tlog(f"MusicXML written: {musicxml_path.name}")
-		except Exception as _:
-			tlog("music21 not available; skipping MusicXML generation.")
-
-		# Try to render PDF from MusicXML using MuseScore or Verovio/CairoSVG if MusicXML exists
-		pdf_path = tmp_dir / "vocal_melody.pdf"
+	# MusicXML straight from the note events; music21's MIDI re-parse only when asked for
+	musicxml_path = tmp_dir / "vocal_melody.musicxml"
+	with _score_stage(job_id, "musicxml") as outcome:
+		outcome["engine"] = "native"
+		if musicxml_engine == "music21":
+			try:
+				music21_musicxml(midi_path, musicxml_path)
+				outcome["engine"] = "music21"
+			except Exception as e:
+				tlog(f"music21 MusicXML export failed ({e}); writing it directly instead.")
+		if outcome["engine"] == "native":
+			write_musicxml(events, musicxml_path, tempo_bpm=_SCORE_TEMPO_BPM, title=Path(source_name).stem or "Vocal Melody")
+		tlog(f"MusicXML written ({outcome['engine']}): {musicxml_path.name}")
+	if job_id:
+		# kept in tmp_dir until the result is fetched, so a failed PDF stage can be re-run alone
+		job_update(job_id, {"artifacts": {"midi": str(midi_path), "musicxml": str(musicxml_path), "pdf": None}})
+
+	pdf_path = _pdf_stage(job_id, tmp_dir, midi_path, musicxml_path, source_name, tlog)
+	zip_path = _zip_stage(job_id, tmp_dir, midi_path, musicxml_path, pdf_path)
+	total = time.time() - start_ts
+	mins = int(total // 60); secs = int(total % 60)
+	tlog(f"score done in {mins}m {secs}s ({total:.1f}s)")
+	return zip_path
+
+
+def _pdf_stage(job_id: Optional[str], tmp_dir: Path, midi_path: Path, musicxml_path: Optional[Path], source_name: str, tlog: Callable[[str], None]) -> Optional[Path]:
+	with _score_stage(job_id, "pdf") as outcome:
+		if not musicxml_path or not Path(musicxml_path).exists():
+			outcome.update(status="skipped", error="no MusicXML to render")
+			return None
+		pdf_path = _render_pdf(tmp_dir, Path(musicxml_path), midi_path, source_name, tlog)
+		if pdf_path is None:
+			outcome.update(status="failed", error="PDF generation failed with all methods")
+	if job_id:
+		artifacts = dict((job_get(job_id) or {}).get("artifacts") or {})
+		artifacts["pdf"] = str(pdf_path) if pdf_path else None
+		job_update(job_id, {"artifacts": artifacts})
+	return pdf_path
+
+
+def _zip_stage(job_id: Optional[str], tmp_dir: Path, midi_path: Path, musicxml_path: Optional[Path], pdf_path: Optional[Path]) -> Path:
+	zip_path = tmp_dir / "vocal_score.zip"
+	with _score_stage(job_id, "zip", "zip"), zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+		zipf.write(midi_path, midi_path.name)
 		if musicxml_path and Path(musicxml_path).exists():
-			tlog("attempting PDF generation from MusicXML...")
-			
-			# Try MuseScore first
-			musescore_candidates = [
-				shutil.which("MuseScore4.exe"),
-				shutil.which("MuseScore3.exe"), 
-				shutil.which("MuseScore.exe"),
-				shutil.which("musescore4"),
-				shutil.which("musescore3"),
-				shutil.which("musescore"),
-				shutil.which("mscore"),
-			# Additional Windows paths
-			r"C:\Program Files\MuseScore 4\bin\MuseScore4.exe",
-			r"C:\Program Files\MuseScore 3\bin\MuseScore3.exe",
-			r"C:\Program Files (x86)\MuseScore 4\bin\MuseScore4.exe",
-			r"C:\Program Files (x86)\MuseScore 3\bin\MuseScore3.exe",
-			# Portable MuseScore locations
-			str(Path.cwd() / "MuseScore4" / "MuseScore4.exe"),
-			str(Path.cwd() / "MuseScore3" / "MuseScore3.exe"),
-			]
-			
-			musescore_exe = None
-			for candidate in musescore_candidates:
-				if candidate and Path(candidate).exists():
-					musescore_exe = candidate
-					break
-			
-			if musescore_exe:
-				try:
-					tlog(f"trying MuseScore at: {musescore_exe}")
-					# MuseScore CLI: musescore -o out.pdf in.musicxml
-					cmd_pdf = [musescore_exe, "-o", str(pdf_path), str(musicxml_path)]
-					# Run MuseScore in headless/offscreen mode where possible to avoid GUI issues
-					env = os.environ.copy()
-					env.setdefault("QT_QPA_PLATFORM", "offscreen")
-					proc_pdf = subprocess.run(
-						cmd_pdf, 
-						stdout=subprocess.PIPE, 
-						stderr=subprocess.PIPE, 
-						text=True, 
-						encoding="utf-8", 
-						errors="ignore",
-						timeout=60,  # 60 second timeout
-						cwd=str(tmp_dir),
-						env=env,
-					)
-					if proc_pdf.returncode == 0 and pdf_path.exists():
-						tlog(f"PDF rendered with MuseScore: {pdf_path.name}")
-					else:
-						tlog(f"MuseScore failed (code {proc_pdf.returncode}): {proc_pdf.stderr}")
-						tlog("trying fallback methods...")
-				except subprocess.TimeoutExpired:
-					tlog("MuseScore timed out, trying fallback...")
-				except Exception as e:
-					tlog(f"MuseScore error: {e}, trying fallback...")
-			else:
-				tlog("MuseScore not found, trying fallback methods...")
-			
-			# Fallback: Verovio (MusicXML->SVG) + CairoSVG (SVG->PDF)
-			if not pdf_path.exists():
-				try:
-					tlog("trying Verovio + CairoSVG...")
-					from verovio import toolkit as vr_toolkit  # type: ignore
-					import cairosvg  # type: ignore
-					
-					# Configure Verovio (A4-ish page, auto height, reasonable scale)
-					tk = vr_toolkit.Toolkit()
-					tk.setOptions({
-						"pageHeight": 2970,   # ~ A4 at 10 units/mm
-						"pageWidth": 2100,
-						"adjustPageHeight": True,
-						"scale": 50,
-						"header": "none",
-						"footer": "none"
-					})
-					
-					ok = tk.loadFile(str(musicxml_path))
-					if not ok:
-						raise RuntimeError("Verovio failed to load MusicXML")
-					
-					svg = tk.renderToSVG(1)
-					if not svg:
-						raise RuntimeError("Verovio failed to render SVG")
-					
-					# Convert SVG(s) to a multi-page PDF when needed
-					try:
-						page_count = getattr(tk, 'getPageCount', lambda: 1)()
-					except Exception:
-						page_count = 1
-
-					if page_count <= 1:
-						# Single page direct convert
-						cairosvg.svg2pdf(bytestring=svg.encode('utf-8'), write_to=str(pdf_path))
-					else:
-						# Multi-page: render each SVG page to PNG then compose a PDF with reportlab
-						from io import BytesIO
-						from reportlab.pdfgen import canvas as rl_canvas  # type: ignore
-						from reportlab.lib.pagesizes import A4  # type: ignore
-						from reportlab.lib.utils import ImageReader  # type: ignore
-						pdf_buf = BytesIO()
-						c = rl_canvas.Canvas(str(pdf_path), pagesize=A4)
-						page_w, page_h = A4
-						margin = 36  # 0.5 inch margins
-						max_w = page_w - margin * 2
-						max_h = page_h - margin * 2
-						for p in range(1, page_count + 1):
-							svg_p = tk.renderToSVG(p)
-							png_bytes = cairosvg.svg2png(bytestring=svg_p.encode('utf-8'))
-							img = ImageReader(BytesIO(png_bytes))
-							# Get image size
-							img_w, img_h = img.getSize()
-							# Fit to page respecting aspect
-							scale = min(max_w / img_w, max_h / img_h)
-							draw_w = img_w * scale
-							draw_h = img_h * scale
-							x = (page_w - draw_w) / 2
-							y = (page_h - draw_h) / 2
-							c.drawImage(img, x, y, width=draw_w, height=draw_h)
-							if p < page_count:
-								c.showPage()
-						c.save()
+			zipf.write(musicxml_path, Path(musicxml_path).name)
+		if pdf_path and pdf_path.exists():
+			zipf.write(pdf_path, pdf_path.name)
+	return zip_path
 
-					if pdf_path.exists():
-						tlog(f"PDF rendered with Verovio/CairoSVG: {pdf_path.name} (pages={page_count})")
-					else:
-						raise RuntimeError("PDF file not created")
-						
-				except ImportError as e:
-					tlog(f"Verovio/CairoSVG not available: {e}")
-					tlog("install with: pip install verovio cairosvg")
-				except Exception as e:
-					tlog(f"Verovio/CairoSVG failed: {e}")
-			
-			# Final fallback: Simple HTML-based PDF using weasyprint or reportlab
-			if not pdf_path.exists():
+
+def _render_pdf(tmp_dir: Path, musicxml_path: Path, midi_path: Path, source_name: str, tlog: Callable[[str], None]) -> Optional[Path]:
+	"""MusicXML → PDF via MuseScore, then Verovio/CairoSVG, then an HTML/reportlab placeholder. None when
+	every method failed."""
+	pdf_path = tmp_dir / "vocal_melody.pdf"
+	# a retry must not mistake the previous attempt's output for its own
+	safe_unlink(pdf_path)
+	if musicxml_path and Path(musicxml_path).exists():
+		tlog("attempting PDF generation from MusicXML...")
+		
+		# Try MuseScore first
+		musescore_candidates = [
+			shutil.which("MuseScore4.exe"),
+			shutil.which("MuseScore3.exe"), 
+			shutil.which("MuseScore.exe"),
+			shutil.which("musescore4"),
+			shutil.which("musescore3"),
+			shutil.which("musescore"),
+			shutil.which("mscore"),
+		# Additional Windows paths
+		r"C:\Program Files\MuseScore 4\bin\MuseScore4.exe",
+		r"C:\Program Files\MuseScore 3\bin\MuseScore3.exe",
+		r"C:\Program Files (x86)\MuseScore 4\bin\MuseScore4.exe",
+		r"C:\Program Files (x86)\MuseScore 3\bin\MuseScore3.exe",
+		# Portable MuseScore locations
+		str(Path.cwd() / "MuseScore4" / "MuseScore4.exe"),
+		str(Path.cwd() / "MuseScore3" / "MuseScore3.exe"),
+		]
+		
+		musescore_exe = None
+		for candidate in musescore_candidates:
+			if candidate and Path(candidate).exists():
+				musescore_exe = candidate
+				break
+		
+		if musescore_exe:
+			try:
+				tlog(f"trying MuseScore at: {musescore_exe}")
+				# MuseScore CLI: musescore -o out.pdf in.musicxml
+				cmd_pdf = [musescore_exe, "-o", str(pdf_path), str(musicxml_path)]
+				# Run MuseScore in headless/offscreen mode where possible to avoid GUI issues
+				env = os.environ.copy()
+				env.setdefault("QT_QPA_PLATFORM", "offscreen")
+				# own process group: a timeout also takes down MuseScore's helper processes
+				proc_pdf = run_process_sync(
+					cmd_pdf,
+					timeout=60,  # 60 second timeout
+					cwd=tmp_dir,
+					env=env,
+				)
+				if proc_pdf["returncode"] == 0 and pdf_path.exists():
+					tlog(f"PDF rendered with MuseScore: {pdf_path.name}")
+				else:
+					tlog(f"MuseScore failed (code {proc_pdf['returncode']}): {proc_pdf['stderr_tail']}")
+					tlog("trying fallback methods...")
+			except subprocess.TimeoutExpired:
+				tlog("MuseScore timed out, trying fallback...")
+			except Exception as e:
+				tlog(f"MuseScore error: {e}, trying fallback...")
+		else:
+			tlog("MuseScore not found, trying fallback methods...")
+		
+		# Fallback: Verovio (MusicXML->SVG) + CairoSVG (SVG->PDF)
+		if not pdf_path.exists():
+			try:
+				tlog("trying Verovio + CairoSVG...")
+				from verovio import toolkit as vr_toolkit  # type: ignore
+				import cairosvg  # type: ignore
+				
+				# Configure Verovio (A4-ish page, auto height, reasonable scale)
+				tk = vr_toolkit.Toolkit()
+				tk.setOptions({
+					"pageHeight": 2970,   # ~ A4 at 10 units/mm
+					"pageWidth": 2100,
+					"adjustPageHeight": True,
+					"scale": 50,
+					"header": "none",
+					"footer": "none"
+				})
+				
+				ok = tk.loadFile(str(musicxml_path))
+				if not ok:
+					raise RuntimeError("Verovio failed to load MusicXML")
+				
+				svg = tk.renderToSVG(1)
+				if not svg:
+					raise RuntimeError("Verovio failed to render SVG")
+				
+				# Convert SVG(s) to a multi-page PDF when needed
 				try:
-					tlog("trying simple HTML-to-PDF conversion...")
+					page_count = getattr(tk, 'getPageCount', lambda: 1)()
+				except Exception:
+					page_count = 1
+
+				if page_count <= 1:
+					# Single page direct convert
+					cairosvg.svg2pdf(bytestring=svg.encode('utf-8'), write_to=str(pdf_path))
+				else:
+					# Multi-page: render each SVG page to PNG then compose a PDF with reportlab
+					from io import BytesIO
+					from reportlab.pdfgen import canvas as rl_canvas  # type: ignore
+					from reportlab.lib.pagesizes import A4  # type: ignore
+					from reportlab.lib.utils import ImageReader  # type: ignore
+					pdf_buf = BytesIO()
+					c = rl_canvas.Canvas(str(pdf_path), pagesize=A4)
+					page_w, page_h = A4
+					margin = 36  # 0.5 inch margins
+					max_w = page_w - margin * 2
+					max_h = page_h - margin * 2
+					for p in range(1, page_count + 1):
+						svg_p = tk.renderToSVG(p)
+						png_bytes = cairosvg.svg2png(bytestring=svg_p.encode('utf-8'))
+						img = ImageReader(BytesIO(png_bytes))
+						# Get image size
+						img_w, img_h = img.getSize()
+						# Fit to page respecting aspect
+						scale = min(max_w / img_w, max_h / img_h)
+						draw_w = img_w * scale
+						draw_h = img_h * scale
+						x = (page_w - draw_w) / 2
+						y = (page_h - draw_h) / 2
+						c.drawImage(img, x, y, width=draw_w, height=draw_h)
+						if p < page_count:
+							c.showPage()
+					c.save()
+
+				if pdf_path.exists():
+					tlog(f"PDF rendered with Verovio/CairoSVG: {pdf_path.name} (pages={page_count})")
+				else:
+					raise RuntimeError("PDF file not created")
 					
-					# Create a simple HTML representation of the MIDI data
-					html_content = f"""
-					<!DOCTYPE html>
-					<html>
-					<head>
-						<title>Vocal Score</title>
-						<style>
-							body {{ font-family: Arial, sans-serif; margin: 20px; }}
-							.note {{ display: inline-block; margin: 2px; padding: 4px; border: 1px solid #ccc; }}
-							.measure {{ margin: 10px 0; }}
-						</style>
-					</head>
-					<body>
-						<h1>Vocal Score</h1>
-						<p>Generated from: {Path(input_path).name}</p>
-						<p>MIDI file: {midi_path.name}</p>
-						{f'<p>MusicXML file: {Path(musicxml_path).name}</p>' if musicxml_path else ''}
-						<p>This is a simplified representation. Please use the MIDI or MusicXML files with music notation software for full score display.</p>
-						
-						<div class="notes">
-							<p><strong>Note:</strong> Install MuseScore for better PDF generation:</p>
-							<ul>
-								<li>Download from <a href="https://musescore.org">https://musescore.org</a></li>
-								<li>Or install Verovio/CairoSVG: <code>pip install verovio cairosvg</code></li>
-							</ul>
-						</div>
-					</body>
-					</html>
-					"""
+			except ImportError as e:
+				tlog(f"Verovio/CairoSVG not available: {e}")
+				tlog("install with: pip install verovio cairosvg")
+			except Exception as e:
+				tlog(f"Verovio/CairoSVG failed: {e}")
+		
+		# Final fallback: Simple HTML-based PDF using weasyprint or reportlab
+		if not pdf_path.exists():
+			try:
+				tlog("trying simple HTML-to-PDF conversion...")
+				
+				# Create a simple HTML representation of the MIDI data
+				html_content = f"""
+				<!DOCTYPE html>
+				<html>
+				<head>
+					<title>Vocal Score</title>
+					<style>
+						body {{ font-family: Arial, sans-serif; margin: 20px; }}
+						.note {{ display: inline-block; margin: 2px; padding: 4px; border: 1px solid #ccc; }}
+						.measure {{ margin: 10px 0; }}
+					</style>
+				</head>
+				<body>
+					<h1>Vocal Score</h1>
+					<p>Generated from: {source_name}</p>
+					<p>MIDI file: {midi_path.name}</p>
+					{f'<p>MusicXML file: {Path(musicxml_path).name}</p>' if musicxml_path else ''}
+					<p>This is a simplified representation. Please use the MIDI or MusicXML files with music notation software for full score display.</p>
 					
-					# Try weasyprint first
+					<div class="notes">
+						<p><strong>Note:</strong> Install MuseScore for better PDF generation:</p>
+						<ul>
+							<li>Download from <a href="https://musescore.org">https://musescore.org</a></li>
+							<li>Or install Verovio/CairoSVG: <code>pip install verovio cairosvg</code></li>
+						</ul>
+					</div>
+				</body>
+				</html>
+				"""
+				
+				# Try weasyprint first
+				try:
+					import weasyprint  # type: ignore
+					weasyprint.HTML(string=html_content).write_pdf(str(pdf_path))
+					if pdf_path.exists():
+						tlog(f"PDF created with weasyprint: {pdf_path.name}")
+				except ImportError:
+					# Fallback to wkhtmltopdf if available
 					try:
-						import weasyprint  # type: ignore
-						weasyprint.HTML(string=html_content).write_pdf(str(pdf_path))
+						import pdfkit  # type: ignore
+						pdfkit.from_string(html_content, str(pdf_path))
 						if pdf_path.exists():
-							tlog(f"PDF created with weasyprint: {pdf_path.name}")
+							tlog(f"PDF created with wkhtmltopdf: {pdf_path.name}")
 					except ImportError:
-						# Fallback to wkhtmltopdf if available
+						# Last resort: create a text-based PDF with reportlab
 						try:
-							import pdfkit  # type: ignore
-							pdfkit.from_string(html_content, str(pdf_path))
+							from reportlab.pdfgen import canvas  # type: ignore
+							from reportlab.lib.pagesizes import letter  # type: ignore
+							
+							c = canvas.Canvas(str(pdf_path), pagesize=letter)
+							width, height = letter
+							
+							c.drawString(50, height - 50, f"Vocal Score - {source_name}")
+							c.drawString(50, height - 80, f"Generated MIDI: {midi_path.name}")
+							if musicxml_path:
+								c.drawString(50, height - 110, f"Generated MusicXML: {Path(musicxml_path).name}")
+							
+							c.drawString(50, height - 150, "This is a placeholder PDF.")
+							c.drawString(50, height - 180, "Please use the MIDI or MusicXML files with music notation software.")
+							c.drawString(50, height - 210, "For better PDF generation, install MuseScore from https://musescore.org")
+							
+							c.save()
 							if pdf_path.exists():
-								tlog(f"PDF created with wkhtmltopdf: {pdf_path.name}")
+								tlog(f"Basic PDF created with reportlab: {pdf_path.name}")
 						except ImportError:
-							# Last resort: create a text-based PDF with reportlab
-							try:
-								from reportlab.pdfgen import canvas  # type: ignore
-								from reportlab.lib.pagesizes import letter  # type: ignore
-								
-								c = canvas.Canvas(str(pdf_path), pagesize=letter)
-								width, height = letter
-								
-								c.drawString(50, height - 50, f"Vocal Score - {Path(input_path).name}")
-								c.drawString(50, height - 80, f"Generated MIDI: {midi_path.name}")
-								if musicxml_path:
-									c.drawString(50, height - 110, f"Generated MusicXML: {Path(musicxml_path).name}")
-								
-								c.drawString(50, height - 150, "This is a placeholder PDF.")
-								c.drawString(50, height - 180, "Please use the MIDI or MusicXML files with music notation software.")
-								c.drawString(50, height - 210, "For better PDF generation, install MuseScore from https://musescore.org")
-								
-								c.save()
-								if pdf_path.exists():
-									tlog(f"Basic PDF created with reportlab: {pdf_path.name}")
-							except ImportError:
-								tlog("No PDF generation libraries available. Install: pip install reportlab weasyprint")
-								
-				except Exception as e:
-					tlog(f"Simple PDF generation failed: {e}")
-		
-		if not pdf_path.exists():
-			tlog("PDF generation failed with all methods. ZIP will contain MIDI and MusicXML only.")
-		else:
-			tlog(f"PDF successfully generated: {pdf_path.stat().st_size} bytes")
-
-		# Zip
-		zip_path = tmp_dir / "vocal_score.zip"
-		with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-			zipf.write(midi_path, midi_path.name)
-			if musicxml_path and Path(musicxml_path).exists():
-				zipf.write(musicxml_path, Path(musicxml_path).name)
-			if pdf_path.exists():
-				zipf.write(pdf_path, pdf_path.name)
-		total = time.time() - start_ts
-		mins = int(total // 60); secs = int(total % 60)
-		tlog(f"score done in {mins}m {secs}s ({total:.1f}s)")
-
-		return FileResponse(path=str(zip_path), filename=f"{Path(input_path).stem}_vocal_score.zip", media_type="application/zip")
+							tlog("No PDF generation libraries available. Install: pip install reportlab weasyprint")
+							
+			except Exception as e:
+				tlog(f"Simple PDF generation failed: {e}")
+	
+	if not pdf_path.exists():
+		tlog("PDF generation failed with all methods. ZIP will contain MIDI and MusicXML only.")
+		return None
+	tlog(f"PDF successfully generated: {pdf_path.stat().st_size} bytes")
+	return pdf_path
+
+
+def _check_score_request(pitch_engine: str, musicxml_engine: str = "native") -> None:
+	if not _DEMUCS_AVAILABLE:
+		raise HTTPException(status_code=500, detail="Demucs가 설치되지 않았습니다.")
+	if pitch_engine not in {engine["id"] for engine in pitch_engines()}:
+		raise HTTPException(status_code=400, detail=f"알 수 없는 pitch_engine입니다: {pitch_engine}")
+	if not pitch_engine_available(pitch_engine):
+		raise HTTPException(status_code=400, detail=f"pitch_engine '{pitch_engine}'에 필요한 패키지가 설치되지 않았습니다.")
+	if musicxml_engine not in MUSICXML_ENGINES:
+		raise HTTPException(status_code=400, detail=f"알 수 없는 musicxml_engine입니다: {musicxml_engine} (가능: {', '.join(MUSICXML_ENGINES)})")
+	if musicxml_engine == "music21" and not music21_available():
+		raise HTTPException(status_code=400, detail="musicxml_engine 'music21'을 사용하려면 pip install music21이 필요합니다.")
+
+
+@router.post("/audio/generate-score")
+async def generate_score(
+	bg: BackgroundTasks,
+	file: Optional[UploadFile] = File(None),
+	audio_id: Optional[str] = None,
+	model: str = "demucs:4stems",
+	min_note_ms: int = 120,
+	voicing_thresh: float = 0.6,
+	pitch_engine: str = DEFAULT_PITCH_ENGINE,  # pyin | yin | crepe-tiny
+	musicxml_engine: str = "native",  # native | music21
+):
+	"""
+	보컬 기준 악보 생성: Demucs로 보컬 추출 → f0 추정(pitch_engine, 기본 librosa.pyin) → MIDI + MusicXML 생성하여 ZIP 반환.
+	요청 하나가 파이프라인 전체를 기다리므로, 긴 곡은 /audio/score/start 작업 API를 사용하세요.
+	"""
+	_check_score_request(pitch_engine, musicxml_engine)
+
+	start_ts = time.time()
+	def tlog(msg: str):
+		print(f"[score {datetime.datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
+
+	tlog("received request: storing upload…")
+	try:
+		audio = await acquire_audio_input(file, audio_id)
+	except UploadNotFound:
+		raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+	except ValueError:
+		raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
+	if audio.get("deduplicated") or audio_id:
+		tlog(f"reusing stored audio {audio['audio_id'][:12]}")
+
+	# temp workspace
+	try:
+		tmp_dir = create_temp_dir("score_", heavy=True)
+	except WorkspaceFull:
+		upload_release(audio["audio_id"])
+		raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+	input_path = audio["path"]
+
+	try:
+		job_id = str(uuid.uuid4())
+		zip_path = await asyncio.wrap_future(job_submit(
+			"score", job_id, _score_pipeline, tmp_dir, input_path, model, min_note_ms, voicing_thresh, start_ts, tlog,
+			audio["audio_id"], audio["filename"], pitch_engine, None, musicxml_engine,
+		))
+
+		# the work dir stays pinned until the response is sent; without this it would count against the quota forever
+		bg.add_task(safe_rmtree, tmp_dir)
+		return FileResponse(
+			path=str(zip_path),
+			filename=f"{Path(audio['filename']).stem}_vocal_score.zip",
+			media_type="application/zip",
+			headers={"X-Audio-Id": audio["audio_id"]},
+		)
 
 	except HTTPException:
 		safe_rmtree(tmp_dir)
@@ -395,3 +523,262 @@ async def generate_score(
 	except Exception as e:
 		safe_rmtree(tmp_dir)
 		raise HTTPException(status_code=500, detail=str(e))
+	finally:
+		upload_release(audio["audio_id"])
+
+
+# ---------------------------------------------------------------------------
+# Job API: start → progress/events → result, like render and stem separation.
+# ---------------------------------------------------------------------------
+
+def _score_job_log(job_id: str, message: str) -> None:
+	print(f"[score:{job_id}] {message}", flush=True)
+	job_append_log(job_id, message)
+
+
+def _job_error(e: Exception) -> str:
+	return getattr(e, "detail", None) or str(e) or type(e).__name__
+
+
+def _run_score_job(job_id: str, tmp_dir: Path, input_path: Path, params: Dict[str, Any], audio_id: Optional[str] = None, filename: Optional[str] = None) -> None:
+	tlog = lambda msg: _score_job_log(job_id, msg)
+	try:
+		tlog(f"Job started. Input: {filename or input_path.name}")
+		job_update(job_id, {"status": "running", "error": None, "failed_stage": None})
+		zip_path = _score_pipeline(
+			tmp_dir, input_path, params["model"], params["min_note_ms"], params["voicing_thresh"], time.time(), tlog,
+			audio_id, filename, params["pitch_engine"], job_id=job_id, musicxml_engine=params.get("musicxml_engine", "native"),
+		)
+		job_update(job_id, {"status": "completed", "progress": 1.0, "stage": None, "zip_path": str(zip_path)})
+	except Exception as e:
+		job_update(job_id, {"status": "failed", "error": _job_error(e)})
+		tlog(f"Job failed: {_job_error(e)}")
+
+
+def _run_score_retry(job_id: str, stage: str) -> None:
+	job = job_get(job_id) or {}
+	tmp_dir = Path(job["tmp_dir"])
+	artifacts = job.get("artifacts") or {}
+	midi_path = Path(artifacts["midi"])
+	musicxml_path = Path(artifacts["musicxml"]) if artifacts.get("musicxml") else None
+	tlog = lambda msg: _score_job_log(job_id, msg)
+	try:
+		tlog(f"Retrying the {stage} stage from kept artifacts...")
+		job_update(job_id, {"status": "running", "error": None, "failed_stage": None})
+		pdf_path = _pdf_stage(job_id, tmp_dir, midi_path, musicxml_path, job.get("filename") or midi_path.name, tlog)
+		zip_path = _zip_stage(job_id, tmp_dir, midi_path, musicxml_path, pdf_path)
+		job_update(job_id, {"status": "completed", "progress": 1.0, "stage": None, "zip_path": str(zip_path)})
+	except Exception as e:
+		job_update(job_id, {"status": "failed", "error": _job_error(e)})
+		tlog(f"Retry failed: {_job_error(e)}")
+
+
+def _submit_score_job(job_id: str, tmp_dir: Path, input_path: Path, params: Dict[str, Any], audio_id: Optional[str], filename: Optional[str]) -> None:
+	job_submit(
+		"score", job_id, _run_score_job, job_id, tmp_dir, input_path, params, audio_id, filename,
+		priority=params.get("priority", 0),
+	)
+
+
+@router.post("/audio/score/start")
+async def score_start(
+	file: Optional[UploadFile] = File(None),
+	audio_id: Optional[str] = None,
+	model: str = "demucs:4stems",
+	min_note_ms: int = 120,
+	voicing_thresh: float = 0.6,
+	pitch_engine: str = DEFAULT_PITCH_ENGINE,  # pyin | yin | crepe-tiny
+	musicxml_engine: str = "native",  # native | music21
+	priority: int = 0,
+):
+	"""
+	악보 생성 작업을 큐에 넣고 job_id를 바로 반환합니다. 진행률(단계별 진행/소요 시간)은 /audio/score/progress 또는 /audio/score/events,
+	결과 ZIP은 /audio/score/result 에서 받습니다.
+	"""
+	_check_score_request(pitch_engine, musicxml_engine)
+	try:
+		audio = await acquire_audio_input(file, audio_id)
+	except UploadNotFound:
+		raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+	except ValueError:
+		raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
+
+	try:
+		tmp_dir = create_temp_dir("score_job_", heavy=True)
+	except WorkspaceFull:
+		upload_release(audio["audio_id"])
+		raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+	input_path = audio["path"]
+	params = {
+		"model": model,
+		"min_note_ms": min_note_ms,
+		"voicing_thresh": voicing_thresh,
+		"pitch_engine": pitch_engine,
+		"musicxml_engine": musicxml_engine,
+		"priority": priority,
+	}
+	try:
+		job_id = str(uuid.uuid4())
+		job_set(job_id, {
+			"type": "score",
+			"status": "queued",
+			"progress": 0.0,
+			"stage": None,
+			"stages": {},
+			"failed_stage": None,
+			"tmp_dir": str(tmp_dir),
+			"input_path": str(input_path),
+			"audio_id": audio["audio_id"],
+			"filename": audio["filename"],
+			"params": params,
+			"artifacts": {},
+			"zip_path": None,
+			"error": None,
+		})
+		job_touch(job_id)
+		_submit_score_job(job_id, tmp_dir, input_path, params, audio["audio_id"], audio["filename"])
+		return {"job_id": job_id, "audio_id": audio["audio_id"]}
+	except Exception as e:
+		safe_rmtree(tmp_dir)
+		upload_release(audio["audio_id"])
+		raise HTTPException(status_code=500, detail=f"악보 생성 시작 실패: {str(e)}")
+
+
+def _resume_score_job(job_id: str, job: Dict[str, Any]) -> None:
+	# leftover work directories are adopted as idle at startup: pin this one before the sweeper takes it
+	# (raising here makes job_recover fail the job and reclaim its files)
+	if not acquire_temp_dir(Path(job["tmp_dir"])):
+		raise RuntimeError("work directory no longer exists")
+	# upload references live in memory, so a re-queued job takes its reference again
+	if job.get("audio_id"):
+		upload_acquire(job["audio_id"])
+	job_update(job_id, {"stage": None, "stages": {}, "failed_stage": None, "artifacts": {}})
+	job_touch(job_id)
+	_submit_score_job(job_id, Path(job["tmp_dir"]), Path(job["input_path"]), job["params"], job.get("audio_id"), job.get("filename"))
+
+
+register_job_resumer("score", _resume_score_job)
+
+
+def _retryable_stages(job: Dict[str, Any]) -> List[str]:
+	if job.get("status") not in ("completed", "failed") or not job.get("tmp_dir"):
+		return []
+	stages = job.get("stages") or {}
+	artifacts = job.get("artifacts") or {}
+	retryable = []
+	if artifacts.get("midi") and artifacts.get("musicxml") and (stages.get("pdf") or {}).get("status") in ("failed", "running", None):
+		retryable.append("pdf")
+	return retryable
+
+
+def _score_status(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+	queue = job_queue_info(job_id)
+	return {
+		"status": job.get("status"),
+		"progress": job.get("progress"),
+		"stage": job.get("stage"),
+		"stages": job.get("stages") or {},
+		"failed_stage": job.get("failed_stage"),
+		"retryable_stages": _retryable_stages(job),
+		"error": job.get("error"),
+		"queue_position": queue["queue_position"],
+		"eta": queue["eta"],
+	}
+
+
+@router.get("/audio/score/progress")
+def score_progress(job_id: str = Query(...)):
+	job = job_get(job_id)
+	if not job or job.get("type") != "score":
+		return JSONResponse({"error": "job not found"}, status_code=404)
+	job_touch(job_id)
+	return dict(_score_status(job_id, job), logs=job.get("logs", [])[-100:])
+
+
+@router.get("/audio/score/events")
+def score_events(job_id: str = Query(...)):
+	"""진행 상태(현재 단계, 단계별 소요 시간 포함)가 바뀔 때마다 Server-Sent Events로 전송합니다. 작업이 끝나면 스트림을 닫습니다."""
+	job = job_get(job_id)
+	if not job or job.get("type") != "score":
+		return JSONResponse({"error": "job not found"}, status_code=404)
+	return StreamingResponse(
+		job_sse_stream(job_id, lambda current: _score_status(job_id, current)),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.post("/audio/score/{job_id}/retry")
+def score_retry(job_id: str, stage: str = "pdf"):
+	"""
+	끝난 작업의 단계 하나를 보관된 중간 결과물(MIDI/MusicXML)로 다시 실행합니다. 현재는 pdf 단계만 지원하며, 이어서 ZIP을 다시 만듭니다.
+	"""
+	job = job_get(job_id)
+	if not job or job.get("type") != "score":
+		raise HTTPException(status_code=404, detail="job not found")
+	if stage not in RETRYABLE_SCORE_STAGES:
+		raise HTTPException(status_code=400, detail=f"다시 실행할 수 없는 단계입니다: {stage} (가능: {', '.join(RETRYABLE_SCORE_STAGES)})")
+	if job.get("status") in ("queued", "running"):
+		raise HTTPException(status_code=409, detail="작업이 아직 진행 중입니다.")
+	if stage not in _retryable_stages(job):
+		raise HTTPException(status_code=400, detail=f"{stage} 단계를 다시 실행할 중간 결과물이 없습니다.")
+	if not acquire_temp_dir(Path(job["tmp_dir"])):
+		raise HTTPException(status_code=410, detail="중간 결과물이 이미 정리되었습니다. 처음부터 다시 생성하세요.")
+	job_update(job_id, {"status": "queued", "error": None, "failed_stage": None, "progress": _STAGE_SPANS[stage][0]})
+	job_touch(job_id)
+	job_submit("score", job_id, _run_score_retry, job_id, stage, priority=(job.get("params") or {}).get("priority", 0))
+	return {"job_id": job_id, "status": "queued", "stage": stage}
+
+
+@router.delete("/audio/score/{job_id}")
+def score_cancel(job_id: str):
+	"""대기 중이거나 진행 중인 악보 생성 작업을 취소합니다(Demucs 워커 종료, 임시 파일 정리). 끝난 작업은 보관된 결과물과 함께 폐기합니다."""
+	job = job_get(job_id)
+	if not job or job.get("type") != "score":
+		raise HTTPException(status_code=404, detail="job not found")
+	previous = job_cancel(job_id)
+	was_active = previous is not None and previous.get("status") in ("queued", "running")
+	return {"job_id": job_id, "status": "cancelled" if was_active else "discarded", "previous_status": (previous or job).get("status")}
+
+
+@router.get("/audio/score/result")
+def score_result(bg: BackgroundTasks, job_id: str = Query(...)):
+	"""
+	완료된 작업의 ZIP을 반환합니다. PDF 단계가 실패한 작업은 다시 시도할 수 있도록 결과물을 남겨 두며(JOB_TTL_SECONDS 또는 DELETE까지),
+	그 밖의 작업은 전송 후 정리합니다.
+	"""
+	job = job_get(job_id)
+	if not job or job.get("type") != "score":
+		raise HTTPException(status_code=404, detail="job not found")
+	if job.get("status") in ("cancelled", "failed"):
+		raise HTTPException(status_code=410, detail=f"job {job['status']}: {job.get('error') or ''}".rstrip(": "))
+	zip_path = Path(job.get("zip_path") or "")
+	if job.get("status") != "completed" or not zip_path.is_file():
+		raise HTTPException(status_code=400, detail="job not completed")
+
+	if not _retryable_stages(job):
+		def _cleanup():
+			try:
+				job_pop(job_id)
+				if job.get("audio_id"):
+					upload_release(job["audio_id"])
+				if job.get("tmp_dir"):
+					safe_rmtree(Path(job["tmp_dir"]))
+			except Exception:
+				pass
+
+		bg.add_task(_cleanup)
+	return FileResponse(
+		path=str(zip_path),
+		filename=f"{Path(job.get('filename') or 'audio').stem}_vocal_score.zip",
+		media_type="application/zip",
+		headers={"X-Audio-Id": job.get("audio_id") or ""},
+	)
+
+
+@router.get("/audio/pitch-engines")
+def get_pitch_engines():
+	"""
+	악보 생성에 사용할 수 있는 f0 추정 엔진 목록을 반환합니다 (python -m services.pitch 로 정확도/속도 벤치마크).
+	"""
+	return {"default": DEFAULT_PITCH_ENGINE, "engines": pitch_engines()}
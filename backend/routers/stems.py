@@ -1,14 +1,18 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path
-import subprocess
-import tempfile
 import shutil
-import threading
 import zipfile
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from services.jobs import job_get, job_set, job_update, job_pop
+from services.ffmpeg import resolve_binaries
+from services.files import acquire_temp_dir, create_temp_dir, safe_rmtree
+from services.jobs import job_add_cancel_hook, job_cancel, job_get, job_set, job_update, job_pop, job_submit, job_queue_info, job_sse_stream, job_touch, register_job_resumer
+from services.metrics import stage_timer
+from services.separation import separate_file, terminate_separation_worker
+from services.stem_cache import sha256_file, stem_cache_key, stem_cache_fetch
+from services.uploads import UploadNotFound, acquire_audio_input, upload_acquire, upload_release
+from services.workspace import WorkspaceFull
 
 router = APIRouter()
 
@@ -18,9 +22,8 @@ try:
 except Exception:
 	_DEMUCS_AVAILABLE = False
 
-# ffmpeg presence is checked to align with original behavior
-import shutil as _sh
-_FFMPEG_EXE = _sh.which("ffmpeg") or "ffmpeg"
+# same resolution as the other routers (bundled imageio-ffmpeg first, then PATH)
+_FFMPEG_EXE, _FFPROBE_EXE = resolve_binaries()
 
 
 def _job_log(job_id: str, message: str) -> None:
@@ -29,75 +32,47 @@ def _job_log(job_id: str, message: str) -> None:
 	job_append_log(job_id, message)
 
 
-def _run_stem_separation(job_id: str, input_path: Path, output_dir: Path, model: str):
+def _run_stem_separation(job_id: str, input_path: Path, output_dir: Path, model: str, audio_id: Optional[str] = None):
 	try:
 		_job_log(job_id, f"Job queued. Input: {input_path.name}")
-		job_update(job_id, {"status": "running", "progress": 0.1, "eta": None})
+		job_update(job_id, {"status": "running", "progress": 0.1})
 		_job_log(job_id, "Preparing Demucs...")
 
 		job_update(job_id, {"progress": 0.3})
 
-		from demucs import separate  # ensure import inside thread
-		_job_log(job_id, "Demucs module imported.")
 		job_update(job_id, {"progress": 0.5})
 
 		demucs_model = "htdemucs" if "4stems" in model else "htdemucs_ft"
 		_job_log(job_id, f"Selected model: {demucs_model}")
 
-		cmd = [
-			"python", "-m", "demucs.separate",
-			"-n", demucs_model,
-			"-d", "cpu",
-			"-o", str(output_dir),
-			str(input_path),
-		]
-		_job_log(job_id, "Starting Demucs separation...")
-		proc = subprocess.Popen(
-			cmd,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			text=True,
-			encoding="utf-8",
-			errors="ignore",
-		)
-		if not proc.stderr:
-			raise RuntimeError("Demucs stderr stream not available")
-		while True:
-			line = proc.stderr.readline()
-			if not line and proc.poll() is not None:
-				break
-			if not line:
-				continue
-			lower = line.lower()
-			if any(key in lower for key in ["loading", "separating", "running", "saving", "done"]):
-				_job_log(job_id, line.strip())
-		proc.wait()
-		if proc.returncode != 0:
-			raise RuntimeError("Demucs process failed. See logs above.")
+		# audio_id is already the upload's SHA-256, so the file is not hashed a second time
+		cache_key = stem_cache_key(audio_id or sha256_file(input_path), demucs_model)
 
+		def _on_progress(fraction: float) -> None:
+			job_update(job_id, {"progress": round(0.5 + 0.45 * fraction, 3)})
+
+		def _on_worker(pid: int) -> None:
+			# cancelling the job kills the Demucs worker running it
+			job_add_cancel_hook(job_id, lambda: terminate_separation_worker(pid))
+
+		def _separate(work_dir: Path) -> None:
+			_job_log(job_id, "Starting Demucs separation...")
+			separate_file(input_path, demucs_model, work_dir, progress=_on_progress, on_start=_on_worker)
+			_job_log(job_id, "Demucs separation finished.")
+
+		stems, cache_hit = stem_cache_fetch(cache_key, _separate, output_dir)
+		if cache_hit:
+			_job_log(job_id, "Reusing cached stems for this audio (Demucs skipped).")
 		_job_log(job_id, "Collecting separated stems...")
-		stem_files: Dict[str, str] = {}
-		for stem_file in output_dir.rglob("*.wav"):
-			name = stem_file.stem
-			if name.lower() in {"vocals", "drums", "bass", "other", "piano"}:
-				new_path = output_dir / f"{name}.wav"
-				try:
-					if stem_file.resolve() != new_path.resolve():
-						shutil.copy2(stem_file, new_path)
-					stem_files[name] = str(new_path)
-				except Exception:
-					pass
-		for sub in output_dir.iterdir():
-			if sub.is_dir():
-				shutil.rmtree(sub, ignore_errors=True)
+		stem_files: Dict[str, str] = {name: str(path) for name, path in stems.items()}
 
 		zip_path = output_dir.parent / "stems.zip"
-		with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+		with stage_timer("zip"), zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
 			for stem_name, stem_path in stem_files.items():
 				zipf.write(stem_path, f"{stem_name}.wav")
 		_job_log(job_id, f"Created ZIP: {zip_path.name}")
 
-		job_update(job_id, {"status": "completed", "progress": 1.0, "zip_path": str(zip_path)})
+		job_update(job_id, {"status": "completed", "progress": 1.0, "zip_path": str(zip_path), "cache_hit": cache_hit})
 		_job_log(job_id, "Job completed successfully.")
 	except Exception as e:
 		job_update(job_id, {"status": "failed", "error": str(e)})
@@ -106,71 +81,136 @@ def _run_stem_separation(job_id: str, input_path: Path, output_dir: Path, model:
 
 @router.post("/audio/separate-stems")
 async def separate_stems(
-	file: UploadFile = File(...),
+	file: Optional[UploadFile] = File(None),
+	audio_id: Optional[str] = None,
 	model: str = "demucs:4stems",
+	priority: int = 0,
 ):
 	if not _DEMUCS_AVAILABLE:
 		raise HTTPException(status_code=500, detail="Demucs가 설치되지 않았습니다. pip install demucs를 실행하세요.")
 	if not _FFMPEG_EXE or (Path(_FFMPEG_EXE).exists() is False and shutil.which(_FFMPEG_EXE) is None):
 		raise HTTPException(status_code=500, detail="ffmpeg 실행 파일을 찾을 수 없습니다.")
 
-	tmp_dir = Path(tempfile.mkdtemp(prefix="stem_separation_"))
-	input_path = tmp_dir / (Path(file.filename).name or "input")
+	try:
+		audio = await acquire_audio_input(file, audio_id)
+	except UploadNotFound:
+		raise HTTPException(status_code=404, detail="audio_id에 해당하는 업로드를 찾을 수 없습니다.")
+	except ValueError:
+		raise HTTPException(status_code=400, detail="file 또는 audio_id가 필요합니다.")
+
+	try:
+		tmp_dir = create_temp_dir("stem_separation_", heavy=True)
+	except WorkspaceFull:
+		upload_release(audio["audio_id"])
+		raise HTTPException(status_code=503, detail="작업 공간이 부족합니다. 잠시 후 다시 시도하세요.")
+	input_path = audio["path"]
 	output_dir = tmp_dir / "stems"
 	try:
-		with input_path.open("wb") as f:
-			while True:
-				chunk = await file.read(1024 * 1024)
-				if not chunk:
-					break
-				f.write(chunk)
 		output_dir.mkdir(exist_ok=True)
 
 		import uuid
 		job_id = str(uuid.uuid4())
 		job_set(job_id, {
+			"type": "stems",
 			"status": "queued",
 			"progress": 0.0,
 			"tmp_dir": str(tmp_dir),
 			"input_path": str(input_path),
+			"audio_id": audio["audio_id"],
+			"filename": audio["filename"],
 			"output_dir": str(output_dir),
 			"model": model,
+			"priority": priority,
 			"error": None,
 		})
+		job_touch(job_id)
 
-		thread = threading.Thread(target=_run_stem_separation, args=(job_id, input_path, output_dir, model), daemon=True)
-		thread.start()
-		return {"job_id": job_id}
+		job_submit("stems", job_id, _run_stem_separation, job_id, input_path, output_dir, model, audio["audio_id"], priority=priority)
+		return {"job_id": job_id, "audio_id": audio["audio_id"]}
 	except Exception as e:
-		shutil.rmtree(tmp_dir, ignore_errors=True)
+		safe_rmtree(tmp_dir)
+		upload_release(audio["audio_id"])
 		raise HTTPException(status_code=500, detail=f"Stem 분리 시작 실패: {str(e)}")
 
 
-@router.get("/audio/stem-separation/progress")
-def stem_separation_progress(job_id: str = Query(...)):
-	job = job_get(job_id)
-	if not job:
-		return JSONResponse({"error": "job not found"}, status_code=404)
+def _resume_stem_job(job_id: str, job: Dict[str, Any]) -> None:
+	# leftover work directories are adopted as idle at startup: pin this one before the sweeper takes it
+	# (raising here makes job_recover fail the job and reclaim its files)
+	if not acquire_temp_dir(Path(job["tmp_dir"])):
+		raise RuntimeError("work directory no longer exists")
+	# upload references live in memory, so a re-queued job takes its reference again
+	if job.get("audio_id"):
+		upload_acquire(job["audio_id"])
+	job_touch(job_id)
+	job_submit(
+		"stems", job_id, _run_stem_separation,
+		job_id, Path(job["input_path"]), Path(job["output_dir"]), job.get("model") or "demucs:4stems", job.get("audio_id"),
+		priority=job.get("priority") or 0,
+	)
+
+
+register_job_resumer("stems", _resume_stem_job)
+
+
+def _stem_status(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+	queue = job_queue_info(job_id)
 	return {
 		"status": job.get("status"),
 		"progress": job.get("progress"),
 		"error": job.get("error"),
-		"logs": job.get("logs", [])[-100:],
-		"eta": job.get("eta"),
+		"eta": queue["eta"] if queue["eta"] is not None else job.get("eta"),
+		"queue_position": queue["queue_position"],
 	}
 
 
+@router.get("/audio/stem-separation/progress")
+def stem_separation_progress(job_id: str = Query(...)):
+	job = job_get(job_id)
+	if not job:
+		return JSONResponse({"error": "job not found"}, status_code=404)
+	job_touch(job_id)
+	return dict(_stem_status(job_id, job), logs=job.get("logs", [])[-100:])
+
+
+@router.get("/audio/stem-separation/events")
+def stem_separation_events(job_id: str = Query(...)):
+	"""진행 상태가 바뀔 때마다 Server-Sent Events로 전송합니다 (logs 제외). 작업이 끝나면 스트림을 닫습니다."""
+	job = job_get(job_id)
+	if not job or job.get("type") != "stems":
+		return JSONResponse({"error": "job not found"}, status_code=404)
+	return StreamingResponse(
+		job_sse_stream(job_id, lambda current: _stem_status(job_id, current)),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.delete("/audio/stem-separation/{job_id}")
+def stem_separation_cancel(job_id: str):
+	"""진행 중이거나 대기 중인 stem 분리 작업을 취소합니다(Demucs 워커 종료, 임시 파일 정리). 끝난 작업은 폐기합니다."""
+	job = job_get(job_id)
+	if not job or job.get("type") != "stems":
+		raise HTTPException(status_code=404, detail="job not found")
+	previous = job_cancel(job_id)
+	was_active = previous is not None and previous.get("status") in ("queued", "running")
+	return {"job_id": job_id, "status": "cancelled" if was_active else "discarded", "previous_status": (previous or job).get("status")}
+
+
 @router.get("/audio/stem-separation/result")
 def stem_separation_result(bg: BackgroundTasks, job_id: str = Query(...)):
 	job = job_get(job_id)
 	if not job:
 		raise HTTPException(status_code=404, detail="job not found")
 	status = job.get("status")
-	zip_path = Path(job.get("zip_path"))
-	tmp_dir = Path(job.get("tmp_dir"))
-	input_path = Path(job.get("input_path"))
-	model = job.get("model")
-	if status != "completed" or not zip_path.exists():
+	# cancelled and evicted jobs have had their files reclaimed (tmp_dir/audio_id are None by now)
+	if status in ("cancelled", "failed"):
+		raise HTTPException(status_code=410, detail=f"job {status}: {job.get('error') or ''}".rstrip(": "))
+	zip_path = Path(job["zip_path"]) if job.get("zip_path") else None
+	tmp_dir = Path(job["tmp_dir"]) if job.get("tmp_dir") else None
+	input_path = Path(job["input_path"]) if job.get("input_path") else None
+	audio_id = job.get("audio_id")
+	model = job.get("model") or "demucs:4stems"
+	if status != "completed" or zip_path is None or not zip_path.exists():
 		raise HTTPException(status_code=400, detail="job not completed")
 
 	def _cleanup():
@@ -178,16 +218,18 @@ def stem_separation_result(bg: BackgroundTasks, job_id: str = Query(...)):
 			job_pop(job_id)
 			if zip_path.exists():
 				zip_path.unlink()
-			if input_path.exists():
+			if audio_id:
+				upload_release(audio_id)
+			elif input_path is not None and input_path.exists():
 				input_path.unlink()
-			if tmp_dir.exists():
-				shutil.rmtree(tmp_dir, ignore_errors=True)
+			if tmp_dir is not None and tmp_dir.exists():
+				safe_rmtree(tmp_dir)
 		except Exception:
 			pass
 
 	bg.add_task(_cleanup)
 	model_name = model.replace("spleeter:", "").replace("-16kHz", "")
-	filename = f"stems_{Path(input_path).stem or 'output'}_{model_name}.zip"
+	filename = f"stems_{Path(job.get('filename') or input_path or 'output').stem or 'output'}_{model_name}.zip"
 	return FileResponse(path=str(zip_path), filename=filename, media_type="application/zip")
 
 
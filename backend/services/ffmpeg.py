@@ -1,7 +1,13 @@
+import asyncio
+import os
+import re
 import shutil
+import signal
 import subprocess
+import threading
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
 
 
 def resolve_binaries() -> tuple[str, str]:
@@ -16,7 +22,97 @@ def resolve_binaries() -> tuple[str, str]:
         return ffmpeg_exe, ffprobe_exe
 
 
+_FILTER_LINE_RE = re.compile(r"^ [T.][S.][C.] (\S+)\s+\S+->\S+")
+_ENCODER_LINE_RE = re.compile(r"^ [VAS][.A-Z]{5} (\S+)")
+_VERSION_RE = re.compile(r"version (\S+)")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+_CAPABILITIES: Optional[Dict[str, Any]] = None
+_CAPABILITIES_LOCK = threading.Lock()
+
+
+def _run_text(cmd: List[str]) -> str:
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="ignore", timeout=30)
+        return (proc.stdout or "") + (proc.stderr or "")
+    except Exception:
+        return ""
+
+
+def _probe_capabilities() -> Dict[str, Any]:
+    ffmpeg_exe, ffprobe_exe = resolve_binaries()
+    version_out = _run_text([ffmpeg_exe, "-hide_banner", "-version"])
+    version = _VERSION_RE.search(version_out.splitlines()[0]) if version_out else None
+    filters = {m.group(1) for m in map(_FILTER_LINE_RE.match, _run_text([ffmpeg_exe, "-hide_banner", "-filters"]).splitlines()) if m}
+    encoder_lines = _run_text([ffmpeg_exe, "-hide_banner", "-encoders"]).split("------", 1)[-1].splitlines()
+    encoders = {m.group(1) for m in map(_ENCODER_LINE_RE.match, encoder_lines) if m}
+    buildconf = _run_text([ffmpeg_exe, "-hide_banner", "-buildconf"])
+    ffprobe_available = bool(_run_text([ffprobe_exe, "-hide_banner", "-version"]))
+    return {
+        "ffmpeg": ffmpeg_exe,
+        "ffprobe": ffprobe_exe if ffprobe_available else None,
+        "available": bool(version_out),
+        "version": version.group(1) if version else None,
+        "filters": filters,
+        "encoders": encoders,
+        # soxr is an aresample option, not a filter, so it only shows up in the build configuration
+        "soxr": "--enable-libsoxr" in buildconf,
+    }
+
+
+def ffmpeg_capabilities(refresh: bool = False) -> Dict[str, Any]:
+    """Probe ffmpeg/ffprobe once (version, filters, encoders, soxr) and serve the cached result afterwards."""
+    global _CAPABILITIES
+    with _CAPABILITIES_LOCK:
+        if _CAPABILITIES is None or refresh:
+            _CAPABILITIES = _probe_capabilities()
+            print(
+                f"[ffmpeg] {_CAPABILITIES['version'] or 'not found'}: {len(_CAPABILITIES['filters'])} filters, "
+                f"{len(_CAPABILITIES['encoders'])} encoders, soxr={_CAPABILITIES['soxr']}, "
+                f"ffprobe={'yes' if _CAPABILITIES['ffprobe'] else 'no'}",
+                flush=True,
+            )
+        return _CAPABILITIES
+
+
+def has_filter(name: str) -> bool:
+    return name in ffmpeg_capabilities()["filters"]
+
+
+def has_encoder(name: str) -> bool:
+    return name in ffmpeg_capabilities()["encoders"]
+
+
+def resample_filter(sample_rate: int = 48000) -> str:
+    """aresample with soxr at high precision when the build has it, the default swr resampler otherwise."""
+    if ffmpeg_capabilities()["soxr"]:
+        return f"aresample={sample_rate}:resampler=soxr:precision=28"
+    return f"aresample={sample_rate}"
+
+
+def ffmpeg_capabilities_summary() -> Dict[str, Any]:
+    caps = ffmpeg_capabilities()
+    return {
+        "available": caps["available"],
+        "version": caps["version"],
+        "ffprobe": caps["ffprobe"] is not None,
+        "soxr": caps["soxr"],
+        "filters": {name: name in caps["filters"] for name in ("loudnorm", "acompressor", "showwaves", "showfreqs", "showspectrum", "avectorscope")},
+        "encoders": {name: name in caps["encoders"] for name in ("libx264", "aac", "flac", "libopus", "libmp3lame")},
+    }
+
+
+def _probe_duration_with_ffmpeg(input_path: Path) -> Optional[float]:
+    # ffmpeg -i without an output exits non-zero but still prints the container duration
+    match = _DURATION_RE.search(_run_text([ffmpeg_capabilities()["ffmpeg"], "-hide_banner", "-i", str(input_path)]))
+    if not match:
+        return None
+    return float(match.group(1)) * 3600 + float(match.group(2)) * 60 + float(match.group(3))
+
+
 def probe_duration_seconds(ffprobe_exe: str, input_path: Path) -> Optional[float]:
+    if ffmpeg_capabilities()["ffprobe"] is None:
+        return _probe_duration_with_ffmpeg(input_path)
     try:
         cmd = [
             ffprobe_exe,
@@ -37,3 +133,282 @@ def probe_duration_seconds(ffprobe_exe: str, input_path: Path) -> Optional[float
     return None
 
 
+# Named x264 encoder profiles. "scale" downsizes the rendered frame (before the filter graph,
+# so filters also run on fewer pixels) and "max_fps" caps the output frame rate.
+ENCODER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "preview": {"preset": "ultrafast", "crf": 32, "tune": "fastdecode", "threads": 0, "scale": 0.5, "max_fps": 15},
+    "balanced": {"preset": "veryfast", "crf": 23, "tune": None, "threads": 0, "scale": 1.0, "max_fps": 60},
+    "archive": {"preset": "slow", "crf": 18, "tune": "animation", "threads": 0, "scale": 1.0, "max_fps": None},
+}
+DEFAULT_ENCODER_PROFILE = "balanced"
+
+
+def get_encoder_profile(name: Optional[str]) -> Dict[str, Any]:
+    key = (name or DEFAULT_ENCODER_PROFILE).lower()
+    if key not in ENCODER_PROFILES:
+        raise ValueError(f"unknown encoder profile: {name} (choose from {', '.join(ENCODER_PROFILES)})")
+    return dict(ENCODER_PROFILES[key], name=key)
+
+
+def profile_geometry(profile: Dict[str, Any], width: int, height: int, fps: int) -> Tuple[int, int, int]:
+    scale = float(profile.get("scale") or 1.0)
+    # libx264 with yuv420p needs even dimensions
+    out_w = max(2, int(round(width * scale / 2.0)) * 2)
+    out_h = max(2, int(round(height * scale / 2.0)) * 2)
+    max_fps = profile.get("max_fps")
+    out_fps = min(fps, int(max_fps)) if max_fps else fps
+    return out_w, out_h, max(1, out_fps)
+
+
+def encoder_args(profile: Dict[str, Any], threads: Optional[int] = None) -> List[str]:
+    args = [
+        "-c:v", "libx264",
+        "-preset", str(profile["preset"]),
+        "-crf", str(profile["crf"]),
+    ]
+    if profile.get("tune"):
+        args += ["-tune", str(profile["tune"])]
+    args += ["-threads", str(threads if threads is not None else profile.get("threads", 0))]
+    args += ["-pix_fmt", "yuv420p"]
+    return args
+
+
+# Output formats for processed audio. "bitrate" is the default for lossy codecs; "sample_rate" is
+# pinned because loudnorm (and other resampling chains) otherwise emit at 192 kHz.
+# streamable: the muxer tolerates an unknown length on a pipe. The WAV muxer seeks back to write its
+# RIFF/data sizes, so piped WAV carries 0xFFFFFFFF placeholders and has to go through a file.
+AUDIO_OUTPUT_FORMATS: Dict[str, Dict[str, Any]] = {
+    "wav": {"encoder": "pcm_s16le", "muxer": "wav", "media_type": "audio/wav", "ext": "wav", "bitrate": None, "streamable": False},
+    "flac": {"encoder": "flac", "muxer": "flac", "media_type": "audio/flac", "ext": "flac", "bitrate": None, "streamable": True},
+    "opus": {"encoder": "libopus", "muxer": "ogg", "media_type": "audio/ogg", "ext": "opus", "bitrate": "160k", "streamable": True},
+    "mp3": {"encoder": "libmp3lame", "muxer": "mp3", "media_type": "audio/mpeg", "ext": "mp3", "bitrate": "256k", "streamable": True},
+}
+_BITRATE_RE = re.compile(r"^(\d{2,3})k$")
+
+
+def audio_output_args(fmt: str, bitrate: Optional[str] = None, sample_rate: int = 48000) -> Tuple[List[str], Dict[str, Any]]:
+    """ffmpeg output arguments (codec, bitrate, rate, muxer) and the format entry; raises ValueError."""
+    key = (fmt or "wav").lower()
+    spec = AUDIO_OUTPUT_FORMATS.get(key)
+    if spec is None:
+        raise ValueError(f"unknown output format: {fmt} (choose from {', '.join(AUDIO_OUTPUT_FORMATS)})")
+    if not has_encoder(spec["encoder"]):
+        raise ValueError(f"ffmpeg build has no {spec['encoder']} encoder for {key}")
+    args = ["-c:a", spec["encoder"], "-ar", str(sample_rate)]
+    if spec["bitrate"] is not None:
+        rate = bitrate or spec["bitrate"]
+        match = _BITRATE_RE.match(rate)
+        if not match or not 32 <= int(match.group(1)) <= 320:
+            raise ValueError(f"bitrate must look like 128k (32k-320k), got {rate}")
+        args += ["-b:a", rate]
+    elif key == "flac":
+        args += ["-sample_fmt", "s16"]
+    return args + ["-f", spec["muxer"]], dict(spec, name=key)
+
+
+# Process runner. Every ffmpeg/MuseScore command goes through here: the event loop never blocks on a
+# child, each child gets its own process group so a kill takes its helpers too, and stderr is read
+# line by line (ffmpeg ends progress lines with \r) into an optional callback and a bounded tail.
+_READ_CHUNK = 64 * 1024
+_LINE_SPLIT_RE = re.compile(rb"\r\n|\r|\n")
+
+
+def kill_process_group(pid: int) -> None:
+    """Kill a process started by run_process/stream_process together with its children."""
+    try:
+        if os.name == "posix":
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+async def _spawn(cmd: Sequence[Any], stdout: int, cwd: Optional[Path], env: Optional[Mapping[str, str]]) -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        *[str(c) for c in cmd],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=stdout,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(cwd) if cwd is not None else None,
+        env=dict(env) if env is not None else None,
+        start_new_session=os.name == "posix",
+    )
+
+
+async def _pump_lines(stream: asyncio.StreamReader, tail: Deque[str], on_line: Optional[Callable[[str], None]]) -> None:
+    pending = b""
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        parts = _LINE_SPLIT_RE.split(pending + chunk)
+        pending = parts.pop() if chunk else b""
+        for raw in parts:
+            line = raw.decode("utf-8", errors="ignore")
+            if not line.strip():
+                continue
+            tail.append(line)
+            if on_line is not None:
+                try:
+                    on_line(line)
+                except Exception:
+                    pass
+        if not chunk:
+            return
+
+
+# machine-readable key=value blocks on stdout instead of the human-readable stats line on stderr
+PROGRESS_ARGS = ("-progress", "pipe:1", "-nostats")
+
+
+async def _pump_progress(stream: asyncio.StreamReader, on_progress: Callable[[Dict[str, str]], None]) -> None:
+    # each block ends with progress=continue|end
+    block: Dict[str, str] = {}
+
+    def _on_line(line: str) -> None:
+        key, sep, value = line.partition("=")
+        if not sep:
+            return
+        block[key.strip()] = value.strip()
+        if key.strip() == "progress":
+            on_progress(dict(block))
+            block.clear()
+
+    await _pump_lines(stream, deque(maxlen=1), _on_line)
+
+
+def progress_seconds(block: Dict[str, str]) -> Optional[float]:
+    """Output position of a -progress block in seconds (out_time_ms is microseconds too, an ffmpeg quirk)."""
+    for key in ("out_time_us", "out_time_ms"):
+        value = block.get(key, "")
+        if value.lstrip("-").isdigit():
+            return max(0.0, int(value) / 1_000_000)
+    return None
+
+
+def progress_speed(block: Dict[str, str]) -> Optional[float]:
+    """Encode speed as a multiple of realtime ("1.85x"), None while ffmpeg reports N/A."""
+    try:
+        return float(block.get("speed", "").rstrip("x"))
+    except ValueError:
+        return None
+
+
+async def run_process(
+    cmd: Sequence[Any],
+    timeout: Optional[float] = None,
+    on_stderr_line: Optional[Callable[[str], None]] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+    on_progress: Optional[Callable[[Dict[str, str]], None]] = None,
+    capture_stdout: bool = False,
+    tail_lines: int = 50,
+    cwd: Optional[Path] = None,
+    env: Optional[Mapping[str, str]] = None,
+) -> Dict[str, Any]:
+    """Run cmd to completion without blocking the event loop.
+
+    Returns {"returncode", "stdout" (bytes when capture_stdout), "stderr_tail"}. On timeout the process
+    group is killed and subprocess.TimeoutExpired raised; cancelling the awaiting task kills it as well.
+    on_start receives the pid (which is also the process group id) as soon as the child exists.
+    on_progress receives each ffmpeg -progress block; cmd must include PROGRESS_ARGS (stdout is then
+    the progress pipe, so it cannot be combined with capture_stdout).
+    """
+    if on_progress is not None and capture_stdout:
+        raise ValueError("on_progress reads stdout; it cannot be combined with capture_stdout")
+    piped = capture_stdout or on_progress is not None
+    proc = await _spawn(cmd, asyncio.subprocess.PIPE if piped else asyncio.subprocess.DEVNULL, cwd, env)
+    if on_start is not None:
+        on_start(proc.pid)
+    tail: Deque[str] = deque(maxlen=max(1, tail_lines))
+    readers = [_pump_lines(proc.stderr, tail, on_stderr_line)]
+    if capture_stdout:
+        readers.append(proc.stdout.read())
+    elif on_progress is not None:
+        readers.append(_pump_progress(proc.stdout, on_progress))
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*readers, proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        kill_process_group(proc.pid)
+        await proc.wait()
+        raise subprocess.TimeoutExpired([str(c) for c in cmd], timeout, stderr="\n".join(tail))
+    except BaseException:
+        kill_process_group(proc.pid)
+        raise
+    return {
+        "returncode": proc.returncode,
+        "stdout": results[1] if capture_stdout else None,
+        "stderr_tail": "\n".join(tail),
+    }
+
+
+def run_process_sync(cmd: Sequence[Any], **kwargs: Any) -> Dict[str, Any]:
+    """run_process for job threads and thread pools, which have no event loop of their own."""
+    return asyncio.run(run_process(cmd, **kwargs))
+
+
+async def stream_process(
+    cmd: Sequence[Any],
+    chunk_size: int = _READ_CHUNK,
+    on_start: Optional[Callable[[int], None]] = None,
+    tail_lines: int = 50,
+) -> AsyncIterator[bytes]:
+    """Yield cmd's stdout as it is produced; raises RuntimeError with the stderr tail on a non-zero exit.
+    Closing the generator early (client gone) kills the process group."""
+    proc = await _spawn(cmd, asyncio.subprocess.PIPE, None, None)
+    if on_start is not None:
+        on_start(proc.pid)
+    tail: Deque[str] = deque(maxlen=max(1, tail_lines))
+    stderr_task = asyncio.ensure_future(_pump_lines(proc.stderr, tail, None))
+    try:
+        while True:
+            chunk = await proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        await stderr_task
+        await proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"{Path(str(cmd[0])).name} exited with {proc.returncode}: " + "\n".join(tail))
+    finally:
+        if proc.returncode is None:
+            kill_process_group(proc.pid)
+            await proc.wait()
+        stderr_task.cancel()
+
+
+def stream_process_sync(cmd: Sequence[Any], chunk_size: int = _READ_CHUNK, **kwargs: Any) -> Iterator[bytes]:
+    """stream_process for job threads, thread pools and worker processes: a plain generator driving it on
+    a private event loop, yielding chunk_size bytes at a time (less only at the end). Closing the
+    generator early kills the process group, as with stream_process."""
+    loop = asyncio.new_event_loop()
+    chunks = stream_process(cmd, chunk_size=chunk_size, **kwargs)
+    try:
+        while True:
+            batch = loop.run_until_complete(_next_batch(chunks, chunk_size))
+            if not batch:
+                return
+            yield batch
+    finally:
+        try:
+            loop.run_until_complete(_close_stream(chunks))
+        finally:
+            loop.close()
+
+
+async def _next_batch(chunks: AsyncGenerator[bytes, None], size: int) -> bytes:
+    # pipe reads return whatever the child last wrote (often a few KiB); gathering them here keeps the
+    # loop round trips per batch, not per read
+    parts: List[bytes] = []
+    total = 0
+    async for chunk in chunks:
+        parts.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            break
+    return b"".join(parts)
+
+
+async def _close_stream(chunks: AsyncGenerator[bytes, None]) -> None:
+    # aclose kills and reaps the process; then let the cancelled stderr reader finish on this loop
+    await chunks.aclose()
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    await asyncio.gather(*pending, return_exceptions=True)
@@ -1,11 +1,24 @@
 import shutil
-import tempfile
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
+from services.workspace import workspace_acquire, workspace_create, workspace_forget, workspace_release
 
-def create_temp_dir(prefix: str) -> Path:
-    return Path(tempfile.mkdtemp(prefix=prefix))
+
+def create_temp_dir(prefix: str, heavy: bool = False) -> Path:
+    """Tracked work directory under WORKSPACE_DIR; heavy=True raises WorkspaceFull when out of quota."""
+    return workspace_create(prefix, heavy=heavy)
+
+
+def release_temp_dir(path: Optional[Path]) -> None:
+    """Mark a work directory as no longer in use; the sweeper may remove it after the TTL or under quota pressure."""
+    if path is not None:
+        workspace_release(path)
+
+
+def acquire_temp_dir(path: Path) -> bool:
+    """Pin a released work directory again; False when it has already been swept."""
+    return workspace_acquire(path)
 
 
 def write_upload_to(path: Path, file_like) -> None:
@@ -22,6 +35,7 @@ def safe_rmtree(path: Path) -> None:
         shutil.rmtree(path, ignore_errors=True)
     except Exception:
         pass
+    workspace_forget(path)
 
 
 def safe_unlink(path: Path) -> None:
@@ -0,0 +1,182 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobStore(ABC):
+    """Backend interface behind services.jobs. Implementations must be thread-safe."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, job_id: str, data: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, updates: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def pop(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        ...
+
+    def expired(self, ttl_seconds: float, now: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Terminal jobs whose last update is older than ttl_seconds."""
+        now = now or time.time()
+        return [
+            (job_id, job) for job_id, job in self.items()
+            if job.get("status") in TERMINAL_STATUSES and now - float(job.get("updated_at") or now) > ttl_seconds
+        ]
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def set(self, job_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job_id] = dict(data, updated_at=time.time())
+
+    def update(self, job_id: str, updates: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(updates)
+                job["updated_at"] = time.time()
+
+    def pop(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(k, dict(v)) for k, v in self._jobs.items()]
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """Write-behind store: reads are served from memory, rows are flushed to SQLite (WAL) in batches.
+
+    Progress updates only mark a job dirty; status changes, inserts and deletes wake the
+    flusher immediately so terminal states reach disk without waiting for the interval.
+    """
+
+    def __init__(self, path: Path, flush_interval: float = 0.5):
+        super().__init__()
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = sqlite3.connect(str(self._path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._dirty: set = set()
+        self._deleted: set = set()
+        self._wake = threading.Event()
+        self._closed = False
+        self._flush_interval = flush_interval
+        for job_id, data in self._conn.execute("SELECT job_id, data FROM jobs"):
+            try:
+                self._jobs[job_id] = json.loads(data)
+            except ValueError:
+                self._deleted.add(job_id)
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def set(self, job_id: str, data: Dict[str, Any]) -> None:
+        super().set(job_id, data)
+        with self._lock:
+            self._dirty.add(job_id)
+            self._deleted.discard(job_id)
+        self._wake.set()
+
+    def update(self, job_id: str, updates: Dict[str, Any]) -> None:
+        super().update(job_id, updates)
+        with self._lock:
+            if job_id in self._jobs:
+                self._dirty.add(job_id)
+        if "status" in updates:
+            self._wake.set()
+
+    def pop(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = super().pop(job_id)
+        with self._lock:
+            self._dirty.discard(job_id)
+            self._deleted.add(job_id)
+        self._wake.set()
+        return job
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[jobs] store flush failed: {e}", flush=True)
+
+    def flush(self) -> None:
+        with self._lock:
+            rows = [
+                (job_id, json.dumps(self._jobs[job_id], default=str), float(self._jobs[job_id].get("updated_at") or time.time()))
+                for job_id in self._dirty if job_id in self._jobs
+            ]
+            deleted = [(job_id,) for job_id in self._deleted]
+            self._dirty.clear()
+            self._deleted.clear()
+        if not rows and not deleted:
+            return
+        with self._db_lock:
+            if self._conn is None:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                if rows:
+                    self._conn.executemany(
+                        "INSERT INTO jobs (job_id, data, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(job_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                        rows,
+                    )
+                if deleted:
+                    self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", deleted)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
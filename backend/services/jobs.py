@@ -1,38 +1,484 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
 import threading
-from typing import Dict, Any, Optional
+import time
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Optional, Callable, List, Tuple
 
+from services.ffmpeg import kill_process_group
+from services.files import release_temp_dir, safe_rmtree
+from services.job_store import TERMINAL_STATUSES, JobStore, MemoryJobStore, SQLiteJobStore
+from services.uploads import upload_expire, upload_release
+from services.workspace import workspace_on_evict, workspace_sweep
 
-_JOBS: Dict[str, Dict[str, Any]] = {}
+
+_JOB_STORE_KIND = os.environ.get("JOB_STORE", "sqlite").lower()
+_JOB_STORE_PATH = Path(os.environ.get("JOB_STORE_PATH") or (Path(tempfile.gettempdir()) / "sound_wave_jobs.sqlite3"))
+_JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", str(6 * 3600)))
+_JOB_RECOVERY = os.environ.get("JOB_RECOVERY", "fail").lower()  # fail | requeue
+# Polled jobs (render, stems) nobody has asked about for this long are cancelled; 0 disables.
+_JOB_IDLE_TIMEOUT_SECONDS = float(os.environ.get("JOB_IDLE_TIMEOUT_SECONDS", "600"))
+
+
+def _create_store() -> JobStore:
+    if _JOB_STORE_KIND == "sqlite":
+        try:
+            return SQLiteJobStore(_JOB_STORE_PATH)
+        except Exception as e:
+            print(f"[jobs] SQLite job store unavailable ({e}); falling back to memory", flush=True)
+    return MemoryJobStore()
+
+
+_STORE: JobStore = _create_store()
 _JOB_LOCK = threading.Lock()
+_RESUMERS: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
 
 
 def job_set(job_id: str, data: Dict[str, Any]) -> None:
-    with _JOB_LOCK:
-        _JOBS[job_id] = data
+    _STORE.set(job_id, dict(data, created_at=data.get("created_at") or time.time()))
+    _notify(job_id)
 
 
 def job_get(job_id: str) -> Optional[Dict[str, Any]]:
-    with _JOB_LOCK:
-        return _JOBS.get(job_id)
+    return _STORE.get(job_id)
 
 
 def job_update(job_id: str, updates: Dict[str, Any]) -> None:
-    with _JOB_LOCK:
-        job = _JOBS.get(job_id)
-        if job is not None:
-            job.update(updates)
+    # a cancelled job's worker may still be unwinding; its late updates must not revive the job
+    if job_id in _CANCELLED:
+        return
+    _STORE.update(job_id, updates)
+    _notify(job_id)
 
 
 def job_pop(job_id: str) -> Optional[Dict[str, Any]]:
-    with _JOB_LOCK:
-        return _JOBS.pop(job_id, None)
+    job = _STORE.pop(job_id)
+    _notify(job_id)
+    return job
 
 
 def job_append_log(job_id: str, message: str) -> None:
     with _JOB_LOCK:
-        job = _JOBS.get(job_id)
+        job = _STORE.get(job_id)
         if job is not None:
-            logs = job.setdefault("logs", [])
+            logs = list(job.get("logs") or [])
             logs.append(message)
+            _STORE.update(job_id, {"logs": logs})
+
+
+def register_job_resumer(job_type: str, resume: Callable[[str, Dict[str, Any]], None]) -> None:
+    """Register how to re-submit an interrupted job of job_type when JOB_RECOVERY=requeue."""
+    _RESUMERS[job_type] = resume
+
+
+def _reclaim_files(job: Dict[str, Any]) -> None:
+    tmp_dir = job.get("tmp_dir")
+    if tmp_dir:
+        safe_rmtree(Path(tmp_dir))
+    if job.get("audio_id"):
+        upload_release(job["audio_id"])
+
+
+def job_recover() -> Dict[str, int]:
+    """Startup pass over persisted jobs left queued/running by a previous process."""
+    counts = {"requeued": 0, "failed": 0}
+    for job_id, job in _STORE.items():
+        if job.get("status") not in ("queued", "running"):
+            continue
+        resume = _RESUMERS.get(job.get("type") or "")
+        input_path = job.get("input_path")
+        if _JOB_RECOVERY == "requeue" and resume is not None and input_path and Path(input_path).exists():
+            try:
+                _STORE.update(job_id, {"status": "queued", "progress": 0.0, "error": None})
+                resume(job_id, job)
+                counts["requeued"] += 1
+                continue
+            except Exception as e:
+                print(f"[jobs] requeue of {job_id} failed: {e}", flush=True)
+        _STORE.update(job_id, {"status": "failed", "error": "interrupted by server restart"})
+        _reclaim_files(job)
+        counts["failed"] += 1
+    if counts["requeued"] or counts["failed"]:
+        print(f"[jobs] recovery: {counts['requeued']} requeued, {counts['failed']} marked failed", flush=True)
+    return counts
+
+
+def _on_workspace_evicted(path: Path) -> None:
+    # the sweeper removed a finished job's directory under quota pressure: the result is gone
+    for job_id, job in _STORE.items():
+        if job.get("tmp_dir") and Path(job["tmp_dir"]) == path:
+            _STORE.update(job_id, {"status": "failed", "error": "result evicted to free workspace disk space", "tmp_dir": None, "audio_id": None})
+            _notify(job_id)
+            if job.get("audio_id"):
+                upload_release(job["audio_id"])
+
+
+workspace_on_evict(_on_workspace_evicted)
+
+
+def job_expire() -> int:
+    """Drop finished jobs nobody fetched within JOB_TTL_SECONDS and reclaim their files."""
+    expired = _STORE.expired(_JOB_TTL_SECONDS)
+    for job_id, job in expired:
+        _STORE.pop(job_id)
+        _reclaim_files(job)
+    return len(expired)
+
+
+def _expiry_loop(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            job_cancel_idle()
+            job_expire()
+            upload_expire()
+            workspace_sweep()
+        except Exception as e:
+            print(f"[jobs] expiry sweep failed: {e}", flush=True)
+
+
+_EXPIRY_STARTED = False
+
+
+def start_job_maintenance(interval: float = 60.0) -> None:
+    global _EXPIRY_STARTED
+    if _EXPIRY_STARTED:
+        return
+    _EXPIRY_STARTED = True
+    threading.Thread(target=_expiry_loop, args=(interval,), daemon=True).start()
+
+
+def close_job_store() -> None:
+    _STORE.close()
+
+
+# ---------------------------------------------------------------------------
+# Cancellation. Running work registers how to stop it (process groups started
+# through services.ffmpeg, Demucs worker pids); job_cancel runs those hooks,
+# frees the scheduler slot and reclaims the job's files right away.
+# ---------------------------------------------------------------------------
+
+class JobCancelled(Exception):
+    pass
+
+
+_CANCEL_LOCK = threading.Lock()
+_CANCEL_HOOKS: Dict[str, List[Callable[[], None]]] = {}
+_CANCELLED: set = set()
+_LAST_SEEN: Dict[str, float] = {}
+
+
+def _run_hook(hook: Callable[[], None]) -> None:
+    try:
+        hook()
+    except Exception as e:
+        print(f"[jobs] cancel hook failed: {e}", flush=True)
+
+
+def job_add_cancel_hook(job_id: str, hook: Callable[[], None]) -> None:
+    """Register how to stop part of a running job; runs at once if the job was already cancelled."""
+    with _CANCEL_LOCK:
+        if job_id not in _CANCELLED:
+            _CANCEL_HOOKS.setdefault(job_id, []).append(hook)
+            return
+    _run_hook(hook)
+
+
+def job_process_started(job_id: str) -> Callable[[int], None]:
+    """on_start callback for run_process: the child's process group is killed if the job is cancelled."""
+    return lambda pid: job_add_cancel_hook(job_id, lambda: kill_process_group(pid))
+
+
+def job_is_cancelled(job_id: str) -> bool:
+    return job_id in _CANCELLED
+
+
+def job_raise_if_cancelled(job_id: str) -> None:
+    if job_id in _CANCELLED:
+        raise JobCancelled(job_id)
+
+
+def job_touch(job_id: str) -> None:
+    """Record that a client is still interested in job_id (progress poll, new submission)."""
+    _LAST_SEEN[job_id] = time.time()
+
+
+def job_cancel(job_id: str, reason: str = "cancelled by user") -> Optional[Dict[str, Any]]:
+    """Cancel a queued or running job (a finished one is discarded). Returns the job as it was, or None."""
+    job = _STORE.get(job_id)
+    if job is None:
+        return None
+    _LAST_SEEN.pop(job_id, None)
+    if job.get("status") in TERMINAL_STATUSES:
+        # nothing left to stop: discard it the way expiry would
+        _STORE.pop(job_id)
+        _notify(job_id)
+        _reclaim_files(job)
+        return job
+    with _CANCEL_LOCK:
+        _CANCELLED.add(job_id)
+        hooks = _CANCEL_HOOKS.pop(job_id, [])
+    _STORE.update(job_id, {"status": "cancelled", "error": reason, "tmp_dir": None, "audio_id": None})
+    _notify(job_id)
+    for hook in hooks:
+        _run_hook(hook)
+    _unschedule(job_id)
+    _reclaim_files(job)
+    print(f"[jobs] {job_id} cancelled: {reason}", flush=True)
+    return job
+
+
+def job_cancel_idle() -> int:
+    if _JOB_IDLE_TIMEOUT_SECONDS <= 0:
+        return 0
+    now = time.time()
+    cancelled = 0
+    for job_id, seen in list(_LAST_SEEN.items()):
+        if now - seen <= _JOB_IDLE_TIMEOUT_SECONDS:
+            continue
+        job = _STORE.get(job_id)
+        if job is None or job.get("status") not in ("queued", "running"):
+            # finished jobs wait for their result fetch under JOB_TTL_SECONDS instead
+            _LAST_SEEN.pop(job_id, None)
+            continue
+        job_cancel(job_id, reason=f"no progress polls for {int(_JOB_IDLE_TIMEOUT_SECONDS)}s")
+        cancelled += 1
+    return cancelled
+
+
+# ---------------------------------------------------------------------------
+# Change notification for progress streams (SSE). Workers update jobs from
+# threads; every watcher is an asyncio.Event set on its own event loop.
+# ---------------------------------------------------------------------------
+
+_WATCH_LOCK = threading.Lock()
+_WATCHERS: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+_SSE_HEARTBEAT_SECONDS = 15.0
+
+
+def _notify(job_id: str) -> None:
+    with _WATCH_LOCK:
+        watchers = list(_WATCHERS.get(job_id, ()))
+    for loop, event in watchers:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # the watcher's loop is already closed
+
+
+async def job_sse_stream(job_id: str, snapshot: Callable[[Dict[str, Any]], Dict[str, Any]]) -> AsyncIterator[str]:
+    """Server-Sent Events for one job: snapshot(job) as JSON whenever it differs from the last event sent,
+    a comment line as keep-alive when nothing changed for a while. Ends after a terminal status or when
+    the job is discarded. An open stream counts as polling for the idle timeout."""
+    loop = asyncio.get_running_loop()
+    watcher = (loop, asyncio.Event())
+    with _WATCH_LOCK:
+        _WATCHERS.setdefault(job_id, []).append(watcher)
+    try:
+        yield "retry: 2000\n\n"
+        last = None
+        while True:
+            watcher[1].clear()
+            job = _STORE.get(job_id)
+            if job is None:
+                return
+            job_touch(job_id)
+            current = snapshot(job)
+            if current != last:
+                last = current
+                yield "data: " + json.dumps(current, ensure_ascii=False) + "\n\n"
+            if job.get("status") in TERMINAL_STATUSES:
+                return
+            try:
+                await asyncio.wait_for(watcher[1].wait(), _SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        with _WATCH_LOCK:
+            watchers = _WATCHERS.get(job_id, [])
+            if watcher in watchers:
+                watchers.remove(watcher)
+            if not watchers:
+                _WATCHERS.pop(job_id, None)
+
+
+def _job_finished(job_id: str) -> None:
+    with _CANCEL_LOCK:
+        _CANCEL_HOOKS.pop(job_id, None)
+        _CANCELLED.discard(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Scheduler: per-type queues with bounded concurrency. Higher priority runs
+# first; equal priorities run in submission (FIFO) order.
+# ---------------------------------------------------------------------------
+
+JOB_TYPES = ("render", "stems", "score", "lyrics")
+
+_CPU_COUNT = os.cpu_count() or 1
+_DEFAULT_LIMITS = {
+    "render": max(1, _CPU_COUNT // 4),
+    "stems": max(1, _CPU_COUNT // 8),
+    "score": max(1, _CPU_COUNT // 8),
+    "lyrics": max(1, _CPU_COUNT // 8),
+}
+# Initial per-type duration guesses (seconds) until real runs are observed.
+_DEFAULT_DURATIONS = {"render": 60.0, "stems": 180.0, "score": 240.0, "lyrics": 120.0}
+
+
+def _limit_from_env(job_type: str) -> int:
+    raw = os.environ.get(f"JOB_LIMIT_{job_type.upper()}")
+    try:
+        return max(1, int(raw)) if raw else _DEFAULT_LIMITS[job_type]
+    except ValueError:
+        return _DEFAULT_LIMITS[job_type]
+
+
+class _TypeQueue:
+    def __init__(self, job_type: str):
+        self.job_type = job_type
+        self.limit = _limit_from_env(job_type)
+        self.heap: List[Tuple[int, int, str, Callable[..., Any], tuple, dict, Future]] = []
+        self.running: Dict[str, float] = {}  # job_id -> start time
+        self.avg_duration = _DEFAULT_DURATIONS.get(job_type, 60.0)
+        self.completed = 0
+
+
+_QUEUES: Dict[str, _TypeQueue] = {t: _TypeQueue(t) for t in JOB_TYPES}
+_SCHED_LOCK = threading.Lock()
+_SEQ = itertools.count()
+# the queue job id of the slot running on this thread, for callers that have no job record (sync requests)
+_SLOT = threading.local()
+
+
+def job_submit(job_type: str, job_id: str, fn: Callable[..., Any], *args: Any, priority: int = 0, **kwargs: Any) -> Future:
+    """Queue fn(*args, **kwargs) under job_type. The returned Future resolves with its result."""
+    if job_type not in _QUEUES:
+        raise ValueError(f"unknown job type: {job_type}")
+    future: Future = Future()
+    with _SCHED_LOCK:
+        q = _QUEUES[job_type]
+        heapq.heappush(q.heap, (-int(priority), next(_SEQ), job_id, fn, args, kwargs, future))
+        _dispatch_locked(q)
+    return future
+
+
+def _dispatch_locked(q: _TypeQueue) -> None:
+    while q.heap and len(q.running) < q.limit:
+        _, _, job_id, fn, args, kwargs, future = heapq.heappop(q.heap)
+        if not future.set_running_or_notify_cancel():
+            continue
+        q.running[job_id] = time.time()
+        threading.Thread(target=_run_slot, args=(q, job_id, fn, args, kwargs, future), daemon=True).start()
+
+
+def _run_slot(q: _TypeQueue, job_id: str, fn: Callable[..., Any], args: tuple, kwargs: dict, future: Future) -> None:
+    _SLOT.job_id = job_id
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException as e:
+        future.set_exception(JobCancelled(job_id) if job_id in _CANCELLED else e)
+    else:
+        future.set_result(result)
+    finally:
+        _job_finished(job_id)
+        # the directory now only holds a result waiting to be fetched, which the sweeper may evict
+        tmp_dir = (_STORE.get(job_id) or {}).get("tmp_dir")
+        if tmp_dir:
+            release_temp_dir(Path(tmp_dir))
+        with _SCHED_LOCK:
+            started = q.running.pop(job_id, None)
+            if started is not None:
+                # exponential moving average keeps ETA estimates adaptive
+                q.avg_duration = 0.7 * q.avg_duration + 0.3 * (time.time() - started)
+                q.completed += 1
+            _dispatch_locked(q)
+
+
+def _unschedule(job_id: str) -> None:
+    # queued: drop it from the heap; running: give its slot to the next job now rather than when
+    # the worker thread notices its processes are gone
+    with _SCHED_LOCK:
+        for q in _QUEUES.values():
+            for item in [item for item in q.heap if item[2] == job_id]:
+                q.heap.remove(item)
+                heapq.heapify(q.heap)
+                item[6].cancel()
+                _job_finished(job_id)
+            if q.running.pop(job_id, None) is not None:
+                _dispatch_locked(q)
+
+
+def _find_queue_locked(job_id: str) -> Optional[_TypeQueue]:
+    for q in _QUEUES.values():
+        if job_id in q.running or any(item[2] == job_id for item in q.heap):
+            return q
+    return None
+
+
+def job_queue_info(job_id: str) -> Dict[str, Any]:
+    """Queue position (1-based, None once running) and an ETA in seconds until the job finishes."""
+    with _SCHED_LOCK:
+        q = _find_queue_locked(job_id)
+        if q is None:
+            return {"queue_position": None, "eta": None}
+        now = time.time()
+        if job_id in q.running:
+            progress = float((job_get(job_id) or {}).get("progress") or 0.0)
+            elapsed = now - q.running[job_id]
+            if progress >= 1.0:
+                eta = 0.0
+            elif progress > 0.0:
+                eta = elapsed * (1.0 - progress) / progress
+            else:
+                eta = max(0.0, q.avg_duration - elapsed)
+            return {"queue_position": None, "eta": round(eta, 1)}
+
+        # Simulate slots freeing up: running jobs finish after their expected remaining time,
+        # then each queued job ahead of us occupies the earliest free slot for avg_duration.
+        slots = sorted(max(0.0, q.avg_duration - (now - started)) for started in q.running.values())
+        slots += [0.0] * (q.limit - len(slots))
+        heapq.heapify(slots)
+        ordered = sorted(q.heap)
+        position = 0
+        for item in ordered:
+            position += 1
+            start_at = heapq.heappop(slots)
+            if item[2] == job_id:
+                return {"queue_position": position, "eta": round(start_at + q.avg_duration, 1)}
+            heapq.heappush(slots, start_at + q.avg_duration)
+        return {"queue_position": None, "eta": None}
+
+
+def job_cpu_budget(job_id: Optional[str] = None) -> int:
+    """Cores a job may fan out to (e.g. chunked pyin): the machine divided evenly among every job running
+    right now, of any type, counting the caller once. Without job_id the caller is the queue slot running
+    on this thread (a sync request submitted through job_submit), or an extra share when called outside
+    the queues. It is a snapshot for the caller's parallel section: jobs started later are not taken into
+    account, and each running job counts as one share whatever its own processes (ffmpeg, Demucs) use."""
+    caller = job_id or getattr(_SLOT, "job_id", None) or object()
+    with _SCHED_LOCK:
+        running = set()
+        for q in _QUEUES.values():
+            running.update(q.running)
+    running.add(caller)
+    return max(1, _CPU_COUNT // len(running))
 
 
+def job_scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    with _SCHED_LOCK:
+        return {
+            t: {
+                "limit": q.limit,
+                "running": len(q.running),
+                "queued": len(q.heap),
+                "completed": q.completed,
+                "avg_duration": round(q.avg_duration, 1),
+            }
+            for t, q in _QUEUES.items()
+        }
@@ -0,0 +1,356 @@
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from services.ffmpeg import resample_filter, stream_process_sync
+
+
+# ITU-R BS.1770-4 / EBU Tech 3341-3342 meter. Audio is decoded to 48 kHz float by ffmpeg and
+# consumed in chunks; the only per-track state kept is one K-weighted energy per 100 ms.
+SAMPLE_RATE = 48000
+_SUB_BLOCK = SAMPLE_RATE // 10  # 100 ms: hop of both momentary and short-term blocks
+_MOMENTARY_SUB_BLOCKS = 4  # 400 ms
+_SHORT_TERM_SUB_BLOCKS = 30  # 3 s
+_CHUNK_FRAMES = _SUB_BLOCK * 50  # 5 s of audio per read
+
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE_INTEGRATED = -10.0
+_RELATIVE_GATE_LRA = -20.0
+
+# K-weighting at 48 kHz: high-shelf pre-filter followed by the RLB high-pass (BS.1770-4 tables 1 and 2)
+_K_WEIGHTING_SOS = np.array([
+    [1.53512485958697, -2.69169618940638, 1.19839281085285, 1.0, -1.69065929318241, 0.73248077421585],
+    [1.0, -2.0, 1.0, 1.0, -1.99004745483398, 0.99007225036621],
+])
+
+# True-peak: 4x polyphase interpolation (BS.1770-4 annex 2 uses 48 taps, 12 per phase)
+_TP_OVERSAMPLE = 4
+_TP_TAPS = signal.firwin(48, 1.0 / _TP_OVERSAMPLE, window=("kaiser", 5.0)) * _TP_OVERSAMPLE
+_TP_HISTORY = len(_TP_TAPS) // _TP_OVERSAMPLE
+_TP_PHASES = _TP_TAPS.reshape(_TP_HISTORY, _TP_OVERSAMPLE).astype(np.float32)  # [j, p] = taps[4j + p]
+
+
+def _channel_weights(channels: int) -> np.ndarray:
+    # ffmpeg's 5.1 order is FL FR FC LFE BL BR; LFE is excluded and surrounds get +1.5 dB
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+def _loudness(energy):
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10.0 * np.log10(energy)
+
+
+def _parse_wav_header(data: bytes) -> Optional[Tuple[int, int]]:
+    """(channels, offset of the sample data) of a streamed WAV, or None until enough bytes have arrived."""
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise RuntimeError("ffmpeg did not produce a WAV stream")
+    channels = 0
+    pos = 12
+    while len(data) >= pos + 8:
+        chunk_id, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        if chunk_id == b"data":
+            if not channels:
+                raise RuntimeError("WAV stream has no fmt chunk")
+            return channels, pos + 8
+        end = pos + 8 + size + (size & 1)
+        if len(data) < end:
+            return None
+        if chunk_id == b"fmt ":
+            channels = struct.unpack("<H", data[pos + 10:pos + 12])[0]
+        pos = end
+    return None
+
+
+class _Meter:
+    def __init__(self, channels: int):
+        self.weights = _channel_weights(channels)
+        self.zi = np.zeros((_K_WEIGHTING_SOS.shape[0], 2, channels))
+        self.carry = np.zeros((0, channels))
+        self.energies: List[np.ndarray] = []
+        self.tp_history = np.zeros((_TP_HISTORY, channels))
+        self.peak = 0.0
+        self.frames = 0
+
+    def feed(self, x: np.ndarray) -> None:
+        self.frames += len(x)
+        y, self.zi = signal.sosfilt(_K_WEIGHTING_SOS, x, axis=0, zi=self.zi)
+        y = np.concatenate([self.carry, y]) if len(self.carry) else y
+        full = len(y) // _SUB_BLOCK
+        if full:
+            mean_square = np.square(y[: full * _SUB_BLOCK]).reshape(full, _SUB_BLOCK, -1).mean(axis=1)
+            self.energies.append(mean_square @ self.weights)
+        self.carry = y[full * _SUB_BLOCK:]
+        self._true_peak(x)
+
+    def _true_peak(self, x: np.ndarray) -> None:
+        # polyphase form of the 4x interpolator: phase p at input m is sum_j taps[4j + p] * x[m - j].
+        # The carried history gives every output its full 12-sample neighbourhood across chunk edges.
+        padded = np.concatenate([self.tp_history, x])
+        if len(padded) >= _TP_HISTORY:
+            # one small matmul per channel; float32 is ample for a peak reported to 0.01 dB
+            for channel in np.ascontiguousarray(padded.T, dtype=np.float32):
+                windows = sliding_window_view(channel, _TP_HISTORY)[:, ::-1]
+                self.peak = max(self.peak, float(np.abs(windows @ _TP_PHASES).max()))
+        if len(x):
+            self.peak = max(self.peak, float(np.abs(x).max()))
+        self.tp_history = padded[-_TP_HISTORY:]
+
+    def finish(self) -> None:
+        # flush the interpolator tail against trailing silence
+        self._true_peak(np.zeros((_TP_HISTORY, self.tp_history.shape[1])))
+
+
+def _block_energies(sub_blocks: np.ndarray, length: int) -> np.ndarray:
+    if len(sub_blocks) < length:
+        return np.zeros(0)
+    return np.convolve(sub_blocks, np.ones(length) / length, mode="valid")
+
+
+def _gated_integrated(blocks: np.ndarray) -> Dict[str, float]:
+    above_abs = blocks[_loudness(blocks) > _ABSOLUTE_GATE]
+    if not len(above_abs):
+        # loudnorm reports the absolute gate as the threshold when nothing passes it
+        return {"integrated": float("-inf"), "threshold": _ABSOLUTE_GATE}
+    threshold = float(_loudness(above_abs.mean())) + _RELATIVE_GATE_INTEGRATED
+    gated = above_abs[_loudness(above_abs) > threshold]
+    return {"integrated": float(_loudness(gated.mean())) if len(gated) else float("-inf"), "threshold": threshold}
+
+
+def _loudness_range(short_term: np.ndarray) -> float:
+    above_abs = short_term[_loudness(short_term) > _ABSOLUTE_GATE]
+    if not len(above_abs):
+        return 0.0
+    threshold = float(_loudness(above_abs.mean())) + _RELATIVE_GATE_LRA
+    values = _loudness(above_abs)
+    values = values[values > threshold]
+    if not len(values):
+        return 0.0
+    low, high = np.percentile(values, [10, 95])
+    return float(high - low)
+
+
+def _curve(blocks: np.ndarray) -> List[Optional[float]]:
+    values = _loudness(blocks)
+    return [round(float(v), 2) if v > _ABSOLUTE_GATE else None for v in values]
+
+
+def _fmt(value: float) -> str:
+    return "%.2f" % value if np.isfinite(value) else ("-inf" if value < 0 else "inf")
+
+
+def measure_loudness(
+    ffmpeg_exe: str,
+    input_path: Path,
+    target_i: float = -14.0,
+    target_tp: float = -1.5,
+    target_lra: float = 11.0,
+    include_curves: bool = True,
+    include_blocks: bool = False,
+) -> Dict[str, Any]:
+    """Integrated loudness, LRA and true-peak in the loudnorm print_format=json shape (string values),
+    plus momentary/short-term curves at a 100 ms hop when include_curves is set. output_* and
+    target_offset are only filled in when loudnorm's second pass would be linear.
+
+    include_blocks adds "gating_blocks", the 400 ms block energies above the absolute gate, which
+    album_loudness() pools across tracks."""
+    cmd = [
+        ffmpeg_exe, "-v", "error", "-i", str(input_path),
+        "-vn", "-map_metadata", "-1", "-af", resample_filter(SAMPLE_RATE),
+        "-c:a", "pcm_f32le", "-f", "wav", "-flush_packets", "0", "-",
+    ]
+    meter: Optional[_Meter] = None
+    channels = 0
+    pending = bytearray()
+
+    def _feed(final: bool = False) -> None:
+        # the pipe delivers ~64 KiB reads; the meter runs on _CHUNK_FRAMES at a time
+        frame_bytes = 4 * channels
+        usable = len(pending) // frame_bytes * frame_bytes
+        if usable and (final or usable >= _CHUNK_FRAMES * frame_bytes):
+            meter.feed(np.frombuffer(bytes(pending[:usable]), dtype="<f4").reshape(-1, channels).astype(np.float64))
+            del pending[:usable]
+
+    # a non-zero ffmpeg exit (e.g. an undecodable input) surfaces as RuntimeError with its stderr tail
+    chunks = stream_process_sync(cmd)
+    try:
+        for data in chunks:
+            pending += data
+            if meter is None:
+                header = _parse_wav_header(bytes(pending))
+                if header is None:
+                    continue
+                channels, offset = header
+                meter = _Meter(channels)
+                del pending[:offset]
+            _feed()
+    finally:
+        chunks.close()
+    if meter is None:
+        raise RuntimeError("WAV stream ended before the data chunk")
+    _feed(final=True)
+    meter.finish()
+
+    sub_blocks = np.concatenate(meter.energies) if meter.energies else np.zeros(0)
+    momentary = _block_energies(sub_blocks, _MOMENTARY_SUB_BLOCKS)
+    short_term = _block_energies(sub_blocks, _SHORT_TERM_SUB_BLOCKS)
+    gated = _gated_integrated(momentary)
+    input_i = gated["integrated"]
+    input_tp = 20.0 * np.log10(meter.peak) if meter.peak > 0 else float("-inf")
+    input_lra = _loudness_range(short_term)
+
+    # What loudnorm's linear second pass will produce: a plain gain, unless it would push
+    # the true peak over target_tp or the range exceeds target_lra (then loudnorm goes dynamic).
+    # loudnorm ignores offset in linear mode; in dynamic mode the output depends on its own limiter
+    # and gain control, which this meter does not model, so output_* and target_offset are None
+    # and the second pass needs loudnorm's own first pass.
+    # loudnorm also refuses linear mode when the (printed) measurements hold its "nothing measured"
+    # sentinels: I 0, TP 99, threshold -70 (no block passed the gate), LRA 0 (silent or under 3 s).
+    gain = target_i - input_i if np.isfinite(input_i) else 0.0
+    measured = [float(_fmt(value)) for value in (input_i, input_tp, input_lra, gated["threshold"])]
+    sentinel = measured[0] == 0.0 or measured[1] == 99.0 or measured[2] == 0.0 or measured[3] == _ABSOLUTE_GATE
+    linear = bool(
+        np.isfinite(input_i) and np.isfinite(input_tp) and not sentinel
+        and input_tp + gain <= target_tp and input_lra <= target_lra
+    )
+    result: Dict[str, Any] = {
+        "input_i": _fmt(input_i),
+        "input_tp": _fmt(input_tp),
+        "input_lra": _fmt(input_lra),
+        "input_thresh": _fmt(gated["threshold"]),
+        "output_i": _fmt(input_i + gain) if linear else None,
+        "output_tp": _fmt(input_tp + gain) if linear else None,
+        "output_lra": _fmt(input_lra) if linear else None,
+        "output_thresh": _fmt(gated["threshold"] + gain) if linear else None,
+        "normalization_type": "linear" if linear else "dynamic",
+        "target_offset": _fmt(0.0) if linear else None,
+        "duration": round(meter.frames / float(SAMPLE_RATE), 3),
+    }
+    if include_curves:
+        result["curve_hop_seconds"] = _SUB_BLOCK / float(SAMPLE_RATE)
+        result["momentary"] = _curve(momentary)
+        result["short_term"] = _curve(short_term)
+    if include_blocks:
+        result["gating_blocks"] = momentary[_loudness(momentary) > _ABSOLUTE_GATE].astype(np.float32)
+    return result
+
+
+def album_loudness(block_sets: List[np.ndarray]) -> Dict[str, float]:
+    """Integrated loudness of several tracks played back to back: one gate over all their blocks."""
+    blocks = [np.asarray(b, dtype=np.float64) for b in block_sets if len(b)]
+    if not blocks:
+        return {"integrated": float("-inf"), "threshold": _ABSOLUTE_GATE}
+    return _gated_integrated(np.concatenate(blocks))
+
+
+# Batch measurement runs one track per worker process; the meter is numpy-bound and holds the GIL
+# for much of each chunk, so threads would not scale across cores.
+_WORKERS = max(1, int(os.environ.get("LOUDNESS_WORKERS", str(os.cpu_count() or 1))))
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def measure_loudness_batch(
+    ffmpeg_exe: str,
+    paths: List[Path],
+    target_i: float = -14.0,
+    target_tp: float = -1.5,
+    target_lra: float = 11.0,
+) -> List[Any]:
+    """measure_loudness(include_blocks=True) for every path in parallel; a failed track yields its exception."""
+    pool = _get_pool()
+    futures = [
+        pool.submit(measure_loudness, ffmpeg_exe, Path(p), target_i, target_tp, target_lra, False, True)
+        for p in paths
+    ]
+    results: List[Any] = []
+    broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            broken = True
+            results.append(RuntimeError("loudness worker process died"))
+        except Exception as e:
+            results.append(e)
+    if broken:
+        shutdown_loudness_pool()
+    return results
+
+
+def shutdown_loudness_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+# Pass-1 results keyed by content hash, engine and targets, so /audio/normalize can go straight
+# to the second pass. Entries are small (curves are not kept), so a plain LRU in memory suffices.
+_MEASUREMENT_ENTRIES = 512
+_MEASUREMENTS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_MEASUREMENTS_LOCK = threading.Lock()
+_MEASUREMENT_STATS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def measurement_id(audio_id: str, engine: str, target_i: float, target_tp: float, target_lra: float) -> str:
+    key = f"{audio_id}:{engine}:{float(target_i):.2f}:{float(target_tp):.2f}:{float(target_lra):.2f}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def measurement_put(mid: str, audio_id: str, engine: str, targets: Dict[str, float], measured: Dict[str, Any]) -> None:
+    entry = {
+        "audio_id": audio_id,
+        "engine": engine,
+        "targets": dict(targets),
+        "measured": {k: v for k, v in measured.items() if k not in ("momentary", "short_term", "gating_blocks")},
+    }
+    with _MEASUREMENTS_LOCK:
+        _MEASUREMENTS[mid] = entry
+        _MEASUREMENTS.move_to_end(mid)
+        while len(_MEASUREMENTS) > _MEASUREMENT_ENTRIES:
+            _MEASUREMENTS.popitem(last=False)
+
+
+def measurement_get(mid: str) -> Optional[Dict[str, Any]]:
+    with _MEASUREMENTS_LOCK:
+        entry = _MEASUREMENTS.get(mid or "")
+        _MEASUREMENT_STATS["hits" if entry is not None else "misses"] += 1
+        if entry is None:
+            return None
+        _MEASUREMENTS.move_to_end(mid)
+        return {**entry, "measured": dict(entry["measured"]), "targets": dict(entry["targets"])}
+
+
+def measurement_cache_stats() -> Dict[str, float]:
+    with _MEASUREMENTS_LOCK:
+        lookups = _MEASUREMENT_STATS["hits"] + _MEASUREMENT_STATS["misses"]
+        return {
+            "entries": len(_MEASUREMENTS),
+            "hits": _MEASUREMENT_STATS["hits"],
+            "misses": _MEASUREMENT_STATS["misses"],
+            "hit_ratio": (_MEASUREMENT_STATS["hits"] / lookups) if lookups else 0.0,
+        }
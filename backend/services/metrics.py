@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Stage latencies span sub-second uploads to half-hour renders.
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+_HISTOGRAMS: Dict[str, Dict[str, Any]] = {}
+_LOCK = threading.Lock()
+_STARTED_AT = time.time()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record one duration for a pipeline stage (upload, decode, demucs, pyin, whisper, encode, zip, ...)."""
+    index = bisect_left(_BUCKETS, seconds)
+    with _LOCK:
+        hist = _HISTOGRAMS.get(stage)
+        if hist is None:
+            hist = _HISTOGRAMS[stage] = {"buckets": [0] * (len(_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        hist["buckets"][index] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time the enclosed block into the stage histogram; failed attempts are recorded too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{text}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Exposition:
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels: Any) -> None:
+        self.lines.append(f"{name}{_labels(**labels)} {_number(value)}")
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _stage_histograms(out: _Exposition) -> None:
+    with _LOCK:
+        snapshot = {stage: (list(h["buckets"]), h["sum"], h["count"]) for stage, h in _HISTOGRAMS.items()}
+    out.family("sound_wave_stage_duration_seconds", "histogram", "Wall time of pipeline stages")
+    for stage in sorted(snapshot):
+        buckets, total, count = snapshot[stage]
+        cumulative = 0
+        for bound, n in zip(_BUCKETS + (float("inf"),), buckets):
+            cumulative += n
+            out.sample("sound_wave_stage_duration_seconds_bucket", cumulative, stage=stage, le=_number(bound))
+        out.sample("sound_wave_stage_duration_seconds_sum", round(total, 6), stage=stage)
+        out.sample("sound_wave_stage_duration_seconds_count", count, stage=stage)
+
+
+def _rusage(out: _Exposition) -> None:
+    if resource is None:
+        return
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    usages = {"self": resource.getrusage(resource.RUSAGE_SELF), "children": resource.getrusage(resource.RUSAGE_CHILDREN)}
+    out.family("sound_wave_cpu_seconds_total", "counter", "CPU time of the server and of its reaped subprocesses (ffmpeg, MuseScore, workers)")
+    for scope, usage in usages.items():
+        out.sample("sound_wave_cpu_seconds_total", round(usage.ru_utime, 3), scope=scope, mode="user")
+        out.sample("sound_wave_cpu_seconds_total", round(usage.ru_stime, 3), scope=scope, mode="system")
+    out.family("sound_wave_max_rss_bytes", "gauge", "Peak resident set size (children: largest single reaped subprocess)")
+    for scope, usage in usages.items():
+        out.sample("sound_wave_max_rss_bytes", usage.ru_maxrss * rss_scale, scope=scope)
+
+
+def _jobs(out: _Exposition) -> None:
+    from services.jobs import job_scheduler_stats
+
+    stats = job_scheduler_stats()
+    for name, key, kind, help_text in (
+        ("sound_wave_jobs_running", "running", "gauge", "Jobs currently holding an execution slot"),
+        ("sound_wave_jobs_queued", "queued", "gauge", "Jobs waiting for a slot"),
+        ("sound_wave_job_slots", "limit", "gauge", "Concurrent job limit"),
+        ("sound_wave_jobs_finished_total", "completed", "counter", "Jobs that left their slot since start"),
+    ):
+        out.family(name, kind, help_text)
+        for job_type in sorted(stats):
+            out.sample(name, stats[job_type][key], type=job_type)
+
+
+def _caches(out: _Exposition) -> None:
+    from services.loudness import measurement_cache_stats
+    from services.peaks import peaks_cache_stats
+    from services.stem_cache import stem_cache_stats
+    from services.uploads import upload_store_stats
+    from services.whisper_models import whisper_registry_stats
+
+    caches = {
+        "stems": stem_cache_stats(),
+        "peaks": peaks_cache_stats(),
+        "loudness": measurement_cache_stats(),
+        "whisper": whisper_registry_stats(),
+    }
+    uploads = upload_store_stats()
+    caches["uploads"] = {"hits": uploads.get("deduplicated", 0), "misses": uploads.get("ingested", 0)}
+    out.family("sound_wave_cache_hits_total", "counter", "Cache lookups served from cache")
+    for cache in sorted(caches):
+        out.sample("sound_wave_cache_hits_total", caches[cache]["hits"], cache=cache)
+    out.family("sound_wave_cache_misses_total", "counter", "Cache lookups that had to compute")
+    for cache in sorted(caches):
+        out.sample("sound_wave_cache_misses_total", caches[cache]["misses"], cache=cache)
+    out.family("sound_wave_cache_hit_ratio", "gauge", "hits / (hits + misses) since start")
+    for cache in sorted(caches):
+        lookups = caches[cache]["hits"] + caches[cache]["misses"]
+        out.sample("sound_wave_cache_hit_ratio", round(caches[cache]["hits"] / lookups, 4) if lookups else 0.0, cache=cache)
+    out.family("sound_wave_cache_bytes", "gauge", "Bytes held on disk")
+    out.sample("sound_wave_cache_bytes", caches["stems"]["bytes"], cache="stems")
+    out.sample("sound_wave_cache_bytes", uploads["bytes"], cache="uploads")
+
+
+def _storage(out: _Exposition) -> None:
+    from services.separation import separation_engine_stats
+    from services.workspace import workspace_stats
+
+    work = workspace_stats()
+    out.family("sound_wave_workspace_bytes", "gauge", "Bytes in tracked temp workspaces (as of the last sweep)")
+    out.sample("sound_wave_workspace_bytes", work["bytes"])
+    out.family("sound_wave_workspace_directories", "gauge", "Tracked temp workspaces")
+    out.sample("sound_wave_workspace_directories", work["active"], state="active")
+    out.sample("sound_wave_workspace_directories", work["directories"] - work["active"], state="idle")
+    out.family("sound_wave_workspace_rejected_total", "counter", "Heavy requests refused with 503 for lack of workspace")
+    out.sample("sound_wave_workspace_rejected_total", work["rejected"])
+    out.family("sound_wave_disk_free_bytes", "gauge", "Free space on the workspace filesystem")
+    out.sample("sound_wave_disk_free_bytes", work["free_bytes"])
+
+    engine = separation_engine_stats()
+    out.family("sound_wave_separation_workers", "gauge", "Demucs worker processes configured / busy")
+    out.sample("sound_wave_separation_workers", engine["workers"], state="configured")
+    out.sample("sound_wave_separation_workers", engine["active"], state="busy")
+
+
+def metrics_text() -> str:
+    """Prometheus text exposition (format 0.0.4) of everything the services count."""
+    out = _Exposition()
+    out.family("sound_wave_uptime_seconds", "gauge", "Seconds since the server process started")
+    out.sample("sound_wave_uptime_seconds", round(time.time() - _STARTED_AT, 1))
+    out.family("sound_wave_cpu_count", "gauge", "CPU cores visible to the server")
+    out.sample("sound_wave_cpu_count", os.cpu_count() or 1)
+    _stage_histograms(out)
+    _jobs(out)
+    _caches(out)
+    _storage(out)
+    _rusage(out)
+    return out.text()
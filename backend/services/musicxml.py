@@ -0,0 +1,218 @@
+import hashlib
+import importlib
+import importlib.util
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.notes import NoteEvent
+
+
+# Writes MusicXML straight from note events (start, end, midi): quantize to a beat grid, split at barlines
+# with ties, fill gaps with rests. music21 is only needed for the optional high-fidelity path.
+
+_DOCTYPE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+    '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+    '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+)
+_STEPS = (("C", 0), ("C", 1), ("D", 0), ("D", 1), ("E", 0), ("F", 0), ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("A", 1), ("B", 0))
+# (type, length in quarter notes), longest first
+_NOTE_TYPES = (("whole", 4.0), ("half", 2.0), ("quarter", 1.0), ("eighth", 0.5), ("16th", 0.25), ("32nd", 0.125))
+
+_MUSIC21_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+_MUSIC21_CACHE_SIZE = 16
+_MUSIC21_LOCK = threading.Lock()
+
+
+def _spellings(divisions: int) -> List[Tuple[int, str, bool]]:
+    """(duration in divisions, type, dotted) for every note value the grid can express, longest first."""
+    out = []
+    for name, quarters in _NOTE_TYPES:
+        for dotted, factor in ((True, 1.5), (False, 1.0)):
+            length = quarters * factor * divisions
+            if length >= 1 and float(length).is_integer():
+                out.append((int(length), name, dotted))
+    return sorted(out, key=lambda item: -item[0])
+
+
+def _split_value(length: int, spellings: List[Tuple[int, str, bool]]) -> List[Tuple[int, str, bool]]:
+    # greedy: 5 sixteenths -> quarter + 16th; the grid unit is always the last spelling, so this terminates
+    pieces = []
+    for value, name, dotted in spellings:
+        while length >= value:
+            pieces.append((value, name, dotted))
+            length -= value
+    return pieces
+
+
+def _pitch(midi: int) -> Tuple[str, int, int]:
+    step, alter = _STEPS[midi % 12]
+    return step, alter, midi // 12 - 1
+
+
+def quantize_events(events: Sequence[NoteEvent], seconds_per_unit: float) -> List[Tuple[int, int, int]]:
+    """Snap (start, end, midi) events to grid units: (start, end, midi) with end > start, in order and
+    without overlaps (a note that would start before the previous one ends is shortened or dropped)."""
+    out: List[Tuple[int, int, int]] = []
+    cursor = 0
+    for start, end, midi in sorted(events):
+        begin = max(cursor, int(round(start / seconds_per_unit)))
+        stop = int(round(end / seconds_per_unit))
+        if stop <= begin:
+            continue
+        out.append((begin, stop, int(midi)))
+        cursor = stop
+    return out
+
+
+def _append_note(measure: ET.Element, length: int, name: str, dotted: bool, midi: Optional[int], tie_start: bool, tie_stop: bool, accidental: Optional[str] = None) -> None:
+    note = ET.SubElement(measure, "note")
+    if midi is None:
+        ET.SubElement(note, "rest")
+    else:
+        step, alter, octave = _pitch(midi)
+        pitch = ET.SubElement(note, "pitch")
+        ET.SubElement(pitch, "step").text = step
+        if alter:
+            ET.SubElement(pitch, "alter").text = str(alter)
+        ET.SubElement(pitch, "octave").text = str(octave)
+    ET.SubElement(note, "duration").text = str(length)
+    for kind, on in (("stop", tie_stop), ("start", tie_start)):
+        if on:
+            ET.SubElement(note, "tie", type=kind)
+    ET.SubElement(note, "voice").text = "1"
+    ET.SubElement(note, "type").text = name
+    if dotted:
+        ET.SubElement(note, "dot")
+    if accidental:
+        ET.SubElement(note, "accidental").text = accidental
+    if tie_start or tie_stop:
+        notations = ET.SubElement(note, "notations")
+        for kind, on in (("stop", tie_stop), ("start", tie_start)):
+            if on:
+                ET.SubElement(notations, "tied", type=kind)
+
+
+def events_to_musicxml(
+    events: Sequence[NoteEvent],
+    tempo_bpm: float = 120.0,
+    beats: int = 4,
+    beat_type: int = 4,
+    divisions: int = 4,
+    title: str = "Vocal Melody",
+) -> str:
+    """Single-part MusicXML 4.0 (score-partwise) for monophonic note events. divisions is the grid per
+    quarter note (4 = sixteenths); times are read at tempo_bpm, the tempo the MIDI file is written with."""
+    spellings = _spellings(divisions)
+    measure_units = beats * divisions * 4 // beat_type
+    notes = quantize_events(events, 60.0 / tempo_bpm / divisions)
+    total_units = notes[-1][1] if notes else 0
+    n_measures = max(1, -(-total_units // measure_units))
+
+    root = ET.Element("score-partwise", version="4.0")
+    ET.SubElement(ET.SubElement(root, "work"), "work-title").text = title
+    score_part = ET.SubElement(ET.SubElement(root, "part-list"), "score-part", id="P1")
+    ET.SubElement(score_part, "part-name").text = "Voice"
+    part = ET.SubElement(root, "part", id="P1")
+
+    # timeline of (start, end, midi or None) covering every measure; gaps become rests
+    timeline: List[Tuple[int, int, Optional[int]]] = []
+    cursor = 0
+    for begin, stop, midi in notes:
+        if begin > cursor:
+            timeline.append((cursor, begin, None))
+        timeline.append((begin, stop, midi))
+        cursor = stop
+    if cursor < n_measures * measure_units:
+        timeline.append((cursor, n_measures * measure_units, None))
+
+    pitches = sorted(midi for _, _, midi in notes)
+    low_voice = bool(pitches) and pitches[len(pitches) // 2] < 55  # median below G3: bass clef
+
+    measures = [ET.SubElement(part, "measure", number=str(i + 1)) for i in range(n_measures)]
+    attributes = ET.SubElement(measures[0], "attributes")
+    ET.SubElement(attributes, "divisions").text = str(divisions)
+    ET.SubElement(ET.SubElement(attributes, "key"), "fifths").text = "0"
+    time_el = ET.SubElement(attributes, "time")
+    ET.SubElement(time_el, "beats").text = str(beats)
+    ET.SubElement(time_el, "beat-type").text = str(beat_type)
+    clef = ET.SubElement(attributes, "clef")
+    ET.SubElement(clef, "sign").text = "F" if low_voice else "G"
+    ET.SubElement(clef, "line").text = "4" if low_voice else "2"
+    direction = ET.SubElement(measures[0], "direction", placement="above")
+    metronome = ET.SubElement(ET.SubElement(direction, "direction-type"), "metronome")
+    ET.SubElement(metronome, "beat-unit").text = "quarter"
+    ET.SubElement(metronome, "per-minute").text = str(int(round(tempo_bpm)))
+    ET.SubElement(direction, "sound", tempo=str(round(tempo_bpm, 2)))
+
+    # accidentals in effect per (measure, step, octave); C major, so everything starts natural
+    in_effect: Dict[Tuple[int, str, int], int] = {}
+    for begin, stop, midi in timeline:
+        # split at barlines, then into writable note values; sounding pieces are tied together
+        pieces: List[Tuple[int, int, str, bool]] = []
+        position = begin
+        while position < stop:
+            index = position // measure_units
+            segment_end = min(stop, (index + 1) * measure_units)
+            if midi is None and position % measure_units == 0 and segment_end - position == measure_units:
+                pieces.append((index, measure_units, "whole-measure", False))
+            else:
+                pieces.extend((index, value, name, dotted) for value, name, dotted in _split_value(segment_end - position, spellings))
+            position = segment_end
+        for i, (index, value, name, dotted) in enumerate(pieces):
+            if name == "whole-measure":
+                note = ET.SubElement(measures[index], "note")
+                ET.SubElement(note, "rest", measure="yes")
+                ET.SubElement(note, "duration").text = str(value)
+                ET.SubElement(note, "voice").text = "1"
+                continue
+            tied = midi is not None
+            accidental = None
+            if midi is not None and not (i > 0 and pieces[i - 1][0] == index):
+                step, alter, octave = _pitch(midi)
+                if in_effect.get((index, step, octave), 0) != alter:
+                    accidental = "sharp" if alter else "natural"
+                    in_effect[(index, step, octave)] = alter
+            _append_note(measures[index], value, name, dotted, midi, tied and i < len(pieces) - 1, tied and i > 0, accidental)
+
+    barline = ET.SubElement(measures[-1], "barline", location="right")
+    ET.SubElement(barline, "bar-style").text = "light-heavy"
+    ET.indent(root)
+    return _DOCTYPE + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def write_musicxml(events: Sequence[NoteEvent], path: Path, **options) -> Path:
+    """events_to_musicxml written to path (UTF-8)."""
+    Path(path).write_text(events_to_musicxml(events, **options), encoding="utf-8")
+    return Path(path)
+
+
+def music21_available() -> bool:
+    return importlib.util.find_spec("music21") is not None
+
+
+def music21_musicxml(midi_path: Path, path: Path) -> Path:
+    """High-fidelity path: music21's MIDI import and MusicXML export (its own quantization, beaming and
+    spelling). music21 is imported on first use, and the export is cached by MIDI content so retries and
+    repeated requests for the same melody skip the parse."""
+    data = Path(midi_path).read_bytes()
+    key = hashlib.sha256(data).hexdigest()
+    with _MUSIC21_LOCK:
+        cached = _MUSIC21_CACHE.get(key)
+        if cached is not None:
+            _MUSIC21_CACHE.move_to_end(key)
+    if cached is None:
+        converter = importlib.import_module("music21.converter")
+        score = converter.parse(str(midi_path))
+        score.write("musicxml", fp=str(path))
+        cached = Path(path).read_bytes()
+        with _MUSIC21_LOCK:
+            _MUSIC21_CACHE[key] = cached
+            while len(_MUSIC21_CACHE) > _MUSIC21_CACHE_SIZE:
+                _MUSIC21_CACHE.popitem(last=False)
+    else:
+        Path(path).write_bytes(cached)
+    return Path(path)
@@ -0,0 +1,120 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Median window over the pitch track; ~60 ms flattens pyin jitter without smearing note onsets.
+SMOOTH_MS = 60.0
+# A run keeps the previous note while its mean pitch stays within 0.5 + HYSTERESIS semitones of it,
+# so vibrato around a note boundary does not flip between neighbours.
+HYSTERESIS_SEMITONES = 0.3
+
+NoteEvent = Tuple[float, float, int]  # (start_seconds, end_seconds, midi_note)
+
+
+def hz_to_midi(f0: np.ndarray) -> np.ndarray:
+    """Fractional MIDI pitch for a whole f0 array; NaN where f0 is missing, zero or negative."""
+    f0 = np.asarray(f0, dtype=np.float64)
+    valid = np.isfinite(f0) & (f0 > 0)
+    out = np.full(f0.shape, np.nan)
+    out[valid] = 69.0 + 12.0 * np.log2(f0[valid] / 440.0)
+    return out
+
+
+def _nan_median(pitch: np.ndarray, width: int) -> np.ndarray:
+    # centred running median over voiced neighbours only; unvoiced frames stay NaN
+    if width <= 1 or pitch.size == 0:
+        return pitch
+    half = width // 2
+    windows = sliding_window_view(np.pad(pitch, half, constant_values=np.nan), width)
+    # sort puts NaN last: the median of the finite values sits at (count - 1) / 2
+    ordered = np.sort(windows, axis=1)
+    count = np.sum(np.isfinite(windows), axis=1)
+    rows = np.arange(len(pitch))
+    lo = ordered[rows, np.maximum(count - 1, 0) // 2]
+    hi = ordered[rows, np.maximum(count, 1) // 2]
+    smoothed = 0.5 * (lo + hi)
+    smoothed[np.isnan(pitch)] = np.nan
+    return smoothed
+
+
+def _runs(labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run-length encoding: (starts, lengths, values)."""
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(labels)])))
+    return starts, lengths, labels[starts]
+
+
+def _coalesce(starts: np.ndarray, lengths: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    keep = np.concatenate(([True], values[1:] != values[:-1]))
+    index = np.flatnonzero(keep)
+    return starts[index], np.add.reduceat(lengths, index), values[index]
+
+
+def _apply_hysteresis(values: np.ndarray, means: np.ndarray) -> np.ndarray:
+    # sequential by nature, but over runs (a few per note) rather than frames
+    margin = 0.5 + HYSTERESIS_SEMITONES
+    out = values.copy()
+    current = -1
+    for i, (value, mean) in enumerate(zip(values.tolist(), means.tolist())):
+        if value < 0:
+            current = -1
+        elif current < 0 or abs(mean - current) >= margin:
+            current = value
+        out[i] = current
+    return out
+
+
+def _absorb_short(lengths: np.ndarray, values: np.ndarray, min_frames: int) -> np.ndarray:
+    # a voiced run too short to be a note takes the pitch of its longer voiced neighbour
+    short = (values >= 0) & (lengths < min_frames)
+    if not short.any():
+        return values
+    prev_values = np.concatenate(([-1], values[:-1]))
+    next_values = np.concatenate((values[1:], [-1]))
+    prev_lengths = np.where(prev_values >= 0, np.concatenate(([0], lengths[:-1])), 0)
+    next_lengths = np.where(next_values >= 0, np.concatenate((lengths[1:], [0])), 0)
+    neighbour = np.where(prev_lengths >= next_lengths, prev_values, next_values)
+    absorb = short & ((prev_lengths > 0) | (next_lengths > 0))
+    return np.where(absorb, neighbour, values)
+
+
+def segment_notes(
+    f0: np.ndarray,
+    voiced_prob: Optional[np.ndarray],
+    hop_seconds: float,
+    voicing_thresh: float = 0.6,
+    min_note_ms: float = 120.0,
+) -> List[NoteEvent]:
+    """Turn a pitch track (e.g. librosa.pyin f0 and voiced probabilities) into note events.
+
+    Frames whose voiced probability is below voicing_thresh are rests. Voiced pitch is median-smoothed,
+    rounded to semitones, run-length encoded, held across vibrato by hysteresis, and runs shorter than
+    min_note_ms are merged into a neighbouring note or dropped.
+    """
+    pitch = hz_to_midi(f0)
+    if pitch.size == 0 or hop_seconds <= 0:
+        return []
+    if voiced_prob is not None:
+        # NaN probabilities compare False and count as unvoiced
+        pitch[~(np.asarray(voiced_prob, dtype=np.float64) >= voicing_thresh)] = np.nan
+    width = max(1, int(round(SMOOTH_MS / 1000.0 / hop_seconds))) | 1
+    smoothed = _nan_median(pitch, width)
+    voiced = np.isfinite(smoothed)
+    labels = np.where(voiced, np.rint(np.where(voiced, smoothed, 0.0)), -1).astype(np.int64)
+
+    starts, lengths, values = _runs(labels)
+    sums = np.add.reduceat(np.where(voiced, smoothed, 0.0), starts)
+    values = _apply_hysteresis(values, sums / lengths)
+    starts, lengths, values = _coalesce(starts, lengths, values)
+
+    min_frames = max(1, int(round(min_note_ms / 1000.0 / hop_seconds)))
+    values = _absorb_short(lengths, values, min_frames)
+    starts, lengths, values = _coalesce(starts, lengths, values)
+
+    keep = (values >= 0) & (lengths >= min_frames)
+    begin = starts[keep] * hop_seconds
+    end = (starts[keep] + lengths[keep]) * hop_seconds
+    return list(zip(begin.tolist(), end.tolist(), values[keep].tolist()))
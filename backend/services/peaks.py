@@ -0,0 +1,200 @@
+import os
+import struct
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.ffmpeg import stream_process_sync
+
+
+PEAKS_SAMPLE_RATE = 44100
+BASE_SAMPLES_PER_PIXEL = 256
+MAX_LEVELS = 14
+
+_CACHE_DIR = Path(os.environ.get("PEAKS_CACHE_DIR") or (Path(tempfile.gettempdir()) / "sound_wave_peaks"))
+_MEMORY_ENTRIES = 8
+
+_MEMORY: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def _minmax(samples: np.ndarray, spp: int) -> np.ndarray:
+    """(n, 2) int16 min/max per block of spp samples; a trailing partial block counts as one pixel."""
+    n_full = len(samples) // spp
+    parts = []
+    if n_full:
+        blocks = samples[: n_full * spp].reshape(n_full, spp)
+        parts.append(np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1))
+    if len(samples) % spp:
+        tail = samples[n_full * spp:]
+        parts.append(np.array([[tail.min(), tail.max()]], dtype=np.int16))
+    return np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.int16)
+
+
+def _halve(level: np.ndarray) -> np.ndarray:
+    if len(level) % 2:
+        level = np.concatenate([level, level[-1:]])
+    pairs = level.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+
+
+def _decode_level0(ffmpeg_exe: str, input_path: Path) -> np.ndarray:
+    # Stream mono s16 PCM from ffmpeg and reduce each chunk immediately, so memory stays
+    # bounded by the chunk size rather than the track length. -flush_packets 0 lets ffmpeg fill its
+    # output buffer instead of writing every packet to the pipe on its own.
+    cmd = [
+        ffmpeg_exe, "-v", "error", "-i", str(input_path),
+        "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE), "-f", "s16le", "-flush_packets", "0", "-",
+    ]
+    carry = b""
+    parts: List[np.ndarray] = []
+    # a non-zero ffmpeg exit surfaces as RuntimeError with its stderr tail once the stream ends
+    for data in stream_process_sync(cmd, chunk_size=BASE_SAMPLES_PER_PIXEL * 8192 * 2):
+        data = carry + data
+        usable = (len(data) // (BASE_SAMPLES_PER_PIXEL * 2)) * BASE_SAMPLES_PER_PIXEL * 2
+        carry = data[usable:]
+        if usable:
+            parts.append(_minmax(np.frombuffer(data[:usable], dtype="<i2"), BASE_SAMPLES_PER_PIXEL))
+    if len(carry) >= 2:
+        parts.append(_minmax(np.frombuffer(carry[: len(carry) // 2 * 2], dtype="<i2"), BASE_SAMPLES_PER_PIXEL))
+    return np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.int16)
+
+
+def _build_pyramid(level0: np.ndarray) -> List[np.ndarray]:
+    levels = [level0]
+    while len(levels) < MAX_LEVELS and len(levels[-1]) > 1:
+        levels.append(_halve(levels[-1]))
+    return levels
+
+
+def _cache_path(content_hash: str) -> Path:
+    return _CACHE_DIR / f"{content_hash}.npz"
+
+
+def _remember(content_hash: str, entry: Dict[str, Any]) -> None:
+    _MEMORY[content_hash] = entry
+    _MEMORY.move_to_end(content_hash)
+    while len(_MEMORY) > _MEMORY_ENTRIES:
+        _MEMORY.popitem(last=False)
+
+
+def _load(content_hash: str) -> Optional[Dict[str, Any]]:
+    with _LOCK:
+        entry = _MEMORY.get(content_hash)
+        if entry is not None:
+            _MEMORY.move_to_end(content_hash)
+            return entry
+    path = _cache_path(content_hash)
+    if not path.exists():
+        return None
+    with np.load(str(path)) as data:
+        count = int(data["level_count"])
+        entry = {
+            "sample_rate": int(data["sample_rate"]),
+            "levels": [np.array(data[f"level{i}"]) for i in range(count)],
+        }
+    with _LOCK:
+        _remember(content_hash, entry)
+    return entry
+
+
+def ensure_peaks(ffmpeg_exe: str, input_path: Path, content_hash: str) -> Dict[str, Any]:
+    """Decode once and cache the min/max pyramid under content_hash; returns its summary."""
+    entry = _load(content_hash)
+    with _LOCK:
+        _STATS["hits" if entry is not None else "misses"] += 1
+    if entry is None:
+        levels = _build_pyramid(_decode_level0(ffmpeg_exe, input_path))
+        entry = {"sample_rate": PEAKS_SAMPLE_RATE, "levels": levels}
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = _CACHE_DIR / f".{uuid.uuid4().hex}.npz"
+        arrays = {f"level{i}": lvl for i, lvl in enumerate(levels)}
+        np.savez(str(tmp), sample_rate=PEAKS_SAMPLE_RATE, level_count=len(levels), **arrays)
+        os.replace(tmp, _cache_path(content_hash))
+        with _LOCK:
+            _remember(content_hash, entry)
+    return peaks_summary(content_hash, entry)
+
+
+def peaks_summary(content_hash: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    levels = entry["levels"]
+    pixels = len(levels[0]) if levels else 0
+    return {
+        "audio_hash": content_hash,
+        "sample_rate": entry["sample_rate"],
+        "duration": pixels * BASE_SAMPLES_PER_PIXEL / float(entry["sample_rate"]),
+        "levels": [
+            {"samples_per_pixel": BASE_SAMPLES_PER_PIXEL << i, "length": len(lvl)}
+            for i, lvl in enumerate(levels)
+        ],
+    }
+
+
+def get_peaks_summary(content_hash: str) -> Optional[Dict[str, Any]]:
+    entry = _load(content_hash)
+    return peaks_summary(content_hash, entry) if entry is not None else None
+
+
+def render_peaks(
+    content_hash: str,
+    samples_per_pixel: int,
+    bits: int = 8,
+    start: float = 0.0,
+    end: Optional[float] = None,
+) -> Optional[bytes]:
+    """audiowaveform .dat (version 1) bytes for the requested zoom and optional [start, end) window."""
+    entry = _load(content_hash)
+    if entry is None:
+        return None
+    levels = entry["levels"]
+    sample_rate = entry["sample_rate"]
+    requested = max(BASE_SAMPLES_PER_PIXEL, int(samples_per_pixel))
+    # merge bins of a finer precomputed level into pixels of exactly `requested` samples: the coarsest level
+    # whose bins tile the pixels, else level 0 (a bin straddling a pixel boundary counts toward the pixel it
+    # starts in, so edges are off by under BASE_SAMPLES_PER_PIXEL samples)
+    index = 0
+    if requested % BASE_SAMPLES_PER_PIXEL == 0:
+        multiple = requested // BASE_SAMPLES_PER_PIXEL
+        index = min(len(levels) - 1, (multiple & -multiple).bit_length() - 1)
+    spp = BASE_SAMPLES_PER_PIXEL << index
+    level = levels[index]
+    total_pixels = -(-len(level) * spp // requested)
+    first = max(0, int(start * sample_rate) // requested)
+    last = total_pixels if end is None else min(total_pixels, -(-int(end * sample_rate) // requested))
+    if last > first:
+        bins = np.arange(first, last, dtype=np.int64) * requested // spp
+        window = level[bins[0]:min(len(level), -(-last * requested // spp))]
+        offsets = bins - bins[0]
+        if requested == spp:
+            data = window[:len(offsets)]
+        else:
+            data = np.stack([
+                np.minimum.reduceat(window[:, 0], offsets),
+                np.maximum.reduceat(window[:, 1], offsets),
+            ], axis=1)
+    else:
+        data = np.zeros((0, 2), dtype=np.int16)
+    if bits == 8:
+        payload = (data.astype(np.int16) >> 8).astype(np.int8)
+        flags = 1
+    else:
+        payload = data.astype("<i2")
+        flags = 0
+    header = struct.pack("<iIiiI", 1, flags, sample_rate, requested, len(payload))
+    return header + payload.tobytes()
+
+
+def peaks_cache_stats() -> Dict[str, float]:
+    with _LOCK:
+        lookups = _STATS["hits"] + _STATS["misses"]
+        return {
+            "hits": _STATS["hits"],
+            "misses": _STATS["misses"],
+            "hit_ratio": (_STATS["hits"] / lookups) if lookups else 0.0,
+        }
@@ -0,0 +1,379 @@
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# (f0 in Hz with NaN where the engine has no estimate, voiced probability 0..1, frame times in seconds),
+# all on the grid librosa uses for center=True framing: times[i] = i * hop_length / sr.
+PitchTrack = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+FMIN_HZ = 65.406  # C2
+FMAX_HZ = 2093.005  # C7
+DEFAULT_PITCH_ENGINE = "pyin"
+
+_ENGINES: Dict[str, Dict[str, Any]] = {}
+# frames quieter than this (-60 dBFS RMS) are never voiced for engines without a voicing model
+_SILENCE_RMS = 1e-3
+_PERIODICITY_CHUNK = 4096
+
+# Chunked pyin: 0 = as many workers as the caller's CPU budget allows.
+_PYIN_WORKERS = max(0, int(os.environ.get("PYIN_WORKERS", "0")))
+# pyin's Viterbi pass needs context on both sides of a cut before its path settles; each chunk is
+# decoded with this much extra audio and the stitch point is chosen inside that overlap.
+_PYIN_OVERLAP_SECONDS = float(os.environ.get("PYIN_OVERLAP_SECONDS", "3"))
+# Shorter signals (or chunks) are not worth the process round trip.
+_PYIN_MIN_CHUNK_SECONDS = float(os.environ.get("PYIN_MIN_CHUNK_SECONDS", "20"))
+# Tracks within this many cents (or both unvoiced) count as agreeing at a candidate stitch frame.
+_STITCH_CENTS = 50.0
+# How often a chunked run checks its cancel event while waiting for workers.
+_CANCEL_POLL_SECONDS = 0.25
+
+
+class PitchCancelled(RuntimeError):
+    pass
+
+
+def register_pitch_engine(name: str, fn: Callable[..., PitchTrack], requires: Sequence[str] = (), description: str = "") -> None:
+    """fn(y, sr, hop_length, frame_length, fmin, fmax, workers, cancel) -> PitchTrack; requires lists
+    importable modules. workers is the number of cores the caller can spare and cancel an optional
+    threading.Event that asks the engine to give up early (raising PitchCancelled); engines may ignore both."""
+    _ENGINES[name] = {"fn": fn, "requires": tuple(requires), "description": description}
+
+
+def pitch_engine_available(name: str) -> bool:
+    engine = _ENGINES.get(name)
+    return engine is not None and all(importlib.util.find_spec(mod) is not None for mod in engine["requires"])
+
+
+def pitch_engines() -> List[Dict[str, Any]]:
+    return [
+        {"id": name, "description": engine["description"], "available": pitch_engine_available(name)}
+        for name, engine in _ENGINES.items()
+    ]
+
+
+def track_pitch(
+    y: np.ndarray,
+    sr: int,
+    engine: str = DEFAULT_PITCH_ENGINE,
+    hop_length: int = 256,
+    frame_length: int = 2048,
+    fmin: float = FMIN_HZ,
+    fmax: float = FMAX_HZ,
+    workers: int = 1,
+    cancel: Optional[threading.Event] = None,
+) -> PitchTrack:
+    """Run one registered backend on up to workers cores. Raises ValueError for an unknown engine,
+    RuntimeError when its dependencies are missing, PitchCancelled when cancel was set and the engine
+    stopped early."""
+    if engine not in _ENGINES:
+        raise ValueError(f"unknown pitch engine: {engine} (choose from {', '.join(_ENGINES)})")
+    if not pitch_engine_available(engine):
+        raise RuntimeError(f"pitch engine {engine} needs {', '.join(_ENGINES[engine]['requires'])}")
+    f0, voiced_prob, times = _ENGINES[engine]["fn"](np.asarray(y, dtype=np.float32), sr, hop_length, frame_length, fmin, fmax, max(1, int(workers)), cancel)
+    return np.asarray(f0, dtype=np.float64), np.asarray(voiced_prob, dtype=np.float64), np.asarray(times, dtype=np.float64)
+
+
+def _frame_times(n_frames: int, sr: int, hop_length: int) -> np.ndarray:
+    return np.arange(n_frames) * (hop_length / sr)
+
+
+def _centered_frames(y: np.ndarray, frame_length: int, hop_length: int) -> np.ndarray:
+    # (n_frames, frame_length) view matching librosa's center=True framing (1 + len(y) // hop frames)
+    padded = np.pad(y, frame_length // 2)
+    return sliding_window_view(padded, frame_length)[::hop_length]
+
+
+def periodicity(y: np.ndarray, sr: int, f0: np.ndarray, hop_length: int, frame_length: int, fmin: float = FMIN_HZ) -> np.ndarray:
+    """Normalized autocorrelation of every frame at its own f0 lag (1 = perfectly periodic), computed for
+    blocks of frames at once; NaN/silent frames get 0."""
+    frames = _centered_frames(np.asarray(y, dtype=np.float32), frame_length, hop_length)
+    n = min(len(frames), len(f0))
+    out = np.zeros(len(f0))
+    # YIN's integration window: half a frame, leaving the other half for lags
+    width = frame_length // 2
+    max_lag = min(frame_length - width, int(np.ceil(sr / fmin)))
+    offsets = np.arange(width)[None, :]
+    valid_f0 = np.isfinite(f0[:n]) & (f0[:n] > 0)
+    lags = np.where(valid_f0, np.rint(sr / np.where(valid_f0, f0[:n], 1.0)), 0).astype(np.int64)
+    lags = np.clip(lags, 1, max_lag)
+    for start in range(0, n, _PERIODICITY_CHUNK):
+        block = frames[start:start + _PERIODICITY_CHUNK]
+        head = block[:, :width]
+        shifted = np.take_along_axis(block, offsets + lags[start:start + len(block), None], axis=1)
+        energy = np.sqrt(np.einsum("ij,ij->i", head, head) * np.einsum("ij,ij->i", shifted, shifted))
+        corr = np.einsum("ij,ij->i", head, shifted) / np.maximum(energy, 1e-12)
+        rms = np.sqrt(np.einsum("ij,ij->i", block, block) / frame_length)
+        corr[rms < _SILENCE_RMS] = 0.0
+        out[start:start + len(block)] = corr
+    out[:n][~valid_f0] = 0.0
+    return np.clip(out, 0.0, 1.0)
+
+
+def _pyin_single(y: np.ndarray, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float) -> Tuple[np.ndarray, np.ndarray]:
+    import librosa
+
+    f0, _, voiced_prob = librosa.pyin(y, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length, hop_length=hop_length)
+    return f0, voiced_prob
+
+
+# ---------------------------------------------------------------------------
+# Chunked pyin: the signal is split on the frame grid into overlapping windows that worker processes
+# read from shared memory (no audio is pickled), and the per-chunk tracks are stitched in the overlaps.
+# ---------------------------------------------------------------------------
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        # grows when a caller gets a larger budget; concurrent jobs share the workers
+        if _POOL is None or _POOL_SIZE < workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _POOL_SIZE = workers
+        return _POOL
+
+
+def shutdown_pitch_pool() -> None:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+            _POOL_SIZE = 0
+
+
+def _pyin_chunk(shm_name: str, length: int, start: int, stop: int, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float) -> Tuple[np.ndarray, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        y = np.ndarray((length,), dtype=np.float32, buffer=shm.buf)
+        try:
+            return _pyin_single(y[start:stop], sr, hop_length, frame_length, fmin, fmax)
+        finally:
+            del y  # the buffer cannot be closed while a view of it is alive
+    finally:
+        shm.close()
+
+
+def _plan_chunks(n_frames: int, n_chunks: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """(core_start, core_stop, decode_start, decode_stop) frame ranges: equal cores, each decoded with
+    overlap frames of context on either side."""
+    bounds = np.linspace(0, n_frames, n_chunks + 1).astype(np.int64).tolist()
+    return [
+        (lo, hi, max(0, lo - overlap), min(n_frames, hi + overlap))
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def _stitch_point(left: Tuple[np.ndarray, np.ndarray], right: Tuple[np.ndarray, np.ndarray], left_start: int, right_start: int, lo: int, hi: int, boundary: int) -> int:
+    # frame in [lo, hi) where both chunks' tracks agree, nearest the nominal boundary
+    a = left[0][lo - left_start:hi - left_start]
+    b = right[0][lo - right_start:hi - right_start]
+    a_voiced = np.isfinite(a) & (a > 0)
+    b_voiced = np.isfinite(b) & (b > 0)
+    cents = np.full(len(a), np.inf)
+    both = a_voiced & b_voiced
+    cents[both] = np.abs(1200.0 * np.log2(a[both] / b[both]))
+    agree = np.flatnonzero((~a_voiced & ~b_voiced) | (cents <= _STITCH_CENTS))
+    if agree.size == 0:
+        return boundary
+    return lo + int(agree[np.argmin(np.abs(agree + lo - boundary))])
+
+
+def _stitch(chunks: List[Tuple[int, int, int, int]], tracks: List[Tuple[np.ndarray, np.ndarray]], n_frames: int) -> Tuple[np.ndarray, np.ndarray]:
+    cuts = [0]
+    for (_, _, left_start, left_stop), (lo, _, right_start, _), left, right in zip(chunks[:-1], chunks[1:], tracks[:-1], tracks[1:]):
+        cuts.append(_stitch_point(left, right, left_start, right_start, right_start, left_stop, lo))
+    cuts.append(n_frames)
+    f0 = np.full(n_frames, np.nan)
+    voiced_prob = np.zeros(n_frames)
+    for (_, _, decode_start, _), (chunk_f0, chunk_prob), begin, end in zip(chunks, tracks, cuts[:-1], cuts[1:]):
+        f0[begin:end] = chunk_f0[begin - decode_start:end - decode_start]
+        voiced_prob[begin:end] = chunk_prob[begin - decode_start:end - decode_start]
+    return f0, voiced_prob
+
+
+def _pyin_chunked(y: np.ndarray, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float, n_chunks: int, cancel: Optional[threading.Event] = None) -> Tuple[np.ndarray, np.ndarray]:
+    n_frames = 1 + len(y) // hop_length
+    overlap = min(int(round(_PYIN_OVERLAP_SECONDS * sr / hop_length)), n_frames // n_chunks // 2)
+    chunks = _plan_chunks(n_frames, n_chunks, overlap)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, y.nbytes))
+    try:
+        np.ndarray(y.shape, dtype=np.float32, buffer=shm.buf)[:] = y
+        pool = _get_pool(n_chunks)
+        futures = []
+        for _, _, decode_start, decode_stop in chunks:
+            start = decode_start * hop_length
+            # a chunk's last frame is centred on (decode_stop - 1) * hop and needs half a frame after it
+            stop = len(y) if decode_stop == n_frames else (decode_stop - 1) * hop_length + frame_length // 2
+            futures.append(pool.submit(_pyin_chunk, shm.name, len(y), start, stop, sr, hop_length, frame_length, fmin, fmax))
+        # the pool is shared with other jobs, so a cancel drops this job's queued chunks and stops waiting;
+        # chunks already running finish in their worker (at most one chunk each) and are discarded
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=_CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                for future in futures:
+                    future.cancel()
+                raise PitchCancelled("pitch tracking cancelled")
+        tracks = []
+        for future, (_, _, decode_start, decode_stop) in zip(futures, chunks):
+            chunk_f0, chunk_prob = future.result()
+            tracks.append((np.asarray(chunk_f0)[:decode_stop - decode_start], np.asarray(chunk_prob)[:decode_stop - decode_start]))
+    finally:
+        shm.close()
+        shm.unlink()
+    return _stitch(chunks, tracks, n_frames)
+
+
+def _pyin(y: np.ndarray, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float, workers: int = 1, cancel: Optional[threading.Event] = None) -> PitchTrack:
+    if _PYIN_WORKERS:
+        workers = min(workers, _PYIN_WORKERS)
+    n_frames = 1 + len(y) // hop_length
+    n_chunks = min(workers, int(len(y) / sr // _PYIN_MIN_CHUNK_SECONDS))
+    if n_chunks >= 2:
+        try:
+            f0, voiced_prob = _pyin_chunked(y, sr, hop_length, frame_length, fmin, fmax, n_chunks, cancel)
+            return f0, voiced_prob, _frame_times(n_frames, sr, hop_length)
+        except BrokenProcessPool:
+            shutdown_pitch_pool()
+            print("[pitch] pyin worker pool died; falling back to a single pass", flush=True)
+        except OSError as e:  # e.g. /dev/shm unavailable
+            print(f"[pitch] chunked pyin unavailable ({e}); falling back to a single pass", flush=True)
+    f0, voiced_prob = _pyin_single(y, sr, hop_length, frame_length, fmin, fmax)
+    return f0, voiced_prob, _frame_times(len(f0), sr, hop_length)
+
+
+def _yin(y: np.ndarray, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float, workers: int = 1, cancel: Optional[threading.Event] = None) -> PitchTrack:
+    import librosa
+
+    # YIN has no voicing decision of its own; periodicity at the detected lag stands in for pyin's probability
+    f0 = librosa.yin(y, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length, hop_length=hop_length)
+    return f0, periodicity(y, sr, f0, hop_length, frame_length, fmin), _frame_times(len(f0), sr, hop_length)
+
+
+def _crepe_tiny(y: np.ndarray, sr: int, hop_length: int, frame_length: int, fmin: float, fmax: float, workers: int = 1, cancel: Optional[threading.Event] = None) -> PitchTrack:
+    import librosa
+    import torch
+    import torchcrepe
+
+    # CREPE runs at 16 kHz with a 10 ms hop; results are interpolated back onto the common frame grid
+    crepe_sr, crepe_hop = 16000, 160
+    audio = librosa.resample(y, orig_sr=sr, target_sr=crepe_sr) if sr != crepe_sr else y
+    with torch.no_grad():
+        pitch, confidence = torchcrepe.predict(
+            torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32))[None, :],
+            crepe_sr,
+            hop_length=crepe_hop,
+            fmin=fmin,
+            fmax=min(fmax, torchcrepe.MAX_FMAX),
+            model="tiny",
+            return_periodicity=True,
+            batch_size=512,
+            device="cpu",
+        )
+        confidence = torchcrepe.filter.median(confidence, 3)
+    pitch = pitch[0].numpy().astype(np.float64)
+    confidence = confidence[0].numpy().astype(np.float64)
+    times = _frame_times(1 + len(y) // hop_length, sr, hop_length)
+    crepe_times = np.arange(len(pitch)) * (crepe_hop / crepe_sr)
+    f0 = np.exp2(np.interp(times, crepe_times, np.log2(np.maximum(pitch, 1e-6))))
+    return f0, np.clip(np.interp(times, crepe_times, confidence), 0.0, 1.0), times
+
+
+register_pitch_engine("pyin", _pyin, ("librosa",), "librosa.pyin (probabilistic YIN + HMM); reference quality, slowest (chunked across cores)")
+register_pitch_engine("yin", _yin, ("librosa",), "librosa.yin with vectorized periodicity voicing; many times faster than pyin")
+register_pitch_engine("crepe-tiny", _crepe_tiny, ("librosa", "torch", "torchcrepe"), "torchcrepe tiny model on CPU; robust to breathy/noisy vocals")
+
+
+def compare_pitch_tracks(reference: PitchTrack, candidate: PitchTrack, voicing_thresh: float = 0.6) -> Dict[str, float]:
+    """Frame-wise agreement with a reference track: raw pitch accuracy (within 50 cents on reference-voiced
+    frames), mean absolute error in cents there, voicing recall, voicing false alarm and overall accuracy."""
+    ref_f0, ref_prob, _ = reference
+    f0, prob, _ = candidate
+    n = min(len(ref_f0), len(f0))
+    ref_f0, ref_prob, f0, prob = ref_f0[:n], ref_prob[:n], f0[:n], prob[:n]
+    ref_voiced = np.isfinite(ref_f0) & (ref_f0 > 0) & (ref_prob >= voicing_thresh)
+    voiced = np.isfinite(f0) & (f0 > 0) & (prob >= voicing_thresh)
+    both = ref_voiced & np.isfinite(f0) & (f0 > 0)
+    cents = np.abs(1200.0 * np.log2(f0[both] / ref_f0[both])) if both.any() else np.zeros(0)
+    ref_count = max(1, int(ref_voiced.sum()))
+    unvoiced_count = max(1, int((~ref_voiced).sum()))
+    return {
+        "raw_pitch_accuracy": round(float(np.sum(cents <= 50.0)) / ref_count, 4),
+        "mean_abs_cents": round(float(cents.mean()), 1) if cents.size else None,
+        "voicing_recall": round(float(np.sum(voiced & ref_voiced)) / ref_count, 4),
+        "voicing_false_alarm": round(float(np.sum(voiced & ~ref_voiced)) / unvoiced_count, 4),
+        "overall_accuracy": round(float(np.mean(voiced == ref_voiced)) if n else 0.0, 4),
+    }
+
+
+def benchmark_pitch_engines(
+    y: np.ndarray,
+    sr: int,
+    engines: Optional[Sequence[str]] = None,
+    reference: str = DEFAULT_PITCH_ENGINE,
+    hop_length: int = 256,
+    voicing_thresh: float = 0.6,
+    workers: int = 1,
+) -> Dict[str, Any]:
+    """Time every available engine on the same audio and score it against a single-process run of the
+    reference engine (pyin). With workers > 1 the engines get that many cores, and the reference is also
+    run chunked and reported as "<reference>@<workers>"."""
+    duration = len(y) / float(sr)
+    names = [reference] + [name for name in (engines or list(_ENGINES)) if name != reference]
+    if workers > 1:
+        names.append(f"{reference}@{workers}")
+    results: Dict[str, Any] = {}
+    ref_track: Optional[PitchTrack] = None
+    ref_seconds = None
+    for name in names:
+        engine = name.split("@")[0]
+        if not pitch_engine_available(engine):
+            results[name] = {"available": False}
+            continue
+        started = time.perf_counter()
+        track = track_pitch(y, sr, engine=engine, hop_length=hop_length, workers=1 if name == reference else workers)
+        seconds = time.perf_counter() - started
+        entry: Dict[str, Any] = {
+            "available": True,
+            "seconds": round(seconds, 3),
+            "realtime_factor": round(duration / seconds, 2) if seconds > 0 else None,
+        }
+        if name == reference:
+            ref_track, ref_seconds = track, seconds
+        elif ref_track is not None:
+            entry["speedup_vs_reference"] = round(ref_seconds / seconds, 2) if seconds > 0 else None
+            entry.update(compare_pitch_tracks(ref_track, track, voicing_thresh))
+        results[name] = entry
+    return {"audio_seconds": round(duration, 2), "reference": reference, "engines": results}
+
+
+if __name__ == "__main__":
+    # python -m services.pitch vocals.wav [engine ...]   (PYIN_WORKERS=n to compare chunked pyin)
+    if len(sys.argv) < 2:
+        print("usage: python -m services.pitch <audio file> [engine ...]")
+        sys.exit(2)
+    import json
+
+    librosa = importlib.import_module("librosa")
+    samples, rate = librosa.load(sys.argv[1], sr=22050, mono=True)
+    cores = _PYIN_WORKERS or os.cpu_count() or 1
+    print(json.dumps(benchmark_pitch_engines(samples, rate, sys.argv[2:] or None, workers=cores), indent=2))
+    shutdown_pitch_pool()
@@ -0,0 +1,282 @@
+import multiprocessing
+import os
+import signal
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from services.metrics import stage_timer
+
+
+DEMUCS_MODELS = ("htdemucs", "htdemucs_ft")
+
+_MAX_WORKERS = max(1, int(os.environ.get("SEPARATION_WORKERS", "1")))
+_MAX_MODELS_PER_WORKER = max(1, int(os.environ.get("SEPARATION_MODELS_PER_WORKER", "2")))
+_DEVICE = os.environ.get("SEPARATION_DEVICE", "cpu")
+
+ProgressCallback = Callable[[float], None]
+
+
+# ---------------------------------------------------------------------------
+# Worker process side. Models stay loaded in _WORKER_MODELS for the lifetime
+# of the worker, so only the first job per worker pays for torch + weights.
+# ---------------------------------------------------------------------------
+
+_WORKER_MODELS: "OrderedDict[str, Any]" = OrderedDict()
+_WORKER_EVENTS = None
+_WORKER_TASK: Optional[str] = None
+
+
+def _worker_init(events, torch_threads: int) -> None:
+    global _WORKER_EVENTS
+    _WORKER_EVENTS = events
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except Exception:
+        pass
+    _install_progress_hook()
+
+
+def _emit(kind: str, value: Any) -> None:
+    if _WORKER_EVENTS is not None and _WORKER_TASK is not None:
+        try:
+            _WORKER_EVENTS.put((_WORKER_TASK, kind, value))
+        except Exception:
+            pass
+
+
+class _SegmentProgress:
+    """Stand-in for the tqdm module inside demucs.apply; reports each finished segment."""
+
+    def __init__(self):
+        self.bag_size = 1
+        self.bag_index = 0
+
+    def tqdm(self, iterable, **_kwargs):
+        items = list(iterable)
+        total = max(1, len(items))
+        for done, item in enumerate(items, start=1):
+            yield item
+            _emit("progress", (self.bag_index + done / total) / self.bag_size)
+        self.bag_index = min(self.bag_index + 1, self.bag_size - 1) if self.bag_size > 1 else 0
+
+
+_PROGRESS = _SegmentProgress()
+
+
+def _install_progress_hook() -> None:
+    try:
+        import demucs.apply as demucs_apply
+        demucs_apply.tqdm = _PROGRESS  # type: ignore[attr-defined]
+    except Exception:
+        pass
+
+
+def _worker_model(name: str):
+    model = _WORKER_MODELS.get(name)
+    if model is not None:
+        _WORKER_MODELS.move_to_end(name)
+        return model
+    from demucs.pretrained import get_model
+    model = get_model(name)
+    model.to(_DEVICE)
+    model.eval()
+    _WORKER_MODELS[name] = model
+    while len(_WORKER_MODELS) > _MAX_MODELS_PER_WORKER:
+        _WORKER_MODELS.popitem(last=False)
+    return model
+
+
+def _worker_separate(task_id: str, model_name: str, source: Any, samplerate: Optional[int], output_dir: Optional[str]):
+    global _WORKER_TASK
+    _WORKER_TASK = task_id
+    try:
+        import torch
+        from demucs.apply import apply_model, BagOfModels
+        from demucs.audio import AudioFile, convert_audio, save_audio
+
+        _emit("pid", os.getpid())
+        model = _worker_model(model_name)
+        if isinstance(source, (str, Path)):
+            wav = AudioFile(Path(source)).read(streams=0, samplerate=model.samplerate, channels=model.audio_channels)
+        else:
+            wav = torch.as_tensor(source, dtype=torch.float32)
+            if wav.dim() == 1:
+                wav = wav[None]
+            wav = convert_audio(wav, samplerate or model.samplerate, model.samplerate, model.audio_channels)
+
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        _PROGRESS.bag_size = len(model.models) if isinstance(model, BagOfModels) else 1
+        _PROGRESS.bag_index = 0
+        with torch.no_grad():
+            sources = apply_model(model, wav[None], device=_DEVICE, shifts=1, split=True, overlap=0.25, progress=True)[0]
+        sources = sources * ref.std() + ref.mean()
+
+        if output_dir is None:
+            return {name: src.cpu().numpy() for src, name in zip(sources, model.sources)}
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        written = {}
+        for src, name in zip(sources, model.sources):
+            path = out / f"{name}.wav"
+            save_audio(src.cpu(), str(path), samplerate=model.samplerate)
+            written[name] = str(path)
+        _emit("progress", 1.0)
+        return written
+    finally:
+        _WORKER_TASK = None
+
+
+# ---------------------------------------------------------------------------
+# Parent process side.
+# ---------------------------------------------------------------------------
+
+_ENGINE_LOCK = threading.Lock()
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EVENTS = None
+_CALLBACKS: Dict[str, ProgressCallback] = {}
+_TASK_PIDS: Dict[str, int] = {}
+_START_CALLBACKS: Dict[str, Callable[[int], None]] = {}
+_KILLED_PIDS: set = set()
+_KILLS = [0]  # deliberate worker kills so far; a pool broken by one of them is not a real failure
+_STATS: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "pool_restarts": 0, "cancelled": 0}
+
+
+def _event_listener(events) -> None:
+    while True:
+        try:
+            task_id, kind, value = events.get()
+        except (EOFError, OSError):
+            return
+        if kind == "pid":
+            _TASK_PIDS[task_id] = int(value)
+            on_start = _START_CALLBACKS.pop(task_id, None)
+            if on_start is not None:
+                try:
+                    on_start(int(value))
+                except Exception:
+                    pass
+            continue
+        cb = _CALLBACKS.get(task_id)
+        if cb is not None:
+            try:
+                cb(max(0.0, min(1.0, float(value))))
+            except Exception:
+                pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _EXECUTOR, _EVENTS
+    with _ENGINE_LOCK:
+        if _EXECUTOR is None:
+            ctx = multiprocessing.get_context("spawn")
+            if _EVENTS is None:
+                _EVENTS = ctx.Queue()
+                threading.Thread(target=_event_listener, args=(_EVENTS,), daemon=True).start()
+            torch_threads = max(1, (os.cpu_count() or 1) // _MAX_WORKERS)
+            _EXECUTOR = ProcessPoolExecutor(
+                max_workers=_MAX_WORKERS,
+                mp_context=ctx,
+                initializer=_worker_init,
+                initargs=(_EVENTS, torch_threads),
+            )
+        return _EXECUTOR
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    """Drop the pool that raised BrokenProcessPool. Every task on it sees the error, so only the first
+    caller replaces it; the others must not shut down the pool it already rebuilt and resubmitted to."""
+    global _EXECUTOR
+    with _ENGINE_LOCK:
+        if _EXECUTOR is broken:
+            _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _EXECUTOR = None
+            _STATS["pool_restarts"] += 1
+
+
+def terminate_separation_worker(pid: int) -> None:
+    """Kill the worker running a cancelled task. The pool is rebuilt on the next submit, and tasks
+    that only shared the pool with it are retried rather than failed."""
+    _KILLED_PIDS.add(pid)
+    _KILLS[0] += 1
+    try:
+        os.kill(pid, signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+    except OSError:
+        pass
+
+
+def _run(model_name: str, source: Any, samplerate: Optional[int], output_dir: Optional[Path], progress: Optional[ProgressCallback], on_start: Optional[Callable[[int], None]] = None):
+    if model_name not in DEMUCS_MODELS:
+        raise ValueError(f"unsupported Demucs model: {model_name}")
+    _STATS["submitted"] += 1
+    for attempt in range(2):
+        task_id = uuid.uuid4().hex
+        if progress is not None:
+            _CALLBACKS[task_id] = progress
+        if on_start is not None:
+            _START_CALLBACKS[task_id] = on_start
+        kills_before = _KILLS[0]
+        executor = _get_executor()
+        try:
+            future = executor.submit(
+                _worker_separate, task_id, model_name, source, samplerate,
+                str(output_dir) if output_dir is not None else None,
+            )
+            result = future.result()
+            _STATS["completed"] += 1
+            return result
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            pid = _TASK_PIDS.get(task_id)
+            if pid is not None and pid in _KILLED_PIDS:
+                _KILLED_PIDS.discard(pid)
+                _STATS["cancelled"] += 1
+                raise RuntimeError("Demucs separation cancelled")
+            if attempt == 0 and _KILLS[0] != kills_before:
+                # another task's worker was killed on purpose; this one was collateral
+                continue
+            _STATS["failed"] += 1
+            raise RuntimeError("Demucs worker process died during separation")
+        except Exception:
+            _STATS["failed"] += 1
+            raise
+        finally:
+            _CALLBACKS.pop(task_id, None)
+            _START_CALLBACKS.pop(task_id, None)
+            _TASK_PIDS.pop(task_id, None)
+
+
+def separate_file(input_path: Path, model_name: str, output_dir: Path, progress: Optional[ProgressCallback] = None, on_start: Optional[Callable[[int], None]] = None) -> Dict[str, Path]:
+    """Separate an audio file with a resident Demucs model and write <stem>.wav files into output_dir.
+    on_start receives the worker pid once the task is running (see terminate_separation_worker)."""
+    with stage_timer("demucs"):
+        written = _run(model_name, str(input_path), None, output_dir, progress, on_start)
+    return {name: Path(p) for name, p in written.items()}
+
+
+def separate_array(audio, samplerate: int, model_name: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Separate a (channels, samples) float array; returns stem name -> numpy array at the model samplerate."""
+    with stage_timer("demucs"):
+        return _run(model_name, audio, samplerate, None, progress)
+
+
+def separation_engine_stats() -> Dict[str, int]:
+    with _ENGINE_LOCK:
+        stats = dict(_STATS)
+    stats["workers"] = _MAX_WORKERS
+    stats["active"] = len(_TASK_PIDS)
+    return stats
+
+
+def shutdown_separation_engine() -> None:
+    global _EXECUTOR
+    with _ENGINE_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _EXECUTOR = None
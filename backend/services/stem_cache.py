@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+STEM_NAMES = ("vocals", "drums", "bass", "other", "piano")
+
+_CACHE_DIR = Path(os.environ.get("STEM_CACHE_DIR") or (Path(tempfile.gettempdir()) / "sound_wave_stem_cache"))
+_CACHE_MAX_BYTES = int(float(os.environ.get("STEM_CACHE_MAX_GB", "5")) * 1024 ** 3)
+_MANIFEST = "manifest.json"
+
+# key -> entry size in bytes, ordered from least to most recently used
+_ENTRIES: "OrderedDict[str, int]" = OrderedDict()
+_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+_CACHE_LOCK = threading.Lock()
+# key -> [lock, holders]; an entry is dropped once nobody waits on or holds its lock
+_KEY_LOCKS: Dict[str, List[Any]] = {}
+_LOADED = False
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stem_cache_key(content_sha256: str, model: str) -> str:
+    safe_model = "".join(c if c.isalnum() or c in "-_" else "_" for c in model)
+    return f"{content_sha256}_{safe_model}"
+
+
+def _entry_dir(key: str) -> Path:
+    return _CACHE_DIR / key
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for p in path.rglob("*"):
+        try:
+            if p.is_file():
+                total += p.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def _ensure_loaded() -> None:
+    # Rebuild the LRU index from disk once per process; manifest mtime is the last access time.
+    global _LOADED
+    if _LOADED:
+        return
+    _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    found = []
+    for entry in _CACHE_DIR.iterdir():
+        manifest = entry / _MANIFEST
+        if entry.is_dir() and manifest.exists():
+            found.append((manifest.stat().st_mtime, entry.name, _dir_size(entry)))
+        elif entry.is_dir():
+            # leftover staging dir from an interrupted run
+            shutil.rmtree(entry, ignore_errors=True)
+    for _, key, size in sorted(found):
+        _ENTRIES[key] = size
+    _LOADED = True
+
+
+def _read_manifest(key: str) -> Optional[Dict[str, Path]]:
+    entry = _entry_dir(key)
+    try:
+        data = json.loads((entry / _MANIFEST).read_text(encoding="utf-8"))
+        stems = {name: entry / fname for name, fname in data.get("stems", {}).items()}
+    except Exception:
+        return None
+    if not stems or not all(p.exists() for p in stems.values()):
+        return None
+    return stems
+
+
+def _evict_locked(keep: str) -> None:
+    total = sum(_ENTRIES.values())
+    while total > _CACHE_MAX_BYTES and len(_ENTRIES) > 1:
+        key = next(iter(_ENTRIES))
+        if key == keep:
+            _ENTRIES.move_to_end(key)
+            key = next(iter(_ENTRIES))
+        size = _ENTRIES.pop(key)
+        shutil.rmtree(_entry_dir(key), ignore_errors=True)
+        _STATS["evictions"] += 1
+        total -= size
+
+
+def _get_locked(key: str) -> Optional[Dict[str, Path]]:
+    _ensure_loaded()
+    if key not in _ENTRIES:
+        _STATS["misses"] += 1
+        return None
+    stems = _read_manifest(key)
+    if stems is None:
+        _ENTRIES.pop(key, None)
+        shutil.rmtree(_entry_dir(key), ignore_errors=True)
+        _STATS["misses"] += 1
+        return None
+    _ENTRIES.move_to_end(key)
+    _STATS["hits"] += 1
+    try:
+        os.utime(_entry_dir(key) / _MANIFEST)
+    except OSError:
+        pass
+    return stems
+
+
+def stem_cache_get(key: str) -> Optional[Dict[str, Path]]:
+    """Paths inside the cache entry; another put may evict them at any time, so callers that read the
+    files later should use stem_cache_fetch with a dest_dir instead."""
+    with _CACHE_LOCK:
+        return _get_locked(key)
+
+
+def _link_locked(stems: Dict[str, Path], dest_dir: Path) -> Dict[str, Path]:
+    # a hard link keeps the data alive after eviction removes the cache entry; copy across filesystems
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    out: Dict[str, Path] = {}
+    for name, src in stems.items():
+        dst = dest_dir / src.name
+        if dst.exists():
+            dst.unlink()
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        out[name] = dst
+    return out
+
+
+def stem_cache_put(key: str, source_dir: Path, dest_dir: Optional[Path] = None) -> Dict[str, Path]:
+    """Move the stem WAVs found under source_dir (any depth) into the cache entry for key. With dest_dir
+    the returned paths are links there, made before any eviction can run."""
+    stems_found: Dict[str, Path] = {}
+    for p in Path(source_dir).rglob("*.wav"):
+        name = p.stem.lower()
+        if name in STEM_NAMES and name not in stems_found:
+            stems_found[name] = p
+    if not stems_found:
+        raise RuntimeError("no stem files found in separation output")
+
+    with _CACHE_LOCK:
+        _ensure_loaded()
+        staging = _CACHE_DIR / f".staging_{uuid.uuid4().hex}"
+        staging.mkdir(parents=True)
+        for name, p in stems_found.items():
+            shutil.move(str(p), str(staging / f"{name}.wav"))
+        manifest = {
+            "stems": {name: f"{name}.wav" for name in stems_found},
+            "created": time.time(),
+        }
+        (staging / _MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+        entry = _entry_dir(key)
+        if entry.exists():
+            shutil.rmtree(entry, ignore_errors=True)
+        staging.rename(entry)
+        _ENTRIES[key] = _dir_size(entry)
+        _ENTRIES.move_to_end(key)
+        _evict_locked(keep=key)
+        stems = {name: entry / f"{name}.wav" for name in stems_found}
+        return _link_locked(stems, dest_dir) if dest_dir is not None else stems
+
+
+def stem_cache_fetch(key: str, separate: Callable[[Path], None], dest_dir: Path) -> Tuple[Dict[str, Path], bool]:
+    """Return (stems, hit) with the stems hard-linked (or copied) into dest_dir, so a later eviction cannot
+    pull them from under the caller. On a miss, separate(out_dir) is called once per key even under
+    concurrency."""
+    with _CACHE_LOCK:
+        holder = _KEY_LOCKS.setdefault(key, [threading.Lock(), 0])
+        holder[1] += 1
+    try:
+        with holder[0]:
+            with _CACHE_LOCK:
+                stems = _get_locked(key)
+                if stems is not None:
+                    return _link_locked(stems, dest_dir), True
+            work_dir = _CACHE_DIR / f".work_{uuid.uuid4().hex}"
+            work_dir.mkdir(parents=True)
+            try:
+                separate(work_dir)
+                return stem_cache_put(key, work_dir, dest_dir), False
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        with _CACHE_LOCK:
+            holder[1] -= 1
+            if holder[1] == 0:
+                _KEY_LOCKS.pop(key, None)
+
+
+def stem_cache_stats() -> Dict[str, float]:
+    with _CACHE_LOCK:
+        _ensure_loaded()
+        lookups = _STATS["hits"] + _STATS["misses"]
+        return {
+            "hits": _STATS["hits"],
+            "misses": _STATS["misses"],
+            "evictions": _STATS["evictions"],
+            "hit_ratio": (_STATS["hits"] / lookups) if lookups else 0.0,
+            "entries": len(_ENTRIES),
+            "bytes": sum(_ENTRIES.values()),
+            "max_bytes": _CACHE_MAX_BYTES,
+        }
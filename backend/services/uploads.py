@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.files import safe_unlink
+from services.metrics import observe_stage
+
+
+_STORE_DIR = Path(os.environ.get("UPLOAD_STORE_DIR") or (Path(tempfile.gettempdir()) / "sound_wave_uploads"))
+# Unreferenced uploads are kept this long after their last use so clients can keep passing audio_id.
+_UPLOAD_TTL_SECONDS = float(os.environ.get("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+_CHUNK_SIZE = 1024 * 1024
+
+_AUDIO_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_SUFFIX_RE = re.compile(r"^\.[0-9a-z]{1,8}$")
+
+_INDEX: Dict[str, Dict[str, Any]] = {}
+_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {"ingested": 0, "deduplicated": 0, "bytes_saved": 0}
+
+
+class UploadNotFound(LookupError):
+    pass
+
+
+def _meta_path(audio_id: str) -> Path:
+    return _STORE_DIR / f"{audio_id}.json"
+
+
+def _blob_path(audio_id: str, suffix: str) -> Path:
+    # keep the first upload's extension so decoders that sniff by name still work
+    return _STORE_DIR / f"{audio_id}{suffix}"
+
+
+def _write_meta(audio_id: str, meta: Dict[str, Any]) -> None:
+    tmp = _STORE_DIR / f".{uuid.uuid4().hex}.json"
+    tmp.write_text(json.dumps({k: v for k, v in meta.items() if k != "refs"}), encoding="utf-8")
+    os.replace(tmp, _meta_path(audio_id))
+
+
+def _load_index() -> None:
+    if not _STORE_DIR.exists():
+        return
+    for meta_file in _STORE_DIR.glob("*.json"):
+        audio_id = meta_file.stem
+        if not _AUDIO_ID_RE.match(audio_id):
+            continue
+        try:
+            meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if _blob_path(audio_id, meta.get("suffix", "")).exists():
+            meta["refs"] = 0
+            _INDEX[audio_id] = meta
+
+
+def _info(audio_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "audio_id": audio_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "path": _blob_path(audio_id, meta["suffix"]),
+        "refs": meta["refs"],
+    }
+
+
+async def ingest_upload(file) -> Dict[str, Any]:
+    """Stream an UploadFile into the store, hashing it in the same pass; identical content is kept once."""
+    _STORE_DIR.mkdir(parents=True, exist_ok=True)
+    filename = Path(file.filename or "").name or "input"
+    suffix = Path(filename).suffix.lower()
+    if not _SUFFIX_RE.match(suffix):
+        suffix = ""
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    size = 0
+    tmp = _STORE_DIR / f".{uuid.uuid4().hex}.part"
+    try:
+        with tmp.open("wb") as f:
+            while True:
+                chunk = await file.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        safe_unlink(tmp)
+        raise
+    audio_id = digest.hexdigest()
+    now = time.time()
+    with _LOCK:
+        meta = _INDEX.get(audio_id)
+        deduplicated = meta is not None and _blob_path(audio_id, meta["suffix"]).exists()
+        if deduplicated:
+            meta["last_used"] = now
+            _STATS["deduplicated"] += 1
+            _STATS["bytes_saved"] += size
+        else:
+            meta = {"filename": filename, "suffix": suffix, "size": size, "created_at": now, "last_used": now, "refs": 0}
+            os.replace(tmp, _blob_path(audio_id, suffix))
+            _INDEX[audio_id] = meta
+            _STATS["ingested"] += 1
+        _write_meta(audio_id, meta)
+        info = _info(audio_id, meta)
+    if deduplicated:
+        safe_unlink(tmp)
+    # the name of this upload is what the caller sees, even if the bytes were stored under another name
+    info["filename"] = filename
+    info["deduplicated"] = deduplicated
+    observe_stage("upload", time.perf_counter() - started)
+    return info
+
+
+def upload_get(audio_id: str) -> Optional[Dict[str, Any]]:
+    if not _AUDIO_ID_RE.match(audio_id or ""):
+        return None
+    with _LOCK:
+        meta = _INDEX.get(audio_id)
+        return _info(audio_id, meta) if meta is not None else None
+
+
+def upload_acquire(audio_id: str) -> Dict[str, Any]:
+    """Take a reference on a stored upload so it is not expired while in use; raises UploadNotFound."""
+    with _LOCK:
+        meta = _INDEX.get(audio_id or "")
+        if meta is None or not _blob_path(audio_id, meta["suffix"]).exists():
+            raise UploadNotFound(audio_id)
+        meta["refs"] += 1
+        meta["last_used"] = time.time()
+        return _info(audio_id, meta)
+
+
+def upload_release(audio_id: str) -> None:
+    with _LOCK:
+        meta = _INDEX.get(audio_id or "")
+        if meta is not None:
+            meta["refs"] = max(0, meta["refs"] - 1)
+            meta["last_used"] = time.time()
+
+
+async def acquire_audio_input(file=None, audio_id: Optional[str] = None) -> Dict[str, Any]:
+    """Resolve a request's audio (a fresh upload or an earlier audio_id) and take a reference on it.
+
+    Raises ValueError when neither is given and UploadNotFound for an unknown audio_id.
+    """
+    if audio_id:
+        return upload_acquire(audio_id.strip().lower())
+    if file is None:
+        raise ValueError("file or audio_id is required")
+    info = await ingest_upload(file)
+    acquired = upload_acquire(info["audio_id"])
+    acquired["filename"] = info["filename"]
+    acquired["deduplicated"] = info["deduplicated"]
+    return acquired
+
+
+def upload_expire() -> int:
+    """Remove unreferenced uploads idle for longer than UPLOAD_TTL_SECONDS."""
+    now = time.time()
+    removed: List[Path] = []
+    with _LOCK:
+        for audio_id, meta in list(_INDEX.items()):
+            if meta["refs"] == 0 and now - meta["last_used"] > _UPLOAD_TTL_SECONDS:
+                del _INDEX[audio_id]
+                removed += [_blob_path(audio_id, meta["suffix"]), _meta_path(audio_id)]
+    for path in removed:
+        safe_unlink(path)
+    return len(removed) // 2
+
+
+def upload_store_stats() -> Dict[str, Any]:
+    with _LOCK:
+        return dict(
+            _STATS,
+            entries=len(_INDEX),
+            bytes=sum(meta["size"] for meta in _INDEX.values()),
+            referenced=sum(1 for meta in _INDEX.values() if meta["refs"] > 0),
+        )
+
+
+_load_index()
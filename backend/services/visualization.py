@@ -0,0 +1,118 @@
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+
+# Frontend visualization ids (frontend/src/constants/visualization.js) plus explicit ffmpeg-style aliases.
+LAYER_TYPES = ("line", "bars", "mirrored", "rms", "spectrum", "spectrogram", "wave3d", "circular", "vectorscope")
+# ffmpeg filter each layer is drawn with; layers whose filter the build lacks are drawn as "line"
+LAYER_FILTERS = {
+    "line": "showwaves", "bars": "showwaves", "mirrored": "showwaves", "rms": "showwaves",
+    "spectrum": "showfreqs", "spectrogram": "showspectrum", "wave3d": "showspectrum",
+    "circular": "avectorscope", "vectorscope": "avectorscope",
+}
+
+
+def parse_color(color: str, default: Tuple[int, int, int] = (0x5A, 0xC8, 0xFA)) -> Tuple[int, int, int]:
+    value = (color or "").strip().lower()
+    if value.startswith("#"):
+        value = value[1:]
+    elif value.startswith("0x"):
+        value = value[2:]
+    if len(value) >= 6:
+        try:
+            return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+        except ValueError:
+            pass
+    return default
+
+
+def _hex(rgb: Tuple[int, int, int]) -> str:
+    return "0x%02x%02x%02x" % rgb
+
+
+def _tint(rgb: Tuple[int, int, int]) -> str:
+    # reduce the source to its luma first (showspectrum's palettes are coloured), then grey (r=g=b) ->
+    # tinted rgb; black stays black so colorkey can drop it
+    r, g, b = (round(c / 255.0, 4) for c in rgb)
+    return (
+        f"format=gray,format=rgba,colorchannelmixer=rr={r}:rg=0:rb=0:gr=0:gg={g}:gb=0:br=0:bg=0:bb={b},"
+        "colorkey=black:0.02:0.1"
+    )
+
+
+def _layer_filter(layer: str, rgb: Tuple[int, int, int], width: int, height: int, fps: int) -> str:
+    size = f"{width}x{height}"
+    color = _hex(rgb)
+    if layer == "bars":
+        return f"aformat=channel_layouts=mono,showwaves=s={size}:mode=p2p:draw=full:rate={fps}:colors={color}"
+    if layer == "mirrored":
+        return f"aformat=channel_layouts=mono,showwaves=s={size}:mode=cline:draw=full:rate={fps}:colors={color}"
+    if layer == "rms":
+        return f"aformat=channel_layouts=mono,showwaves=s={size}:mode=line:scale=sqrt:rate={fps}:colors={color}"
+    if layer == "spectrum":
+        return f"aformat=channel_layouts=mono,showfreqs=s={size}:mode=bar:ascale=log:fscale=log:win_size=2048:colors={color},fps={fps}"
+    if layer in ("spectrogram", "wave3d"):
+        return (
+            f"aformat=channel_layouts=mono,showspectrum=s={size}:slide=scroll:mode=combined:color=intensity:scale=log,"
+            f"fps={fps},{_tint(rgb)}"
+        )
+    if layer in ("circular", "vectorscope"):
+        side = min(width, height)
+        r, g, b = rgb
+        return (
+            f"aformat=channel_layouts=stereo,avectorscope=s={side}x{side}:mode=polar:draw=line:rate={fps}:"
+            f"rc={r}:gc={g}:bc={b}:ac=255:rf=30:gf=30:bf=30:af=30,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black@0,colorkey=black:0.02:0.1"
+        )
+    return f"aformat=channel_layouts=mono,showwaves=s={size}:mode=line:rate={fps}:colors={color}"
+
+
+def resolve_layers(
+    visualization_types: str,
+    visualization_colors: str,
+    default_color: str,
+    available_filters: Optional[Collection[str]] = None,
+) -> List[Tuple[str, Tuple[int, int, int]]]:
+    """Pair comma-separated types with their colors (falling back to default_color), dropping duplicates."""
+    types = [v.strip().lower() for v in (visualization_types or "").split(",") if v.strip()]
+    colors = [c.strip() for c in (visualization_colors or "").split(",") if c.strip()]
+    fallback = parse_color(default_color)
+    layers: List[Tuple[str, Tuple[int, int, int]]] = []
+    seen: Dict[str, bool] = {}
+    for i, layer in enumerate(types):
+        if layer in seen:
+            continue
+        seen[layer] = True
+        if layer not in LAYER_TYPES:
+            layer = "line"
+        elif available_filters is not None and LAYER_FILTERS[layer] not in available_filters:
+            layer = "line"
+        layers.append((layer, parse_color(colors[i], fallback) if i < len(colors) else fallback))
+    return layers or [("line", fallback)]
+
+
+def build_visualization_filter(
+    width: int,
+    height: int,
+    fps: int,
+    background: str,
+    layers: Sequence[Tuple[str, Tuple[int, int, int]]],
+    audio_label: str = "0:a",
+    output_label: str = "vout",
+) -> str:
+    """One filter graph: decode once, asplit to every layer, overlay them in order on the background."""
+    parts = [f"color=c={_hex(parse_color(background, (0x0B, 0x10, 0x20)))}:s={width}x{height}:r={fps}[bg]"]
+    count = len(layers)
+    if count == 1:
+        parts.append(f"[{audio_label}]anull[a0]")
+    else:
+        parts.append(f"[{audio_label}]asplit={count}" + "".join(f"[a{i}]" for i in range(count)))
+    for i, (layer, rgb) in enumerate(layers):
+        parts.append(f"[a{i}]{_layer_filter(layer, rgb, width, height, fps)}[v{i}]")
+    current = "bg"
+    for i in range(count):
+        nxt = f"o{i}"
+        # shortest=1 on the first overlay ends the infinite color source with the audio
+        parts.append(f"[{current}][v{i}]overlay=format=auto" + (":shortest=1" if i == 0 else "") + f"[{nxt}]")
+        current = nxt
+    parts.append(f"[{current}]format=yuv420p[{output_label}]")
+    return ";".join(parts)
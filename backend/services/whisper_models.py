@@ -0,0 +1,155 @@
+import importlib
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Rough resident size per model (MB) used for budget accounting; int8 on CPU is about half of float16.
+_MODEL_MEMORY_MB: Dict[str, int] = {
+    "tiny": 150,
+    "base": 300,
+    "small": 900,
+    "medium": 2200,
+    "large-v2": 4500,
+    "large-v3": 4500,
+}
+_DEFAULT_MEMORY_MB = 2000
+
+_BUDGET_MB = int(os.environ.get("WHISPER_MEMORY_BUDGET_MB", "6000"))
+_INSTANCES_PER_MODEL = max(1, int(os.environ.get("WHISPER_INSTANCES_PER_MODEL", "1")))
+
+ModelKey = Tuple[str, str, str]
+
+
+class _Entry:
+    def __init__(self, key: ModelKey, size_mb: int):
+        self.key = key
+        self.size_mb = size_mb
+        self.instances: List[Any] = []
+        self.free: "queue.Queue[Any]" = queue.Queue()
+        self.in_use = 0
+        self.load_lock = threading.Lock()
+
+
+_REGISTRY: "OrderedDict[ModelKey, _Entry]" = OrderedDict()
+_REGISTRY_LOCK = threading.Lock()
+_STATS: Dict[str, float] = {"hits": 0, "misses": 0, "evictions": 0, "load_seconds": 0.0}
+
+
+def default_device() -> Tuple[str, str]:
+    device = "cuda" if shutil.which("nvidia-smi") else "cpu"
+    compute_type = "int8" if device == "cpu" else "float16"
+    return device, compute_type
+
+
+def _estimate_mb(key: ModelKey) -> int:
+    size, _device, compute_type = key
+    mb = _MODEL_MEMORY_MB.get(size, _DEFAULT_MEMORY_MB)
+    if compute_type.startswith("int8"):
+        mb = mb // 2
+    return mb
+
+
+def _load_instance(key: ModelKey):
+    fw = importlib.import_module("faster_whisper")
+    WhisperModel = getattr(fw, "WhisperModel")
+    size, device, compute_type = key
+    return WhisperModel(size, device=device, compute_type=compute_type)
+
+
+def _evict_locked(incoming_mb: int) -> None:
+    used = sum(e.size_mb * len(e.instances) for e in _REGISTRY.values())
+    for key in list(_REGISTRY.keys()):
+        if used + incoming_mb <= _BUDGET_MB:
+            break
+        entry = _REGISTRY[key]
+        if entry.in_use > 0:
+            continue
+        used -= entry.size_mb * len(entry.instances)
+        del _REGISTRY[key]
+        entry.instances.clear()
+        entry.free = queue.Queue()
+        _STATS["evictions"] += 1
+
+
+def _get_entry(key: ModelKey) -> _Entry:
+    with _REGISTRY_LOCK:
+        entry = _REGISTRY.get(key)
+        if entry is not None:
+            _REGISTRY.move_to_end(key)
+            _STATS["hits"] += 1
+        else:
+            entry = _Entry(key, _estimate_mb(key))
+            _evict_locked(entry.size_mb)
+            _REGISTRY[key] = entry
+            _STATS["misses"] += 1
+        entry.in_use += 1
+    return entry
+
+
+def _checkout(entry: _Entry):
+    # Load lazily up to the per-model pool size; otherwise wait for a free instance.
+    try:
+        return entry.free.get_nowait()
+    except queue.Empty:
+        pass
+    with entry.load_lock:
+        if len(entry.instances) < _INSTANCES_PER_MODEL:
+            started = time.time()
+            instance = _load_instance(entry.key)
+            _STATS["load_seconds"] += time.time() - started
+            entry.instances.append(instance)
+            return instance
+    return entry.free.get()
+
+
+@contextmanager
+def whisper_model(model_size: str, device: Optional[str] = None, compute_type: Optional[str] = None) -> Iterator[Any]:
+    """Borrow a shared WhisperModel for exclusive use. Consume transcribe() generators inside the block."""
+    default_dev, default_ct = default_device()
+    key: ModelKey = (model_size, device or default_dev, compute_type or (default_ct if device is None else "default"))
+    entry = _get_entry(key)
+    instance = None
+    try:
+        instance = _checkout(entry)
+        yield instance
+    finally:
+        if instance is not None:
+            entry.free.put(instance)
+        with _REGISTRY_LOCK:
+            entry.in_use -= 1
+
+
+def preload_whisper_models(sizes: Iterable[str]) -> None:
+    for size in sizes:
+        size = size.strip()
+        if not size:
+            continue
+        try:
+            with whisper_model(size):
+                pass
+            print(f"[whisper] preloaded model '{size}'", flush=True)
+        except Exception as e:
+            print(f"[whisper] preload of '{size}' failed: {e}", flush=True)
+
+
+def whisper_registry_stats() -> Dict[str, Any]:
+    with _REGISTRY_LOCK:
+        lookups = _STATS["hits"] + _STATS["misses"]
+        return {
+            "hits": _STATS["hits"],
+            "misses": _STATS["misses"],
+            "evictions": _STATS["evictions"],
+            "hit_ratio": (_STATS["hits"] / lookups) if lookups else 0.0,
+            "load_seconds": round(_STATS["load_seconds"], 3),
+            "loaded": [
+                {"model": k[0], "device": k[1], "compute_type": k[2], "instances": len(e.instances), "in_use": e.in_use}
+                for k, e in _REGISTRY.items()
+            ],
+            "budget_mb": _BUDGET_MB,
+        }
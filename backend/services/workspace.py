@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+
+# Every temp directory lives under one root so a sweep also finds what a crashed process left behind.
+_ROOT = Path(os.environ.get("WORKSPACE_DIR") or (Path(tempfile.gettempdir()) / "sound_wave_work"))
+# Idle directories (request finished, job done, result not fetched) are removed after this long.
+_TTL_SECONDS = float(os.environ.get("WORKSPACE_TTL_SECONDS", str(6 * 3600)))
+_QUOTA_BYTES = int(float(os.environ.get("WORKSPACE_QUOTA_GB", "20")) * 1024 ** 3)
+# Heavy work is refused when the filesystem itself is this close to full, whatever the quota says.
+_MIN_FREE_BYTES = int(float(os.environ.get("WORKSPACE_MIN_FREE_GB", "2")) * 1024 ** 3)
+
+_DIRS: Dict[str, Dict[str, Any]] = {}
+_LOCK = threading.Lock()
+_EVICT_HOOKS: List[Callable[[Path], None]] = []
+_STATS: Dict[str, int] = {"created": 0, "evicted": 0, "evicted_bytes": 0, "rejected": 0}
+
+
+class WorkspaceFull(RuntimeError):
+    pass
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def _adopt_existing() -> None:
+    if not _ROOT.exists():
+        return
+    for child in _ROOT.iterdir():
+        if child.is_dir():
+            mtime = child.stat().st_mtime
+            _DIRS[str(child)] = {"prefix": child.name, "created_at": mtime, "last_used": mtime, "bytes": _dir_size(child), "active": False}
+
+
+def _free_bytes() -> int:
+    try:
+        return shutil.disk_usage(_ROOT).free
+    except OSError:
+        return _MIN_FREE_BYTES
+
+
+def _has_room_locked() -> bool:
+    used = sum(entry["bytes"] for entry in _DIRS.values())
+    return used < _QUOTA_BYTES and _free_bytes() >= _MIN_FREE_BYTES
+
+
+def workspace_create(prefix: str, heavy: bool = False) -> Path:
+    """New tracked directory, pinned until workspace_release. heavy=True raises WorkspaceFull when the
+    quota or the disk is exhausted even after evicting idle directories."""
+    _ROOT.mkdir(parents=True, exist_ok=True)
+    if heavy:
+        # re-measure first: running jobs grow their directories between periodic sweeps
+        workspace_sweep()
+        with _LOCK:
+            room = _has_room_locked()
+            if not room:
+                _STATS["rejected"] += 1
+        if not room:
+            raise WorkspaceFull("workspace quota or disk space exhausted")
+    path = Path(tempfile.mkdtemp(prefix=prefix, dir=_ROOT))
+    now = time.time()
+    with _LOCK:
+        _DIRS[str(path)] = {"prefix": prefix, "created_at": now, "last_used": now, "bytes": 0, "active": True}
+        _STATS["created"] += 1
+    return path
+
+
+def workspace_release(path: Path) -> None:
+    """The owner is done with path for now; it stays on disk but becomes eligible for TTL/quota eviction."""
+    with _LOCK:
+        entry = _DIRS.get(str(path))
+        if entry is not None:
+            entry["active"] = False
+            entry["last_used"] = time.time()
+
+
+def workspace_acquire(path: Path) -> bool:
+    """Pin a released directory again (e.g. to re-run one stage of a finished job). False when the
+    sweeper already removed it."""
+    with _LOCK:
+        entry = _DIRS.get(str(path))
+        if entry is None or not path.is_dir():
+            return False
+        entry["active"] = True
+        entry["last_used"] = time.time()
+        return True
+
+
+def workspace_forget(path: Path) -> None:
+    with _LOCK:
+        _DIRS.pop(str(path), None)
+
+
+def workspace_on_evict(hook: Callable[[Path], None]) -> None:
+    """hook(path) runs after the sweeper removes a directory (e.g. to fail the job whose result it held)."""
+    _EVICT_HOOKS.append(hook)
+
+
+def _evict(paths: List[str]) -> None:
+    for key in paths:
+        shutil.rmtree(key, ignore_errors=True)
+        for hook in _EVICT_HOOKS:
+            try:
+                hook(Path(key))
+            except Exception as e:
+                print(f"[workspace] evict hook failed: {e}", flush=True)
+
+
+def workspace_sweep() -> Dict[str, int]:
+    """Re-measure every directory, drop vanished ones, then evict idle ones: first past the TTL,
+    then oldest-first while over the quota or below the free-space floor."""
+    with _LOCK:
+        keys = list(_DIRS)
+    sizes = {key: _dir_size(Path(key)) for key in keys if os.path.isdir(key)}
+    now = time.time()
+    evicted: List[str] = []
+    with _LOCK:
+        for key in list(_DIRS):
+            if key in sizes:
+                _DIRS[key]["bytes"] = sizes[key]
+            elif key in keys:
+                del _DIRS[key]
+        used = sum(entry["bytes"] for entry in _DIRS.values())
+        free = _free_bytes()
+        idle = sorted((entry["last_used"], key) for key, entry in _DIRS.items() if not entry["active"])
+        for last_used, key in idle:
+            if now - last_used > _TTL_SECONDS or used >= _QUOTA_BYTES or free < _MIN_FREE_BYTES:
+                size = _DIRS.pop(key)["bytes"]
+                used -= size
+                free += size
+                _STATS["evicted"] += 1
+                _STATS["evicted_bytes"] += size
+                evicted.append(key)
+    _evict(evicted)
+    if evicted:
+        print(f"[workspace] evicted {len(evicted)} idle directories", flush=True)
+    return {"evicted": len(evicted), "tracked": len(_DIRS)}
+
+
+def workspace_stats() -> Dict[str, Any]:
+    with _LOCK:
+        return dict(
+            _STATS,
+            root=str(_ROOT),
+            directories=len(_DIRS),
+            active=sum(1 for entry in _DIRS.values() if entry["active"]),
+            bytes=sum(entry["bytes"] for entry in _DIRS.values()),
+            quota_bytes=_QUOTA_BYTES,
+            free_bytes=_free_bytes(),
+        )
+
+
+_adopt_existing()
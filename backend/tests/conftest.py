@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Every on-disk store goes under one throwaway root; these are read at import time, so they are set
+# before any service module is imported.
+_ROOT = Path(tempfile.mkdtemp(prefix="sound_wave_tests_"))
+for _name, _sub in (
+    ("WORKSPACE_DIR", "work"),
+    ("UPLOAD_STORE_DIR", "uploads"),
+    ("STEM_CACHE_DIR", "stems"),
+    ("PEAKS_CACHE_DIR", "peaks"),
+):
+    os.environ[_name] = str(_ROOT / _sub)
+os.environ["JOB_STORE"] = "memory"
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def write_wav(tmp_path):
+    """write_wav(samples, sr=48000, name="x.wav") -> path of a float32 WAV (samples: (n,) or (n, channels))."""
+    def _write(samples, sr: int = 48000, name: str = "x.wav") -> Path:
+        path = tmp_path / name
+        wavfile.write(str(path), sr, np.asarray(samples, dtype=np.float32))
+        return path
+    return _write
+
+
+@pytest.fixture(scope="session")
+def ffmpeg_exe():
+    """Path of a working ffmpeg (imageio-ffmpeg or PATH); tests that need one are skipped without it."""
+    import subprocess
+
+    from services.ffmpeg import resolve_binaries
+
+    exe = resolve_binaries()[0]
+    try:
+        subprocess.run([exe, "-version"], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("ffmpeg not available")
+    return exe
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from services import ffmpeg
+from services.ffmpeg import ffmpeg_capabilities, probe_duration_seconds, resample_filter
+
+
+@pytest.fixture
+def caps(monkeypatch):
+    """Replace the cached capability record; returns it for editing."""
+    record = dict(ffmpeg_capabilities(), filters=set(), encoders=set(), soxr=False)
+    monkeypatch.setattr(ffmpeg, "_CAPABILITIES", record)
+    return record
+
+
+def test_listing_lines_are_parsed():
+    assert ffmpeg._FILTER_LINE_RE.match(" T.C loudnorm         A->A       EBU R128 loudness normalization").group(1) == "loudnorm"
+    assert ffmpeg._FILTER_LINE_RE.match(" ... showwaves         A->V       Convert input audio to a video output.").group(1) == "showwaves"
+    assert ffmpeg._FILTER_LINE_RE.match(" Filters:") is None
+    assert ffmpeg._ENCODER_LINE_RE.match(" V..... libx264              libx264 H.264 / AVC").group(1) == "libx264"
+    assert ffmpeg._ENCODER_LINE_RE.match(" A....D flac                 FLAC (Free Lossless Audio Codec)").group(1) == "flac"
+
+
+def test_capabilities_are_probed_once(ffmpeg_exe, monkeypatch):
+    first = ffmpeg_capabilities()
+    assert first["available"] and first["version"]
+    assert {"loudnorm", "showwaves", "aresample"} <= first["filters"]
+    assert {"aac", "flac", "pcm_s16le"} <= first["encoders"]
+    monkeypatch.setattr(ffmpeg, "_probe_capabilities", lambda: pytest.fail("probed again"))
+    assert ffmpeg_capabilities() is first
+
+
+def test_status_reports_the_summary(client, ffmpeg_exe):
+    summary = client.get("/api/status").json()["ffmpeg"]
+    assert summary["available"] is True
+    assert summary["filters"]["loudnorm"] is True
+    assert set(summary["encoders"]) == {"libx264", "aac", "flac", "libopus", "libmp3lame"}
+
+
+def test_resampler_follows_the_build(caps):
+    assert resample_filter(44100) == "aresample=44100"
+    caps["soxr"] = True
+    assert resample_filter() == "aresample=48000:resampler=soxr:precision=28"
+
+
+def test_duration_without_ffprobe_falls_back_to_ffmpeg(ffmpeg_exe, write_wav, caps):
+    caps["ffprobe"] = None
+    path = write_wav(np.zeros(48000 * 3 + 24000), sr=48000)
+    assert probe_duration_seconds("ffprobe", path) == pytest.approx(3.5, abs=0.01)
+    assert probe_duration_seconds("ffprobe", path.parent / "missing.wav") is None
+
+
+def test_progress_fields_are_parsed():
+    assert ffmpeg.progress_seconds({"out_time_us": "2500000", "out_time_ms": "1"}) == 2.5
+    # out_time_ms is microseconds as well
+    assert ffmpeg.progress_seconds({"out_time_ms": "1500000"}) == 1.5
+    assert ffmpeg.progress_seconds({"out_time_us": "-40000"}) == 0.0
+    assert ffmpeg.progress_seconds({"out_time_us": "N/A"}) is None
+    assert ffmpeg.progress_speed({"speed": "1.85x"}) == 1.85
+    assert ffmpeg.progress_speed({"speed": "N/A"}) is None
+    assert ffmpeg.progress_speed({}) is None
+
+
+def test_run_process_reports_progress_blocks(ffmpeg_exe):
+    blocks = []
+    cmd = [ffmpeg_exe, "-hide_banner", "-f", "lavfi", "-i", "sine=frequency=440:duration=3", *ffmpeg.PROGRESS_ARGS, "-f", "null", "-"]
+    result = ffmpeg.run_process_sync(cmd, on_progress=blocks.append)
+    assert result["returncode"] == 0
+    assert blocks and all(block["progress"] == "continue" for block in blocks[:-1])
+    assert blocks[-1]["progress"] == "end"
+    assert ffmpeg.progress_seconds(blocks[-1]) == pytest.approx(3.0, abs=0.05)
+    with pytest.raises(ValueError):
+        ffmpeg.run_process_sync(cmd, on_progress=blocks.append, capture_stdout=True)
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+from services import jobs
+from services.files import create_temp_dir
+from services.jobs import job_get, job_set
+
+
+def _job(job_type, status, **extra):
+    job_id = str(uuid.uuid4())
+    tmp_dir = create_temp_dir(f"{job_type}_test_")
+    job_set(job_id, dict({"type": job_type, "status": status, "tmp_dir": str(tmp_dir), "input_path": str(tmp_dir / "in.wav")}, **extra))
+    return job_id, tmp_dir
+
+
+RESULTS = {
+    "render": ("/api/render/result", "/api/render/{}"),
+    "stems": ("/api/audio/stem-separation/result", "/api/audio/stem-separation/{}"),
+    "score": ("/api/audio/score/result", "/api/audio/score/{}"),
+}
+
+
+@pytest.mark.parametrize("job_type", sorted(RESULTS))
+def test_result_of_cancelled_job_is_gone(client, job_type):
+    result_url, cancel_url = RESULTS[job_type]
+    job_id, _ = _job(job_type, "queued")
+    assert client.delete(cancel_url.format(job_id)).status_code == 200
+    assert job_get(job_id)["tmp_dir"] is None
+    resp = client.get(result_url, params={"job_id": job_id})
+    assert resp.status_code == 410
+    assert "cancelled" in resp.json()["detail"]
+
+
+@pytest.mark.parametrize("job_type", sorted(RESULTS))
+def test_result_of_evicted_job_is_gone(client, job_type):
+    result_url, _ = RESULTS[job_type]
+    job_id, tmp_dir = _job(job_type, "completed", zip_path="/nonexistent.zip", output_path="/nonexistent.mp4")
+    jobs._on_workspace_evicted(tmp_dir)
+    assert job_get(job_id)["status"] == "failed"
+    resp = client.get(result_url, params={"job_id": job_id})
+    assert resp.status_code == 410
+    assert "evicted" in resp.json()["detail"]
+
+
+def test_unfinished_render_is_not_a_result(client):
+    job_id, _ = _job("render", "running", output_path=None)
+    assert client.get("/api/render/result", params={"job_id": job_id}).status_code == 400
+
+
+def test_completed_render_result_is_sent_then_reclaimed(client):
+    job_id, tmp_dir = _job("render", "completed")
+    output = tmp_dir / "out.mp4"
+    output.write_bytes(b"\x00" * 64)
+    jobs._STORE.update(job_id, {"output_path": str(output)})
+    resp = client.get("/api/render/result", params={"job_id": job_id})
+    assert resp.status_code == 200
+    assert resp.content == b"\x00" * 64
+    assert job_get(job_id) is None
+    assert not tmp_dir.exists()
+
+
+def test_completed_stems_result_is_sent_then_reclaimed(client):
+    job_id, tmp_dir = _job("stems", "completed", model="demucs:4stems", filename="song.wav")
+    archive = tmp_dir / "stems.zip"
+    archive.write_bytes(b"PK\x05\x06" + b"\x00" * 18)
+    jobs._STORE.update(job_id, {"zip_path": str(archive)})
+    resp = client.get("/api/audio/stem-separation/result", params={"job_id": job_id})
+    assert resp.status_code == 200
+    assert "stems_song_demucs" in resp.headers["content-disposition"]
+    assert job_get(job_id) is None
+    assert not tmp_dir.exists()
@@ -0,0 +1,112 @@
+import sqlite3
+import time
+
+import pytest
+
+from services import jobs
+from services.job_store import JobStore, MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    s = MemoryJobStore() if request.param == "memory" else SQLiteJobStore(tmp_path / "jobs.sqlite3", flush_interval=60)
+    yield s
+    s.close()
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+    class Partial(JobStore):
+        def get(self, job_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_crud_returns_copies(store):
+    store.set("a", {"status": "queued", "progress": 0.0})
+    job = store.get("a")
+    job["status"] = "mutated"
+    assert store.get("a")["status"] == "queued"
+    store.update("a", {"status": "running", "progress": 0.5})
+    assert store.get("a")["progress"] == 0.5
+    store.update("missing", {"status": "running"})
+    assert store.get("missing") is None
+    assert [job_id for job_id, _ in store.items()] == ["a"]
+    assert store.pop("a")["status"] == "running"
+    assert store.pop("a") is None
+    assert store.items() == []
+
+
+def test_expired_only_returns_old_terminal_jobs(store):
+    for job_id, status in (("done", "completed"), ("dead", "failed"), ("busy", "running")):
+        store.set(job_id, {"status": status})
+    now = time.time()
+    assert store.expired(3600, now=now) == []
+    assert sorted(job_id for job_id, _ in store.expired(3600, now=now + 7200)) == ["dead", "done"]
+
+
+def test_sqlite_store_survives_a_restart(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    first = SQLiteJobStore(path, flush_interval=60)
+    first.set("kept", {"status": "completed"})
+    first.set("gone", {"status": "completed"})
+    first.update("kept", {"progress": 1.0})  # progress alone waits for the next flush; close flushes it
+    first.pop("gone")
+    first.close()
+
+    second = SQLiteJobStore(path, flush_interval=60)
+    try:
+        assert [job_id for job_id, _ in second.items()] == ["kept"]
+        assert second.get("kept")["progress"] == 1.0
+    finally:
+        second.close()
+
+
+def test_sqlite_store_drops_unreadable_rows(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    SQLiteJobStore(path).close()
+    with sqlite3.connect(str(path)) as conn:
+        conn.execute("INSERT INTO jobs VALUES ('bad', '{not json', 0)")
+    store = SQLiteJobStore(path)
+    assert store.get("bad") is None
+    store.close()
+    with sqlite3.connect(str(path)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_recovery_fails_interrupted_jobs_and_expiry_reclaims_them(monkeypatch, tmp_path):
+    store = MemoryJobStore()
+    monkeypatch.setattr(jobs, "_STORE", store)
+    monkeypatch.setattr(jobs, "_JOB_RECOVERY", "fail")
+    work = tmp_path / "work"
+    work.mkdir()
+    store.set("interrupted", {"type": "render", "status": "running", "tmp_dir": str(work)})
+    store.set("finished", {"type": "render", "status": "completed"})
+    assert jobs.job_recover() == {"requeued": 0, "failed": 1}
+    assert store.get("interrupted")["error"] == "interrupted by server restart"
+    assert not work.exists()
+    assert store.get("finished")["status"] == "completed"
+
+    monkeypatch.setattr(jobs, "_JOB_TTL_SECONDS", -1)
+    assert jobs.job_expire() == 2
+    assert store.items() == []
+
+
+def test_requeue_resumes_jobs_whose_input_is_still_there(monkeypatch, tmp_path):
+    store = MemoryJobStore()
+    monkeypatch.setattr(jobs, "_STORE", store)
+    monkeypatch.setattr(jobs, "_JOB_RECOVERY", "requeue")
+    resumed = []
+    monkeypatch.setitem(jobs._RESUMERS, "stems", lambda job_id, job: resumed.append(job_id))
+    source = tmp_path / "in.wav"
+    source.write_bytes(b"x")
+    store.set("resumable", {"type": "stems", "status": "running", "input_path": str(source)})
+    store.set("lost", {"type": "stems", "status": "queued", "input_path": str(tmp_path / "gone.wav")})
+    assert jobs.job_recover() == {"requeued": 1, "failed": 1}
+    assert resumed == ["resumable"]
+    assert store.get("resumable")["status"] == "queued"
+    assert store.get("lost")["status"] == "failed"
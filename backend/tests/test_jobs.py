@@ -0,0 +1,254 @@
+import json
+import threading
+import time
+
+import pytest
+
+from services import jobs
+from services.files import create_temp_dir
+
+
+@pytest.fixture
+def queues(monkeypatch):
+    """Fresh, empty scheduler queues on an 8-core machine."""
+    monkeypatch.setattr(jobs, "_QUEUES", {t: jobs._TypeQueue(t) for t in jobs.JOB_TYPES})
+    monkeypatch.setattr(jobs, "_CPU_COUNT", 8)
+    for q in jobs._QUEUES.values():
+        q.limit = 2
+    return jobs._QUEUES
+
+
+def _blocker():
+    release = threading.Event()
+    started = threading.Event()
+
+    def run():
+        started.set()
+        release.wait(5)
+
+    return run, started, release
+
+
+def test_cpu_budget_outside_the_queues_counts_the_caller(queues):
+    assert jobs.job_cpu_budget() == 8
+    run, started, release = _blocker()
+    future = jobs.job_submit("render", "r1", run)
+    started.wait(5)
+    try:
+        assert jobs.job_cpu_budget() == 4
+        assert jobs.job_cpu_budget("r1") == 8  # a running job is one share, not two
+    finally:
+        release.set()
+        future.result(5)
+
+
+def test_cpu_budget_of_a_sync_request_counts_its_slot_once(queues):
+    run, started, release = _blocker()
+    other = jobs.job_submit("render", "r1", run)
+    started.wait(5)
+    try:
+        # the sync score path runs its pipeline through job_submit without a job record (job_id None)
+        assert jobs.job_submit("score", "sync", jobs.job_cpu_budget).result(5) == 4
+    finally:
+        release.set()
+        other.result(5)
+
+
+def _gate():
+    gate = threading.Event()
+    started = []
+
+    def task(name):
+        started.append(name)
+        gate.wait(5)
+        return name
+
+    return gate, started, task
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_limit_bounds_concurrency_and_priority_orders_the_queue(queues):
+    queues["render"].limit = 1
+    gate, started, task = _gate()
+    futures = [jobs.job_submit("render", "first", task, "first")]
+    _wait_until(lambda: started == ["first"])
+    futures.append(jobs.job_submit("render", "low-a", task, "low-a"))
+    futures.append(jobs.job_submit("render", "high", task, "high", priority=5))
+    futures.append(jobs.job_submit("render", "low-b", task, "low-b"))
+    stats = jobs.job_scheduler_stats()["render"]
+    assert (stats["running"], stats["queued"]) == (1, 3)
+    assert jobs.job_queue_info("high")["queue_position"] == 1
+    assert jobs.job_queue_info("low-b")["queue_position"] == 3
+    gate.set()
+    assert [f.result(5) for f in futures] == ["first", "low-a", "high", "low-b"]
+    # higher priority first, then submission order
+    assert started == ["first", "high", "low-a", "low-b"]
+    # the future resolves just before the slot is handed back
+    _wait_until(lambda: jobs.job_scheduler_stats()["render"]["completed"] == 4)
+
+
+def test_queue_eta_simulates_slots_freeing_up(queues):
+    q = queues["stems"]
+    q.limit = 1
+    q.avg_duration = 100.0
+    gate, started, task = _gate()
+    futures = [jobs.job_submit("stems", name, task, name) for name in ("a", "b", "c")]
+    try:
+        _wait_until(lambda: started == ["a"])
+        running = jobs.job_queue_info("a")
+        assert running["queue_position"] is None and 99.0 <= running["eta"] <= 100.0
+        assert 199.0 <= jobs.job_queue_info("b")["eta"] <= 200.0
+        assert 299.0 <= jobs.job_queue_info("c")["eta"] <= 300.0
+        assert jobs.job_queue_info("unknown") == {"queue_position": None, "eta": None}
+    finally:
+        gate.set()
+        for f in futures:
+            f.result(5)
+
+
+def test_failures_reach_the_future_and_free_the_slot(queues):
+    queues["lyrics"].limit = 1
+
+    def boom():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError, match="bad input"):
+        jobs.job_submit("lyrics", "x", boom).result(5)
+    assert jobs.job_submit("lyrics", "y", lambda: "ok").result(5) == "ok"
+    with pytest.raises(ValueError, match="unknown job type"):
+        jobs.job_submit("video", "z", boom)
+
+
+def _stored(job_id, status, job_type="render"):
+    tmp_dir = create_temp_dir(f"{job_type}_test_")
+    jobs.job_set(job_id, {"type": job_type, "status": status, "tmp_dir": str(tmp_dir)})
+    return tmp_dir
+
+
+def test_cancel_queued_job_drops_it_from_the_queue(queues):
+    queues["render"].limit = 1
+    gate, started, task = _gate()
+    running = jobs.job_submit("render", "cq-running", task, "cq-running")
+    try:
+        _wait_until(lambda: started == ["cq-running"])
+        tmp_dir = _stored("cq-queued", "queued")
+        queued = jobs.job_submit("render", "cq-queued", task, "cq-queued")
+        assert jobs.job_cancel("cq-queued")["status"] == "queued"
+        assert queued.cancelled()
+        assert jobs.job_scheduler_stats()["render"]["queued"] == 0
+        assert jobs.job_get("cq-queued")["status"] == "cancelled"
+        assert not tmp_dir.exists()
+    finally:
+        gate.set()
+    assert running.result(5) == "cq-running"
+    assert started == ["cq-running"]
+
+
+def test_cancel_running_job_runs_its_hooks_and_frees_the_slot(queues):
+    queues["render"].limit = 1
+    gate, started, task = _gate()
+    _stored("cr-running", "running")
+    running = jobs.job_submit("render", "cr-running", task, "cr-running")
+    waiting = jobs.job_submit("render", "cr-next", task, "cr-next")
+    try:
+        _wait_until(lambda: started == ["cr-running"])
+        stopped = []
+        jobs.job_add_cancel_hook("cr-running", lambda: stopped.append("ffmpeg"))
+        jobs.job_add_cancel_hook("cr-running", lambda: 1 / 0)  # a failing hook does not stop the others
+        jobs.job_add_cancel_hook("cr-running", lambda: stopped.append("demucs"))
+        jobs.job_cancel("cr-running", reason="test")
+        assert stopped == ["ffmpeg", "demucs"]
+        assert jobs.job_get("cr-running")["error"] == "test"
+        assert jobs.job_is_cancelled("cr-running")
+        with pytest.raises(jobs.JobCancelled):
+            jobs.job_raise_if_cancelled("cr-running")
+        # the slot went to the next job without waiting for the cancelled worker to return
+        _wait_until(lambda: started == ["cr-running", "cr-next"])
+        # work that starts a process after the cancel is stopped at once
+        jobs.job_add_cancel_hook("cr-running", lambda: stopped.append("late"))
+        assert stopped[-1] == "late"
+    finally:
+        gate.set()
+    running.result(5)
+    waiting.result(5)
+
+
+def test_cancel_finished_or_unknown_job(queues):
+    tmp_dir = _stored("cf-done", "completed")
+    assert jobs.job_cancel("cf-done")["status"] == "completed"
+    assert jobs.job_get("cf-done") is None
+    assert not tmp_dir.exists()
+    assert jobs.job_cancel("cf-done") is None
+
+
+def test_idle_jobs_are_cancelled(queues, monkeypatch):
+    monkeypatch.setattr(jobs, "_JOB_IDLE_TIMEOUT_SECONDS", 60.0)
+    _stored("idle-a", "running")
+    _stored("idle-b", "completed")
+    _stored("idle-c", "running")
+    jobs.job_touch("idle-a")
+    jobs.job_touch("idle-b")
+    jobs.job_touch("idle-c")
+    jobs._LAST_SEEN["idle-a"] -= 120
+    jobs._LAST_SEEN["idle-b"] -= 120
+    assert jobs.job_cancel_idle() == 1
+    assert jobs.job_get("idle-a")["status"] == "cancelled"
+    # a finished job waits for its result fetch instead
+    assert jobs.job_get("idle-b")["status"] == "completed"
+    assert jobs.job_get("idle-c")["status"] == "running"
+
+
+def test_delete_render_endpoint(client, queues):
+    _stored("api-running", "running")
+    _stored("api-done", "completed")
+    _stored("api-stems", "running", job_type="stems")
+    assert client.delete("/api/render/api-running").json() == {"job_id": "api-running", "status": "cancelled", "previous_status": "running"}
+    assert client.delete("/api/render/api-done").json() == {"job_id": "api-done", "status": "discarded", "previous_status": "completed"}
+    assert client.delete("/api/render/api-stems").status_code == 404
+    assert client.delete("/api/render/missing").status_code == 404
+
+
+def _events(body):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_events_stream_each_change_until_the_job_ends(client):
+    _stored("sse-job", "running")
+    jobs.job_update("sse-job", {"progress": 0.0})
+
+    def worker():
+        for progress in (0.25, 0.25, 0.5, 1.0):
+            time.sleep(0.05)
+            jobs.job_update("sse-job", {"progress": progress})
+        jobs.job_update("sse-job", {"status": "completed", "speed": 2.0})
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    response = client.get("/api/render/events", params={"job_id": "sse-job"})
+    thread.join()
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("retry: 2000\n\n")
+    events = _events(response.text)
+    # unchanged snapshots are not repeated; every frame is a full /render/progress payload
+    assert events[-1]["status"] == "completed" and events[-1]["speed"] == 2.0
+    progress = [e["progress"] for e in events]
+    assert progress[0] == 0.0 and progress == sorted(progress)
+    assert len(events) == len({json.dumps(e, sort_keys=True) for e in events})
+    assert set(events[0]) == set(client.get("/api/render/progress", params={"job_id": "sse-job"}).json())
+
+
+def test_events_keep_alive_and_end_when_the_job_is_discarded(client, monkeypatch):
+    monkeypatch.setattr(jobs, "_SSE_HEARTBEAT_SECONDS", 0.05)
+    _stored("sse-gone", "queued")
+    threading.Timer(0.3, jobs.job_pop, args=("sse-gone",)).start()
+    response = client.get("/api/render/events", params={"job_id": "sse-gone"})
+    assert ": keep-alive\n\n" in response.text
+    assert [e["status"] for e in _events(response.text)] == ["queued"]
+    assert "sse-gone" not in jobs._WATCHERS
+    assert client.get("/api/render/events", params={"job_id": "sse-gone"}).status_code == 404
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from services.loudness import (
+    album_loudness,
+    measure_loudness,
+    measure_loudness_batch,
+    measurement_get,
+    measurement_id,
+    measurement_put,
+)
+
+SR = 48000
+
+
+def _sine(seconds, dbfs, freq=1000.0, channels=2, phase=0.0):
+    t = np.arange(int(seconds * SR)) / SR
+    x = 10 ** (dbfs / 20.0) * np.sin(2 * np.pi * freq * t + phase)
+    return np.stack([x] * channels, axis=1)
+
+
+def _program(seconds=20.0, seed=0):
+    # noise whose level steps between two values every 2 s: a non-zero loudness range, modest peaks
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SR)
+    level = np.where((np.arange(n) // (2 * SR)) % 2, 0.05, 0.02)
+    x = rng.standard_normal(n) * level
+    return np.stack([x, x], axis=1)
+
+
+def test_ebu_reference_sine_reads_minus_23(ffmpeg_exe, write_wav):
+    # EBU Tech 3341 case 1: stereo 1 kHz sine at -23 dBFS reads -23.0 LUFS
+    result = measure_loudness(ffmpeg_exe, write_wav(_sine(20, -23.0)), include_curves=True)
+    assert float(result["input_i"]) == pytest.approx(-23.0, abs=0.1)
+    assert float(result["input_tp"]) == pytest.approx(-23.0, abs=0.2)
+    assert result["curve_hop_seconds"] == pytest.approx(0.1)
+    assert result["momentary"][-1] == pytest.approx(-23.0, abs=0.1)
+    assert result["duration"] == pytest.approx(20.0, abs=0.01)
+
+
+def test_true_peak_sees_intersample_peaks(ffmpeg_exe, write_wav):
+    # fs/4 with a 45 degree phase: every sample sits at 0.707 of the real peak
+    x = _sine(5, -1.0, freq=SR / 4, phase=np.pi / 4)
+    assert 20 * np.log10(np.abs(x).max()) == pytest.approx(-4.0, abs=0.05)
+    result = measure_loudness(ffmpeg_exe, write_wav(x), include_curves=False)
+    assert float(result["input_tp"]) > -1.6
+
+
+def test_program_within_limits_is_linear(ffmpeg_exe, write_wav):
+    result = measure_loudness(ffmpeg_exe, write_wav(_program()), target_i=-23.0, target_tp=-1.0, target_lra=20.0, include_curves=False)
+    assert float(result["input_lra"]) > 1.0
+    assert result["normalization_type"] == "linear"
+    assert result["output_i"] == "-23.00"
+    assert result["target_offset"] == "0.00"
+
+
+def test_loud_target_goes_dynamic_without_a_fake_offset(ffmpeg_exe, write_wav):
+    result = measure_loudness(ffmpeg_exe, write_wav(_program()), target_i=-5.0, target_tp=-1.0, include_curves=False)
+    assert result["normalization_type"] == "dynamic"
+    assert result["target_offset"] is None
+    assert result["output_i"] is None
+
+
+@pytest.mark.parametrize("samples", [
+    np.zeros((5 * SR, 2)),  # silence: threshold -70, I -inf
+    _sine(1.0, -20.0),  # under 3 s: no short-term block, LRA 0
+    _sine(10.0, -20.0),  # steady tone: LRA 0
+], ids=["silent", "short", "steady"])
+def test_loudnorm_sentinels_are_never_linear(ffmpeg_exe, write_wav, samples):
+    result = measure_loudness(ffmpeg_exe, write_wav(samples), target_i=-23.0, target_tp=-1.0, include_curves=False)
+    assert result["normalization_type"] == "dynamic"
+    assert result["target_offset"] is None
+
+
+def test_silence_reports_the_absolute_gate(ffmpeg_exe, write_wav):
+    result = measure_loudness(ffmpeg_exe, write_wav(np.zeros((3 * SR, 2))), include_curves=False)
+    assert result["input_i"] == "-inf"
+    assert result["input_thresh"] == "-70.00"
+
+
+def test_album_loudness_pools_the_gating_blocks(ffmpeg_exe, write_wav):
+    quiet = measure_loudness(ffmpeg_exe, write_wav(_sine(10, -30.0), name="q.wav"), include_curves=False, include_blocks=True)
+    loud = measure_loudness(ffmpeg_exe, write_wav(_sine(10, -20.0), name="l.wav"), include_curves=False, include_blocks=True)
+    album = album_loudness([quiet["gating_blocks"], loud["gating_blocks"]])
+    # equal durations, both above the relative gate: the album is the energy mean, not the mean of the LUFS values
+    expected = 10 * np.log10((10 ** (float(quiet["input_i"]) / 10) + 10 ** (float(loud["input_i"]) / 10)) / 2)
+    assert album["integrated"] == pytest.approx(expected, abs=0.1)
+    assert album_loudness([])["integrated"] == float("-inf")
+
+
+def test_batch_measures_in_parallel_and_reports_failures(ffmpeg_exe, write_wav, tmp_path):
+    broken = tmp_path / "broken.wav"
+    broken.write_bytes(b"not audio")
+    results = measure_loudness_batch(ffmpeg_exe, [write_wav(_sine(5, -23.0)), broken])
+    assert float(results[0]["input_i"]) == pytest.approx(-23.0, abs=0.1)
+    assert len(results[0]["gating_blocks"])
+    assert isinstance(results[1], Exception)
+
+
+def test_measurement_cache_is_keyed_by_engine_and_targets():
+    native = measurement_id("a" * 64, "native", -14, -1.5, 11)
+    assert native != measurement_id("a" * 64, "ffmpeg", -14, -1.5, 11)
+    assert native != measurement_id("a" * 64, "native", -16, -1.5, 11)
+    measurement_put(native, "a" * 64, "native", {"target_i": -14}, {"input_i": "-20.00", "momentary": [1.0]})
+    entry = measurement_get(native)
+    assert entry["engine"] == "native"
+    assert entry["measured"] == {"input_i": "-20.00"}
+    entry["measured"]["input_i"] = "0"
+    assert measurement_get(native)["measured"]["input_i"] == "-20.00"
+    assert measurement_get("missing") is None
@@ -0,0 +1,79 @@
+import re
+import sys
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from routers import score
+from services import metrics
+from services.metrics import metrics_text, observe_stage, stage_timer
+
+
+@pytest.fixture(autouse=True)
+def fresh_histograms(monkeypatch):
+    monkeypatch.setattr(metrics, "_HISTOGRAMS", {})
+
+
+def _samples(text, name):
+    return {line.split(" ")[0]: float(line.split(" ")[1]) for line in text.splitlines() if line.startswith(name)}
+
+
+def test_histogram_buckets_are_cumulative():
+    observe_stage("zip", 0.07)
+    observe_stage("zip", 3.0)
+    observe_stage("zip", 5000.0)
+    samples = _samples(metrics_text(), "sound_wave_stage_duration_seconds")
+    assert samples['sound_wave_stage_duration_seconds_bucket{stage="zip",le="0.05"}'] == 0
+    assert samples['sound_wave_stage_duration_seconds_bucket{stage="zip",le="0.1"}'] == 1
+    assert samples['sound_wave_stage_duration_seconds_bucket{stage="zip",le="5.0"}'] == 2
+    assert samples['sound_wave_stage_duration_seconds_bucket{stage="zip",le="1800.0"}'] == 2
+    assert samples['sound_wave_stage_duration_seconds_bucket{stage="zip",le="+Inf"}'] == 3
+    assert samples['sound_wave_stage_duration_seconds_count{stage="zip"}'] == 3
+    assert samples['sound_wave_stage_duration_seconds_sum{stage="zip"}'] == pytest.approx(5003.07)
+
+
+def test_stage_timer_records_failed_attempts():
+    with pytest.raises(ValueError), stage_timer("decode"):
+        raise ValueError
+    assert metrics._HISTOGRAMS["decode"]["count"] == 1
+
+
+class _Stop(Exception):
+    pass
+
+
+def test_score_pitch_stage_is_labelled_with_the_engine_id(monkeypatch, tmp_path):
+    def fake_track_pitch(*args, **kwargs):
+        raise _Stop
+
+    monkeypatch.setitem(sys.modules, "librosa", types.SimpleNamespace(load=lambda *a, **k: (np.zeros(22050), 22050)))
+    monkeypatch.setattr(score, "stem_cache_fetch", lambda key, run, dest: ({"vocals": Path("vocals.wav")}, True))
+    monkeypatch.setattr(score, "track_pitch", fake_track_pitch)
+    with pytest.raises(_Stop):
+        score._score_pipeline(
+            tmp_path, tmp_path / "in.wav", "htdemucs", 80, 0.5, time.time(), lambda msg: None,
+            audio_id="a" * 64, pitch_engine="crepe-tiny",
+        )
+    assert sorted(metrics._HISTOGRAMS) == ["crepe-tiny", "decode"]
+
+
+def test_exposition_is_well_formed(client):
+    observe_stage("pyin", 1.0)
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    families = set()
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            families.add(line.split(" ")[2])
+            continue
+        if line.startswith("#"):
+            continue
+        assert re.fullmatch(r'[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? \S+', line), line
+        assert any(line.startswith(family) for family in families), line
+    for family in ("sound_wave_jobs_running", "sound_wave_cache_hit_ratio", "sound_wave_workspace_bytes", "sound_wave_separation_workers"):
+        assert family in families
+    assert 'sound_wave_stage_duration_seconds_count{stage="pyin"} 1' in response.text
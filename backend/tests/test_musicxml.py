@@ -0,0 +1,128 @@
+import sys
+import types
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+from services import musicxml
+from services.musicxml import events_to_musicxml, quantize_events, write_musicxml
+
+# at 120 bpm with divisions=4 one grid unit is a sixteenth, 0.125 s; a 4/4 measure is 16 units (2 s)
+UNIT = 0.125
+
+
+def _measures(xml):
+    root = ET.fromstring(xml.split("\n", 2)[2])
+    return root, root.findall("part/measure")
+
+
+def _sounding(measures):
+    """[(midi, total duration)] of tied note chains, in order."""
+    chains = []
+    for measure in measures:
+        for note in measure.findall("note"):
+            if note.find("rest") is not None:
+                continue
+            pitch = note.find("pitch")
+            alter = int(pitch.findtext("alter") or 0)
+            midi = (int(pitch.findtext("octave")) + 1) * 12 + "C D EF G A B".index(pitch.findtext("step")) + alter
+            length = int(note.findtext("duration"))
+            if any(tie.get("type") == "stop" for tie in note.findall("tie")):
+                assert chains[-1][0] == midi
+                chains[-1][1] += length
+            else:
+                chains.append([midi, length])
+    return [tuple(chain) for chain in chains]
+
+
+def test_quantize_snaps_to_the_grid_without_overlaps():
+    events = [(0.01, 0.49, 60), (0.45, 0.8, 62), (0.9, 0.93, 64), (1.0, 1.5, 65)]
+    # the second note starts where the first ends; the third rounds to nothing
+    assert quantize_events(events, UNIT) == [(0, 4, 60), (4, 6, 62), (8, 12, 65)]
+    assert quantize_events([], UNIT) == []
+
+
+def test_split_value_uses_dotted_and_plain_values():
+    spellings = musicxml._spellings(4)
+    assert musicxml._split_value(6, spellings) == [(6, "quarter", True)]
+    assert musicxml._split_value(5, spellings) == [(4, "quarter", False), (1, "16th", False)]
+    assert musicxml._split_value(16, spellings) == [(16, "whole", False)]
+    # 32nds only exist on a finer grid
+    assert (1, "32nd", False) in musicxml._spellings(8) and all(value >= 1 for value, _, _ in spellings)
+
+
+def test_measures_are_full_and_notes_keep_their_length():
+    events = [(0.0, 0.75, 67), (1.25, 2.75, 69), (3.0, 3.5, 71), (6.5, 7.0, 72)]
+    root, measures = _measures(events_to_musicxml(events, title="Song"))
+    assert root.findtext("work/work-title") == "Song"
+    assert [m.get("number") for m in measures] == ["1", "2", "3", "4"]
+    for measure in measures:
+        assert sum(int(n.findtext("duration")) for n in measure.findall("note")) == 16
+    # the A4 crossing the first barline is tied across it and keeps its 12 units
+    assert _sounding(measures) == [(67, 6), (69, 12), (71, 4), (72, 4)]
+    a4 = [n for n in measures[1].findall("note") if n.find("pitch") is not None][0]
+    assert [t.get("type") for t in a4.findall("tie")] == ["stop"]
+    # measure 3 is empty: one whole-measure rest
+    rests = measures[2].findall("note")
+    assert len(rests) == 1 and rests[0].find("rest").get("measure") == "yes"
+    assert measures[-1].findtext("barline/bar-style") == "light-heavy"
+
+
+def test_attributes_tempo_and_clef():
+    root, measures = _measures(events_to_musicxml([(0.0, 1.0, 60)], tempo_bpm=90, beats=3, divisions=8))
+    attributes = measures[0].find("attributes")
+    assert attributes.findtext("divisions") == "8" and attributes.findtext("time/beats") == "3"
+    assert attributes.findtext("clef/sign") == "G"
+    assert measures[0].findtext("direction/direction-type/metronome/per-minute") == "90"
+    assert measures[0].find("direction/sound").get("tempo") == "90"
+    # 1 s at 90 bpm is 1.5 quarters = 12 units at divisions 8
+    assert _sounding(measures) == [(60, 12)]
+    _, low = _measures(events_to_musicxml([(0.0, 0.5, 43), (0.5, 1.0, 48)]))
+    assert low[0].findtext("attributes/clef/sign") == "F" and low[0].findtext("attributes/clef/line") == "4"
+
+
+def test_accidentals_follow_the_measure():
+    # C#4, C#4, C4 in one measure, then C#4 in the next
+    events = [(0.0, 0.25, 61), (0.25, 0.5, 61), (0.5, 0.75, 60), (2.0, 2.25, 61)]
+    _, measures = _measures(events_to_musicxml(events))
+    marks = [(n.findtext("pitch/step"), n.findtext("accidental")) for m in measures for n in m.findall("note") if n.find("pitch") is not None]
+    assert marks == [("C", "sharp"), ("C", None), ("C", "natural"), ("C", "sharp")]
+
+
+def test_empty_melody_is_one_measure_of_rest(tmp_path):
+    path = write_musicxml([], tmp_path / "empty.musicxml")
+    text = path.read_text(encoding="utf-8")
+    assert text.startswith('<?xml version="1.0" encoding="UTF-8"') and "<!DOCTYPE score-partwise" in text
+    _, measures = _measures(text)
+    assert len(measures) == 1 and measures[0].find("note/rest").get("measure") == "yes"
+
+
+def test_music21_export_is_cached_by_midi_content(tmp_path, monkeypatch):
+    parsed = []
+
+    def parse(path):
+        parsed.append(path)
+        return types.SimpleNamespace(write=lambda fmt, fp: Path(fp).write_text(f"<{fmt}/>"))
+
+    monkeypatch.setitem(sys.modules, "music21.converter", types.SimpleNamespace(parse=parse))
+    monkeypatch.setattr(musicxml, "_MUSIC21_CACHE", OrderedDict())
+    monkeypatch.setattr(musicxml, "_MUSIC21_CACHE_SIZE", 1)
+    first, second = tmp_path / "a.mid", tmp_path / "b.mid"
+    first.write_bytes(b"MThd-a")
+    second.write_bytes(b"MThd-b")
+    musicxml.music21_musicxml(first, tmp_path / "1.musicxml")
+    musicxml.music21_musicxml(first, tmp_path / "2.musicxml")
+    assert len(parsed) == 1 and (tmp_path / "2.musicxml").read_text() == "<musicxml/>"
+    # the cache holds one melody: another evicts the first
+    musicxml.music21_musicxml(second, tmp_path / "3.musicxml")
+    musicxml.music21_musicxml(first, tmp_path / "4.musicxml")
+    assert len(parsed) == 3
+
+
+@pytest.mark.parametrize("midi, spelled", [(60, ("C", None, "4")), (70, ("A", "1", "4")), (21, ("A", None, "0")), (108, ("C", None, "8"))])
+def test_pitch_spelling(midi, spelled):
+    _, measures = _measures(events_to_musicxml([(0.0, 0.5, midi)]))
+    pitch = measures[0].find("note/pitch")
+    assert (pitch.findtext("step"), pitch.findtext("alter"), pitch.findtext("octave")) == spelled
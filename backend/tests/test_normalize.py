@@ -0,0 +1,199 @@
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from services.ffmpeg import AUDIO_OUTPUT_FORMATS, audio_output_args, has_encoder
+from services.loudness import measure_loudness
+
+SR = 48000
+
+
+def _program(level=0.05, seconds=12.0, seed=0):
+    # noise stepping between two levels every 2 s: a real loudness range with modest peaks
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SR)
+    x = rng.standard_normal(n) * np.where((np.arange(n) // (2 * SR)) % 2, level, level * 0.4)
+    return np.stack([x, x], axis=1).astype(np.float32)
+
+
+def _wav_bytes(samples):
+    buf = io.BytesIO()
+    wavfile.write(buf, SR, samples)
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def program():
+    return _wav_bytes(_program())
+
+
+def _upload(program_bytes, name="program.wav"):
+    return {"file": (name, program_bytes, "audio/wav")}
+
+
+def test_native_and_ffmpeg_engines_agree(client, ffmpeg_exe, program):
+    native = client.post("/api/audio/measure-lufs", params={"curves": False}, files=_upload(program)).json()
+    loudnorm = client.post("/api/audio/measure-lufs", params={"engine": "ffmpeg", "audio_id": native["audio_id"]}).json()
+    assert float(native["input_i"]) == pytest.approx(float(loudnorm["input_i"]), abs=0.3)
+    assert float(native["input_tp"]) == pytest.approx(float(loudnorm["input_tp"]), abs=0.5)
+    assert float(native["input_lra"]) == pytest.approx(float(loudnorm["input_lra"]), abs=1.0)
+    # loudnorm's analysis pass has no measured_* values and always prints "dynamic"; only the native
+    # meter predicts what the second pass will do
+    assert native["normalization_type"] == "linear"
+    assert native["measurement_id"] != loudnorm["measurement_id"]
+
+
+def test_measurement_id_skips_pass_one(client, ffmpeg_exe, program, tmp_path):
+    measured = client.post("/api/audio/measure-lufs", params={"curves": False, "target_lufs": -16}, files=_upload(program)).json()
+    response = client.post("/api/audio/normalize", params={"measurement_id": measured["measurement_id"], "target_lufs": -16})
+    assert response.status_code == 200
+    assert response.headers["x-measurement-cache"] == "hit"
+    assert response.headers["x-measurement-id"] == measured["measurement_id"]
+    out = tmp_path / "out.wav"
+    out.write_bytes(response.content)
+    assert float(measure_loudness(ffmpeg_exe, out, include_curves=False)["input_i"]) == pytest.approx(-16.0, abs=0.5)
+
+    # other targets: the token does not apply, so pass one runs again under its own id
+    other = client.post("/api/audio/normalize", params={"measurement_id": measured["measurement_id"], "target_lufs": -20})
+    assert other.headers["x-measurement-cache"] == "miss"
+    assert other.headers["x-measurement-id"] != measured["measurement_id"]
+
+
+def test_dynamic_mode_takes_loudnorms_own_offset(client, ffmpeg_exe, program):
+    # +10 dB would push the peaks over -1.5 dBTP: the native meter cannot predict the offset
+    measured = client.post("/api/audio/measure-lufs", params={"curves": False, "target_lufs": -8}, files=_upload(program)).json()
+    assert measured["normalization_type"] == "dynamic" and measured["target_offset"] is None
+    response = client.post("/api/audio/normalize", params={"measurement_id": measured["measurement_id"], "target_lufs": -8})
+    assert response.status_code == 200
+    assert response.headers["x-measurement-cache"] == "miss"
+
+
+def test_bad_requests(client, ffmpeg_exe, program):
+    assert client.post("/api/audio/normalize", params={"measurement_id": "nope"}).status_code == 404
+    assert client.post("/api/audio/measure-lufs", params={"engine": "ebur128"}, files=_upload(program)).status_code == 400
+    assert client.post("/api/audio/normalize", params={"engine": "ebur128"}, files=_upload(program)).status_code == 400
+
+
+# lossy encoders shave the noise program's top octave, so they land a little under target
+@pytest.mark.parametrize("fmt, media_type, magic, tolerance", [
+    ("flac", "audio/flac", b"fLaC", 0.5),
+    ("opus", "audio/ogg", b"OggS", 1.5),
+    ("mp3", "audio/mpeg", b"ID3", 1.5),
+])
+@pytest.mark.parametrize("stream", [False, True])
+def test_compact_formats_stream_or_go_through_a_file(client, ffmpeg_exe, program, tmp_path, fmt, media_type, magic, tolerance, stream):
+    if not has_encoder(AUDIO_OUTPUT_FORMATS[fmt]["encoder"]):
+        pytest.skip(f"ffmpeg build has no {fmt} encoder")
+    response = client.post("/api/audio/normalize", params={"format": fmt, "stream": stream, "target_lufs": -16}, files=_upload(program))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert response.headers["content-disposition"].endswith(f'program_norm.{AUDIO_OUTPUT_FORMATS[fmt]["ext"]}"')
+    # streamed responses have no length up front
+    assert ("content-length" in response.headers) != stream
+    assert response.content.startswith(magic)
+    out = tmp_path / f"out.{fmt}"
+    out.write_bytes(response.content)
+    result = measure_loudness(ffmpeg_exe, out, include_curves=False)
+    assert float(result["input_i"]) == pytest.approx(-16.0, abs=tolerance)
+    assert result["duration"] == pytest.approx(12.0, abs=0.1)
+
+
+def test_wav_is_never_streamed(client, ffmpeg_exe, program):
+    response = client.post("/api/audio/normalize", params={"format": "wav", "stream": True}, files=_upload(program))
+    assert response.status_code == 200
+    # a file-backed WAV has real RIFF/data sizes, not the 0xFFFFFFFF placeholders of a pipe
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert struct.unpack("<I", response.content[4:8])[0] == len(response.content) - 8
+
+
+def test_output_args():
+    args, spec = audio_output_args("MP3", "128k")
+    assert spec["name"] == "mp3"
+    assert args == ["-c:a", "libmp3lame", "-ar", "48000", "-b:a", "128k", "-f", "mp3"]
+    assert audio_output_args("flac")[0] == ["-c:a", "flac", "-ar", "48000", "-sample_fmt", "s16", "-f", "flac"]
+    assert audio_output_args(None)[1]["encoder"] == "pcm_s16le"
+    for bad in ("128", "999k", "16k"):
+        with pytest.raises(ValueError, match="bitrate"):
+            audio_output_args("opus", bad)
+    with pytest.raises(ValueError, match="unknown output format"):
+        audio_output_args("aiff")
+
+
+def test_bad_format_or_bitrate_is_a_400(client, ffmpeg_exe, program):
+    assert client.post("/api/audio/normalize", params={"format": "aiff"}, files=_upload(program)).status_code == 400
+    assert client.post("/api/audio/normalize", params={"format": "opus", "bitrate": "5000k"}, files=_upload(program)).status_code == 400
+
+
+def _batch(client, uploads, **params):
+    files = [("files", (name, data, "audio/wav")) for name, data in uploads]
+    return client.post("/api/audio/normalize-batch", params=params, files=files)
+
+
+def _unzip(response):
+    zf = zipfile.ZipFile(io.BytesIO(response.content))
+    return zf, json.loads(zf.read("report.json"))
+
+
+@pytest.fixture(scope="module")
+def album():
+    # the second track sits ~8 dB under the first
+    return [("loud.wav", _wav_bytes(_program(seconds=6.0))), ("quiet.wav", _wav_bytes(_program(level=0.02, seconds=6.0, seed=1)))]
+
+
+def test_batch_track_mode_brings_every_track_to_target(client, ffmpeg_exe, album, tmp_path):
+    response = _batch(client, album, mode="track", target_lufs=-16)
+    assert response.status_code == 200
+    zf, report = _unzip(response)
+    assert report["mode"] == "track" and report["album"]["gain_db"] is None
+    assert response.headers["x-album-loudness"] == str(report["album"]["input_i"])
+    loud, quiet = report["tracks"]
+    assert quiet["gain_db"] - loud["gain_db"] == pytest.approx(8.0, abs=0.3)
+    assert sorted(zf.namelist()) == ["01_loud_norm.wav", "02_quiet_norm.wav", "report.json"]
+    for track in report["tracks"]:
+        out = tmp_path / track["output"]
+        out.write_bytes(zf.read(track["output"]))
+        assert float(measure_loudness(ffmpeg_exe, out, include_curves=False)["input_i"]) == pytest.approx(-16.0, abs=0.3)
+
+
+def test_batch_album_mode_keeps_the_balance(client, ffmpeg_exe, album, tmp_path):
+    _, track_report = _unzip(_batch(client, album, mode="track", target_lufs=-16))
+    zf, report = _unzip(_batch(client, album, mode="album", target_lufs=-16))
+    loud, quiet = report["tracks"]
+    assert loud["gain_db"] == quiet["gain_db"] == report["album"]["gain_db"]
+    assert report["album"]["gain_db"] == pytest.approx(-16 - report["album"]["input_i"], abs=0.01)
+    # the album sits between its tracks; both modes share the same native measurements
+    assert float(quiet["measured"]["input_i"]) < report["album"]["input_i"] < float(loud["measured"]["input_i"])
+    assert [t["measurement_id"] for t in report["tracks"]] == [t["measurement_id"] for t in track_report["tracks"]]
+    levels = []
+    for track in report["tracks"]:
+        out = tmp_path / track["output"]
+        out.write_bytes(zf.read(track["output"]))
+        levels.append(float(measure_loudness(ffmpeg_exe, out, include_curves=False)["input_i"]))
+    assert levels[0] - levels[1] == pytest.approx(float(loud["measured"]["input_i"]) - float(quiet["measured"]["input_i"]), abs=0.3)
+
+
+def test_batch_reports_a_broken_track_and_keeps_the_rest(client, ffmpeg_exe, album):
+    response = _batch(client, [album[0], ("broken.wav", b"RIFF-not-really")])
+    assert response.status_code == 200
+    zf, report = _unzip(response)
+    good, broken = report["tracks"]
+    assert "error" not in good and good["output"] in zf.namelist()
+    assert broken["error"] and "output" not in broken
+    assert report["album"]["input_i"] == pytest.approx(float(good["measured"]["input_i"]), abs=0.05)
+
+
+def test_batch_rejects_bad_requests(client, ffmpeg_exe, album, monkeypatch):
+    from routers import audio
+
+    assert _batch(client, album, mode="radio").status_code == 400
+    assert client.post("/api/audio/normalize-batch").status_code == 400
+    assert _batch(client, album, format="aiff").status_code == 400
+    monkeypatch.setattr(audio, "_BATCH_MAX_TRACKS", 1)
+    response = _batch(client, album)
+    assert response.status_code == 400
+    assert "1" in response.json()["detail"]
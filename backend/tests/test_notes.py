@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from services import notes
+from services.notes import hz_to_midi, segment_notes
+
+HOP = 0.01
+
+
+def _hz(midi):
+    return 440.0 * 2.0 ** ((np.asarray(midi, dtype=np.float64) - 69.0) / 12.0)
+
+
+def _track(*parts):
+    """Concatenate (midi or None, frames) parts into an f0 track; None is unvoiced (NaN)."""
+    return np.concatenate([np.full(frames, np.nan) if midi is None else _hz(np.full(frames, midi)) for midi, frames in parts])
+
+
+def test_hz_to_midi():
+    out = hz_to_midi(np.array([440.0, 261.6256, 0.0, -5.0, np.nan, 880.0]))
+    assert out[[0, 1, 5]] == pytest.approx([69.0, 60.0, 81.0], abs=1e-4)
+    assert np.isnan(out[2:5]).all()
+
+
+def test_nan_median_matches_brute_force():
+    rng = np.random.default_rng(3)
+    pitch = rng.normal(60, 2, 400)
+    pitch[rng.random(400) < 0.3] = np.nan
+    width = 7
+    padded = np.pad(pitch, width // 2, constant_values=np.nan)
+    expected = np.array([np.nanmedian(padded[i:i + width]) if np.isfinite(padded[i:i + width]).any() else np.nan for i in range(len(pitch))])
+    expected[np.isnan(pitch)] = np.nan
+    np.testing.assert_allclose(notes._nan_median(pitch, width), expected, equal_nan=True)
+
+
+def test_steady_notes_and_rests():
+    f0 = _track((60, 50), (None, 20), (64, 40), (67, 30))
+    events = segment_notes(f0, None, HOP)
+    assert [n for _, _, n in events] == [60, 64, 67]
+    assert events[0][:2] == pytest.approx((0.0, 0.5))
+    assert events[1][:2] == pytest.approx((0.7, 1.1))
+    assert events[2][:2] == pytest.approx((1.1, 1.4))
+
+
+def test_low_voicing_probability_is_a_rest():
+    f0 = _track((62, 100))
+    prob = np.ones(100)
+    prob[40:60] = 0.2
+    prob[50] = np.nan
+    events = segment_notes(f0, prob, HOP, voicing_thresh=0.6)
+    assert [(round(s, 2), round(e, 2), n) for s, e, n in events] == [(0.0, 0.4, 62), (0.6, 1.0, 62)]
+
+
+def test_vibrato_across_a_boundary_holds_the_note():
+    # a 5.5 Hz, +-0.4 semitone vibrato around 60.3 keeps crossing the 60/61 rounding boundary
+    t = np.arange(200) * HOP
+    f0 = _hz(60.3 - 0.4 * np.cos(2 * np.pi * 5.5 * t))
+    assert [n for _, _, n in segment_notes(f0, None, HOP, min_note_ms=20)] == [60]
+    # which the plain rounded runs would not
+    assert len(notes._runs(np.rint(hz_to_midi(f0)))[0]) > 10
+
+
+def test_short_blips_join_a_neighbour_or_are_dropped():
+    # a 5-frame glitch inside a note is absorbed by its longer neighbour
+    f0 = _track((60, 40), (72, 5), (60, 60))
+    assert [(round(s, 2), round(e, 2), n) for s, e, n in segment_notes(f0, None, HOP)] == [(0.0, 1.05, 60)]
+    # an isolated blip between rests is too short to be a note
+    f0 = _track((None, 20), (65, 6), (None, 20), (67, 30))
+    assert [n for _, _, n in segment_notes(f0, None, HOP)] == [67]
+
+
+def test_degenerate_inputs():
+    assert segment_notes(np.array([]), None, HOP) == []
+    assert segment_notes(_track((60, 50)), None, 0.0) == []
+    assert segment_notes(_track((None, 50)), None, HOP) == []
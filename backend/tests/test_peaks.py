@@ -0,0 +1,121 @@
+import os
+import struct
+import time
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from services import peaks
+from services.ffmpeg import stream_process_sync
+from services.peaks import BASE_SAMPLES_PER_PIXEL, PEAKS_SAMPLE_RATE, ensure_peaks, get_peaks_summary, render_peaks
+
+# 10 s of int16 noise at the pyramid's own rate, so the decode is bit-exact; the length leaves a partial last pixel
+_SAMPLES = np.random.default_rng(1).integers(-30000, 30000, PEAKS_SAMPLE_RATE * 10 + 1000).astype(np.int16)
+
+
+@pytest.fixture
+def track(ffmpeg_exe, tmp_path):
+    path = tmp_path / "noise.wav"
+    wavfile.write(str(path), PEAKS_SAMPLE_RATE, _SAMPLES)
+    content_hash = f"{tmp_path.name}-noise"
+    ensure_peaks(ffmpeg_exe, path, content_hash)
+    return content_hash
+
+
+def _decode(payload):
+    version, flags, sample_rate, spp, length = struct.unpack("<iIiiI", payload[:20])
+    data = np.frombuffer(payload[20:], dtype=np.int8 if flags & 1 else "<i2").reshape(-1, 2)
+    assert version == 1 and sample_rate == PEAKS_SAMPLE_RATE and len(data) == length
+    return spp, data
+
+
+def _expected(spp, first=0, last=None):
+    pixels = -(-len(_SAMPLES) // spp)
+    last = pixels if last is None else last
+    return np.array([
+        [_SAMPLES[p * spp:(p + 1) * spp].min(), _SAMPLES[p * spp:(p + 1) * spp].max()]
+        for p in range(first, last)
+    ])
+
+
+def test_minmax_and_halve():
+    samples = np.array([3, -1, 4, 1, -5, 9, 2], dtype=np.int16)
+    level = peaks._minmax(samples, 3)
+    np.testing.assert_array_equal(level, [[-1, 4], [-5, 9], [2, 2]])
+    np.testing.assert_array_equal(peaks._halve(level), [[-5, 9], [2, 2]])
+
+
+def test_summary_lists_the_pyramid(track):
+    summary = get_peaks_summary(track)
+    assert summary["sample_rate"] == PEAKS_SAMPLE_RATE
+    assert summary["levels"][0] == {"samples_per_pixel": BASE_SAMPLES_PER_PIXEL, "length": -(-len(_SAMPLES) // BASE_SAMPLES_PER_PIXEL)}
+    assert [lvl["samples_per_pixel"] for lvl in summary["levels"][:3]] == [256, 512, 1024]
+    assert summary["levels"][-1]["length"] == 1
+
+
+@pytest.mark.parametrize("spp", [256, 512, 768, 1024, 256 * 40])
+def test_render_matches_brute_force_at_exact_zoom(track, spp):
+    got_spp, data = _decode(render_peaks(track, spp, bits=16))
+    assert got_spp == spp
+    np.testing.assert_array_equal(data, _expected(spp))
+
+
+def test_render_window_and_8_bit(track):
+    spp = 1024
+    start, end = 2.0, 3.5
+    first, last = int(start * PEAKS_SAMPLE_RATE) // spp, -(-int(end * PEAKS_SAMPLE_RATE) // spp)
+    _, data = _decode(render_peaks(track, spp, bits=8, start=start, end=end))
+    np.testing.assert_array_equal(data, _expected(spp, first, last) >> 8)
+    assert _decode(render_peaks(track, spp, start=20.0))[1].shape == (0, 2)
+    assert render_peaks("missing", spp) is None
+
+
+def test_cache_survives_the_memory_lru(ffmpeg_exe, track, monkeypatch):
+    monkeypatch.setattr(peaks, "_MEMORY", type(peaks._MEMORY)())
+    hits = peaks.peaks_cache_stats()["hits"]
+    ensure_peaks(ffmpeg_exe, "/nonexistent.wav", track)  # served from the .npz, never decoded
+    assert peaks.peaks_cache_stats()["hits"] == hits + 1
+    np.testing.assert_array_equal(_decode(render_peaks(track, 256, bits=16))[1], _expected(256))
+
+
+def test_decode_failure_reports_ffmpeg_stderr(ffmpeg_exe, tmp_path):
+    with pytest.raises(RuntimeError, match="exited with"):
+        ensure_peaks(ffmpeg_exe, tmp_path / "missing.wav", f"{tmp_path.name}-missing")
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc to see the child exit")
+def test_closing_a_sync_stream_kills_the_process(ffmpeg_exe):
+    pids = []
+    chunks = stream_process_sync(
+        [ffmpeg_exe, "-v", "error", "-f", "lavfi", "-i", "sine=d=600", "-f", "s16le", "-"],
+        chunk_size=4096, on_start=pids.append,
+    )
+    assert len(next(chunks)) == 4096
+    chunks.close()
+    deadline = time.time() + 5
+    while os.path.exists(f"/proc/{pids[0]}") and time.time() < deadline:
+        time.sleep(0.05)
+    assert not os.path.exists(f"/proc/{pids[0]}")
+
+
+def test_peaks_api_round_trip(client, ffmpeg_exe, tmp_path):
+    path = tmp_path / "api.wav"
+    wavfile.write(str(path), PEAKS_SAMPLE_RATE, _SAMPLES[::-1].copy())
+    built = client.post("/api/audio/peaks", files={"file": ("api.wav", path.read_bytes(), "audio/wav")})
+    assert built.status_code == 200
+    audio_hash = built.json()["audio_hash"]
+    assert client.get(f"/api/audio/peaks/{audio_hash}/info").json() == built.json()
+    # the upload is already in the store: audio_id builds from there (and hits the pyramid cache)
+    assert client.post("/api/audio/peaks", params={"audio_id": audio_hash}).json() == built.json()
+
+    response = client.get(f"/api/audio/peaks/{audio_hash}", params={"samples_per_pixel": 512, "bits": 16})
+    assert response.headers["cache-control"].endswith("immutable")
+    spp, data = _decode(response.content)
+    assert spp == 512
+    assert data[0].tolist() == [_SAMPLES[::-1][:512].min(), _SAMPLES[::-1][:512].max()]
+
+    assert client.get(f"/api/audio/peaks/{audio_hash}", params={"bits": 12}).status_code == 400
+    assert client.get("/api/audio/peaks/not-a-hash").status_code == 400
+    assert client.get(f"/api/audio/peaks/{'0' * 64}").status_code == 404
+    assert client.get(f"/api/audio/peaks/{'0' * 64}/info").status_code == 404
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from services import pitch
+
+SR = 22050
+HOP = 256
+
+
+# Stand-in for librosa.pyin in a chunk worker (spawn workers import it from this module by name): the
+# "pitch" of every frame is 100 Hz plus its global frame index, so any misalignment shows up in the stitch.
+def _indexed_chunk(shm_name, length, start, stop, sr, hop_length, frame_length, fmin, fmax):
+    first = start // hop_length
+    frames = np.arange(first, first + 1 + (stop - start) // hop_length + 4)
+    return 100.0 + frames, np.ones(len(frames))
+
+
+@pytest.fixture
+def pool():
+    yield
+    pitch.shutdown_pitch_pool()
+
+
+def test_plan_chunks_covers_every_frame_once():
+    chunks = pitch._plan_chunks(1001, 4, 50)
+    assert [c[0] for c in chunks] == [0, 250, 500, 750]
+    assert [c[1] for c in chunks] == [250, 500, 750, 1001]
+    assert chunks[0][2] == 0 and chunks[-1][3] == 1001
+    assert all(decode_start == max(0, lo - 50) and decode_stop == min(1001, hi + 50) for lo, hi, decode_start, decode_stop in chunks)
+
+
+def test_stitch_cuts_where_the_tracks_agree_nearest_the_boundary():
+    # both chunks cover frames 80..119; they agree only from frame 104 on
+    left = (np.full(120, 200.0), np.ones(120))
+    right_f0 = np.full(60, 200.0)
+    right_f0[:24] = 300.0
+    right = (right_f0, np.ones(60))
+    chunks = [(0, 100, 0, 120), (100, 140, 80, 140)]
+    assert pitch._stitch_point(left, right, 0, 80, 80, 120, 100) == 104
+    f0, _ = pitch._stitch(chunks, [left, right], 140)
+    assert np.all(f0[:104] == 200.0) and np.all(f0[104:] == 200.0)
+
+
+def test_stitch_treats_shared_silence_as_agreement():
+    left = (np.full(120, np.nan), np.zeros(120))
+    right = (np.full(60, 150.0), np.ones(60))
+    right[0][10:19] = np.nan  # frames 90..98 silent in both
+    assert pitch._stitch_point(left, right, 0, 80, 80, 120, 100) == 98
+    # nowhere to agree: cut at the nominal boundary
+    assert pitch._stitch_point(left, (np.full(60, 150.0), np.ones(60)), 0, 80, 80, 120, 100) == 100
+
+
+def test_chunked_pyin_reassembles_the_global_frame_grid(monkeypatch, pool):
+    monkeypatch.setattr(pitch, "_pyin_chunk", _indexed_chunk)
+    monkeypatch.setattr(pitch, "_PYIN_OVERLAP_SECONDS", 1.0)
+    y = np.zeros(SR * 30, dtype=np.float32)
+    n_frames = 1 + len(y) // HOP
+    f0, voiced_prob = pitch._pyin_chunked(y, SR, HOP, 2048, pitch.FMIN_HZ, pitch.FMAX_HZ, 3)
+    assert len(f0) == n_frames
+    np.testing.assert_array_equal(f0, 100.0 + np.arange(n_frames))
+    assert np.all(voiced_prob == 1.0)
+
+
+def test_cancel_stops_waiting_for_chunks(monkeypatch, pool):
+    import threading
+
+    monkeypatch.setattr(pitch, "_pyin_chunk", _indexed_chunk)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(pitch.PitchCancelled):
+        pitch._pyin_chunked(np.zeros(SR * 30, dtype=np.float32), SR, HOP, 2048, pitch.FMIN_HZ, pitch.FMAX_HZ, 2, cancel)
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    """A private copy of the engine registry."""
+    monkeypatch.setattr(pitch, "_ENGINES", dict(pitch._ENGINES))
+    return pitch._ENGINES
+
+
+def _constant_engine(hz, prob=1.0):
+    def run(y, sr, hop_length, frame_length, fmin, fmax, workers=1, cancel=None):
+        n = 1 + len(y) // hop_length
+        return np.full(n, hz, dtype=np.float32), np.full(n, prob), pitch._frame_times(n, sr, hop_length)
+
+    return run
+
+
+def test_engine_registry_reports_availability(engines):
+    pitch.register_pitch_engine("fake", _constant_engine(220.0), (), "always there")
+    pitch.register_pitch_engine("needs-missing", _constant_engine(220.0), ("no_such_module_xyz",))
+    listed = {e["id"]: e for e in pitch.pitch_engines()}
+    assert {"pyin", "yin", "crepe-tiny"} <= set(listed)
+    assert listed["fake"] == {"id": "fake", "description": "always there", "available": True}
+    assert listed["needs-missing"]["available"] is False
+    assert pitch.pitch_engine_available("nope") is False
+
+    f0, prob, times = pitch.track_pitch(np.zeros(SR), SR, engine="fake", hop_length=HOP)
+    assert f0.dtype == prob.dtype == times.dtype == np.float64
+    assert len(f0) == 1 + SR // HOP and times[1] == pytest.approx(HOP / SR)
+    with pytest.raises(RuntimeError, match="no_such_module_xyz"):
+        pitch.track_pitch(np.zeros(SR), SR, engine="needs-missing")
+    with pytest.raises(ValueError, match="unknown pitch engine"):
+        pitch.track_pitch(np.zeros(SR), SR, engine="nope")
+
+
+def test_periodicity_separates_tones_from_noise_and_silence():
+    n = 2 * SR
+    t = np.arange(n) / SR
+    tone = (0.3 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32)
+    noise = (0.3 * np.random.default_rng(0).standard_normal(n)).astype(np.float32)
+    frames = 1 + n // HOP
+    f0 = np.full(frames, 220.0)
+    inner = slice(8, -8)  # away from the zero-padded edges
+    assert pitch.periodicity(tone, SR, f0, HOP, 2048)[inner].min() > 0.95
+    assert pitch.periodicity(noise, SR, f0, HOP, 2048)[inner].max() < 0.3
+    assert not pitch.periodicity(np.zeros(n, dtype=np.float32), SR, f0, HOP, 2048).any()
+    f0[40:60] = np.nan
+    assert not pitch.periodicity(tone, SR, f0, HOP, 2048)[40:60].any()
+
+
+def test_periodicity_matches_a_per_frame_loop(monkeypatch):
+    # small blocks so the chunked path is exercised too
+    monkeypatch.setattr(pitch, "_PERIODICITY_CHUNK", 7)
+    rng = np.random.default_rng(1)
+    y = (0.2 * rng.standard_normal(SR // 2)).astype(np.float32)
+    f0 = rng.uniform(100.0, 400.0, 1 + len(y) // HOP)
+    out = pitch.periodicity(y, SR, f0, HOP, 1024)
+    padded = np.pad(y, 512)
+    for i in range(len(f0)):
+        frame = padded[i * HOP:i * HOP + 1024]
+        lag = int(round(SR / f0[i]))
+        head, shifted = frame[:512], frame[lag:lag + 512]
+        expected = np.dot(head, shifted) / max(np.sqrt(np.dot(head, head) * np.dot(shifted, shifted)), 1e-12)
+        assert out[i] == pytest.approx(np.clip(expected, 0.0, 1.0), abs=1e-4)
+
+
+def test_compare_pitch_tracks():
+    times = np.arange(10) * 0.01
+    ref_f0 = np.array([220.0] * 6 + [np.nan] * 4)
+    ref = (ref_f0, np.array([1.0] * 6 + [0.0] * 4), times)
+    # 4 frames spot on, one 100 cents sharp, one missing; one false alarm in the rests
+    f0 = np.array([220.0] * 4 + [220.0 * 2 ** (1 / 12), np.nan, 300.0, np.nan, np.nan, np.nan])
+    prob = np.array([1.0] * 5 + [0.0, 1.0, 0.0, 0.0, 0.0])
+    result = pitch.compare_pitch_tracks(ref, (f0, prob, times))
+    assert result == {
+        "raw_pitch_accuracy": round(4 / 6, 4),
+        "mean_abs_cents": 20.0,
+        "voicing_recall": round(5 / 6, 4),
+        "voicing_false_alarm": 0.25,
+        "overall_accuracy": 0.8,
+    }
+    assert pitch.compare_pitch_tracks(ref, ref)["raw_pitch_accuracy"] == 1.0
+
+
+def test_benchmark_scores_engines_against_the_reference(engines):
+    pitch.register_pitch_engine("ref", _constant_engine(220.0))
+    pitch.register_pitch_engine("sharp", _constant_engine(220.0 * 2 ** (1 / 12)))
+    pitch.register_pitch_engine("missing", _constant_engine(220.0), ("no_such_module_xyz",))
+    report = pitch.benchmark_pitch_engines(np.zeros(SR, dtype=np.float32), SR, ["sharp", "missing"], reference="ref", hop_length=HOP)
+    assert report["audio_seconds"] == 1.0 and report["reference"] == "ref"
+    assert list(report["engines"]) == ["ref", "sharp", "missing"]
+    assert report["engines"]["missing"] == {"available": False}
+    sharp = report["engines"]["sharp"]
+    assert sharp["raw_pitch_accuracy"] == 0.0 and sharp["mean_abs_cents"] == 100.0
+    assert sharp["voicing_recall"] == 1.0 and "speedup_vs_reference" in sharp
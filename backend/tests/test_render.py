@@ -0,0 +1,101 @@
+import io
+import re
+import subprocess
+import time
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from routers import render
+from services.ffmpeg import encoder_args, get_encoder_profile, has_encoder, profile_geometry
+
+SR = 22050
+FPS = 15
+SECONDS = 45
+
+
+@pytest.fixture(scope="module")
+def tone():
+    t = np.arange(SR * SECONDS) / SR
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2 * 32767).astype(np.int16)
+    buf = io.BytesIO()
+    wavfile.write(buf, SR, samples)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def x264(ffmpeg_exe):
+    if not has_encoder("libx264"):
+        pytest.skip("ffmpeg build has no libx264")
+    return ffmpeg_exe
+
+
+def _render(client, wav, **params):
+    query = {"width": 320, "height": 180, "fps": FPS, "profile": "archive", "visualization_types": "line,bars", **params}
+    job_id = client.post("/api/render/start", params=query, files={"file": ("tone.wav", wav, "audio/wav")}).json()["job_id"]
+    deadline = time.time() + 120
+    while True:
+        status = client.get("/api/render/progress", params={"job_id": job_id}).json()
+        if status["status"] in ("completed", "failed") or time.time() > deadline:
+            break
+        time.sleep(0.2)
+    assert status["status"] == "completed", status
+    response = client.get("/api/render/result", params={"job_id": job_id})
+    assert response.status_code == 200
+    return status, response.content
+
+
+def _frames(ffmpeg_exe, path):
+    proc = subprocess.run([ffmpeg_exe, "-hide_banner", "-i", str(path), "-map", "0:v:0", "-c", "copy", "-f", "null", "-"], capture_output=True, text=True)
+    return int(re.findall(r"frame=\s*(\d+)", proc.stderr)[-1])
+
+
+def test_auto_segment_count(monkeypatch):
+    monkeypatch.setattr(render.os, "cpu_count", lambda: 8)
+    assert render._auto_segment_count(10.0) == 1
+    assert render._auto_segment_count(65.0) == 3
+    assert render._auto_segment_count(3600.0) == 4  # half the cores
+
+
+def test_parallel_render_cuts_segments_on_frame_boundaries(client, x264, tone, tmp_path):
+    outputs = {}
+    for segments in (1, 2):
+        status, content = _render(client, tone, parallel_segments=segments)
+        assert status["progress"] == 1.0 and status["profile"] == "archive"
+        path = tmp_path / f"out_{segments}.mp4"
+        path.write_bytes(content)
+        outputs[segments] = path
+    # segments are cut on exact frame boundaries; the single pass may run one frame past the audio (-shortest)
+    assert _frames(x264, outputs[2]) == SECONDS * FPS
+    assert abs(_frames(x264, outputs[1]) - SECONDS * FPS) <= 1
+
+
+def test_preview_profile_scales_the_frame(client, x264, tone, tmp_path):
+    status, content = _render(client, tone, profile="preview", fps=30)
+    path = tmp_path / "preview.mp4"
+    path.write_bytes(content)
+    probe = subprocess.run([x264, "-hide_banner", "-i", str(path)], capture_output=True, text=True).stderr
+    assert re.search(r"Video: h264.*160x90.*15 fps", probe), probe
+    assert status["profile"] == "preview"
+
+
+def test_encoder_profiles():
+    assert get_encoder_profile(None)["name"] == "balanced"
+    preview = get_encoder_profile("PREVIEW")
+    assert preview["name"] == "preview"
+    with pytest.raises(ValueError, match="unknown encoder profile"):
+        get_encoder_profile("ultra")
+    # halved, kept even for yuv420p, frame rate capped
+    assert profile_geometry(preview, 1281, 719, 60) == (640, 360, 15)
+    assert profile_geometry(get_encoder_profile("archive"), 1280, 720, 60) == (1280, 720, 60)
+    args = encoder_args(preview, threads=3)
+    assert args[args.index("-preset") + 1] == "ultrafast"
+    assert args[args.index("-tune") + 1] == "fastdecode"
+    assert args[args.index("-threads") + 1] == "3"
+    assert "-tune" not in encoder_args(get_encoder_profile("balanced"))
+
+
+def test_unknown_profile_is_rejected(client, x264, tone):
+    response = client.post("/api/render/start", params={"profile": "ultra"}, files={"file": ("tone.wav", tone, "audio/wav")})
+    assert response.status_code == 400
@@ -0,0 +1,135 @@
+import io
+import json
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from routers import score
+from services.jobs import job_get
+
+
+def _wav():
+    buf = io.BytesIO()
+    wavfile.write(buf, 22050, np.zeros(22050, dtype=np.float32))
+    return {"file": ("song.wav", buf.getvalue(), "audio/wav")}
+
+
+def _fake_pipeline(fail_stage=None):
+    """Stand-in for _score_pipeline: walks the real stage bookkeeping with stub artifacts, then runs the
+    real PDF and ZIP stages."""
+    def run(tmp_dir, input_path, model, min_note_ms, voicing_thresh, start_ts, tlog, audio_id=None, source_name=None, pitch_engine="pyin", job_id=None, musicxml_engine="native"):
+        for stage in ("separate", "decode", "pitch", "notes", "midi", "musicxml"):
+            with score._score_stage(job_id, stage) as outcome:
+                if stage == fail_stage:
+                    raise RuntimeError(f"{stage} broke")
+                if stage == "pitch":
+                    outcome["engine"] = pitch_engine
+        midi_path, musicxml_path = tmp_dir / "vocal_melody.mid", tmp_dir / "vocal_melody.musicxml"
+        midi_path.write_bytes(b"MThd")
+        musicxml_path.write_text("<score-partwise/>")
+        score.job_update(job_id, {"artifacts": {"midi": str(midi_path), "musicxml": str(musicxml_path), "pdf": None}})
+        pdf_path = score._pdf_stage(job_id, tmp_dir, midi_path, musicxml_path, source_name, tlog)
+        return score._zip_stage(job_id, tmp_dir, midi_path, musicxml_path, pdf_path)
+
+    return run
+
+
+def _fake_pdf(ok):
+    def render(tmp_dir, musicxml_path, midi_path, source_name, tlog):
+        if not ok:
+            return None
+        pdf_path = tmp_dir / "vocal_melody.pdf"
+        pdf_path.write_bytes(b"%PDF-1.4")
+        return pdf_path
+
+    return render
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(score, "_check_score_request", lambda *args: None)
+    monkeypatch.setattr(score, "_render_pdf", _fake_pdf(True))
+    monkeypatch.setattr(score, "_score_pipeline", _fake_pipeline())
+    return monkeypatch
+
+
+def _events(client, job_id):
+    body = client.get("/api/audio/score/events", params={"job_id": job_id}).text
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def _wait_for(client, job_id, statuses=("completed", "failed")):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        progress = client.get("/api/audio/score/progress", params={"job_id": job_id}).json()
+        if progress["status"] in statuses:
+            return progress
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {progress['status']}")
+
+
+def test_score_job_reports_staged_progress_and_returns_the_zip(client, pipeline):
+    start = client.post("/api/audio/score/start", params={"pitch_engine": "yin"}, files=_wav()).json()
+    job_id = start["job_id"]
+    events = _events(client, job_id)
+    progress = [e["progress"] for e in events]
+    assert progress == sorted(progress) and progress[-1] == 1.0
+    final = events[-1]
+    assert final["status"] == "completed" and final["stage"] is None and final["retryable_stages"] == []
+    assert list(final["stages"]) == [name for name, _ in score._SCORE_STAGES]
+    assert all(entry["status"] == "done" and entry["seconds"] >= 0 for entry in final["stages"].values())
+    assert final["stages"]["pitch"]["engine"] == "yin"
+    assert any(line.startswith("Job started") for line in client.get("/api/audio/score/progress", params={"job_id": job_id}).json()["logs"])
+
+    result = client.get("/api/audio/score/result", params={"job_id": job_id})
+    assert result.status_code == 200
+    assert result.headers["x-audio-id"] == start["audio_id"]
+    assert sorted(zipfile.ZipFile(io.BytesIO(result.content)).namelist()) == ["vocal_melody.mid", "vocal_melody.musicxml", "vocal_melody.pdf"]
+    # fetched once: job and workspace are gone
+    assert job_get(job_id) is None
+    assert client.get("/api/audio/score/progress", params={"job_id": job_id}).status_code == 404
+
+
+def test_failed_stage_is_recorded_and_the_result_is_gone(client, pipeline):
+    pipeline.setattr(score, "_score_pipeline", _fake_pipeline(fail_stage="pitch"))
+    job_id = client.post("/api/audio/score/start", files=_wav()).json()["job_id"]
+    final = _wait_for(client, job_id)
+    assert final["status"] == "failed" and final["failed_stage"] == "pitch"
+    assert final["stages"]["pitch"]["status"] == "failed" and final["stages"]["pitch"]["error"] == "pitch broke"
+    assert final["stages"]["decode"]["status"] == "done" and "notes" not in final["stages"]
+    assert final["retryable_stages"] == []
+    assert client.get("/api/audio/score/result", params={"job_id": job_id}).status_code == 410
+    assert client.post(f"/api/audio/score/{job_id}/retry").status_code == 400
+
+
+def test_failed_pdf_stage_can_be_retried_from_kept_artifacts(client, pipeline):
+    pipeline.setattr(score, "_render_pdf", _fake_pdf(False))
+    job_id = client.post("/api/audio/score/start", files=_wav()).json()["job_id"]
+    final = _wait_for(client, job_id)
+    # a PDF failure still completes the job with MIDI and MusicXML in the ZIP
+    assert final["status"] == "completed" and final["stages"]["pdf"]["status"] == "failed"
+    assert final["retryable_stages"] == ["pdf"]
+    first = client.get("/api/audio/score/result", params={"job_id": job_id})
+    assert "vocal_melody.pdf" not in zipfile.ZipFile(io.BytesIO(first.content)).namelist()
+    # kept for the retry
+    assert Path(job_get(job_id)["tmp_dir"]).is_dir()
+
+    assert client.post(f"/api/audio/score/{job_id}/retry", params={"stage": "midi"}).status_code == 400
+    pipeline.setattr(score, "_render_pdf", _fake_pdf(True))
+    assert client.post(f"/api/audio/score/{job_id}/retry").json() == {"job_id": job_id, "status": "queued", "stage": "pdf"}
+    final = _wait_for(client, job_id)
+    assert final["stages"]["pdf"]["status"] == "done" and final["retryable_stages"] == []
+    second = client.get("/api/audio/score/result", params={"job_id": job_id})
+    assert "vocal_melody.pdf" in zipfile.ZipFile(io.BytesIO(second.content)).namelist()
+    assert job_get(job_id) is None
+
+
+def test_unknown_score_jobs_are_404(client):
+    assert client.get("/api/audio/score/progress", params={"job_id": "missing"}).status_code == 404
+    assert client.get("/api/audio/score/events", params={"job_id": "missing"}).status_code == 404
+    assert client.post("/api/audio/score/missing/retry").status_code == 404
+    assert client.delete("/api/audio/score/missing").status_code == 404
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from services import separation
+
+
+# Stand-ins for the Demucs task; spawn workers import them from this module by name.
+def _echo_task(task_id, model_name, source, samplerate, output_dir):
+    return {"vocals": source}
+
+
+def _crash_task(task_id, model_name, source, samplerate, output_dir):
+    os._exit(1)
+
+
+@pytest.fixture
+def engine():
+    yield separation
+    separation.shutdown_separation_engine()
+
+
+def test_reset_only_replaces_the_pool_that_broke(engine):
+    current = engine._get_executor()
+    stale = object()
+    restarts = engine._STATS["pool_restarts"]
+    engine._reset_executor(stale)
+    assert engine._EXECUTOR is current
+    engine._reset_executor(current)
+    assert engine._EXECUTOR is None
+    assert engine._STATS["pool_restarts"] == restarts + 1
+    engine._reset_executor(current)
+    assert engine._STATS["pool_restarts"] == restarts + 1
+
+
+def test_dead_worker_fails_the_task_and_the_pool_is_rebuilt(engine, monkeypatch):
+    monkeypatch.setattr(engine, "_worker_separate", _crash_task)
+    with pytest.raises(RuntimeError, match="died"):
+        engine._run("htdemucs", "x.wav", None, None, None)
+    assert engine._EXECUTOR is None
+    monkeypatch.setattr(engine, "_worker_separate", _echo_task)
+    assert engine._run("htdemucs", "x.wav", None, None, None) == {"vocals": "x.wav"}
+
+
+def test_unknown_model_is_rejected(engine):
+    with pytest.raises(ValueError):
+        engine._run("mdx_extra", "x.wav", None, None, None)
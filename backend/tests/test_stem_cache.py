@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from services import stem_cache
+from services.stem_cache import sha256_file, stem_cache_fetch, stem_cache_get, stem_cache_key, stem_cache_put
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(stem_cache, "_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(stem_cache, "_ENTRIES", OrderedDict())
+    monkeypatch.setattr(stem_cache, "_STATS", {"hits": 0, "misses": 0, "evictions": 0})
+    monkeypatch.setattr(stem_cache, "_LOADED", False)
+    return stem_cache
+
+
+def _separator(calls, size=1000, stems=("vocals", "drums", "bass", "other")):
+    def separate(out_dir):
+        calls.append(out_dir)
+        # Demucs nests its output as <model>/<track>/<stem>.wav
+        track = out_dir / "htdemucs" / "song"
+        track.mkdir(parents=True)
+        for name in stems:
+            (track / f"{name}.wav").write_bytes(name.encode() * (size // len(name)))
+        (track / "notes.txt").write_text("not a stem")
+    return separate
+
+
+def test_key_is_content_hash_plus_sanitized_model(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"abc")
+    assert sha256_file(path) == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+    assert stem_cache_key("ab", "htdemucs_ft") == "ab_htdemucs_ft"
+    assert stem_cache_key("ab", "../x y") == "ab____x_y"
+
+
+def test_fetch_separates_once_then_hits(cache, tmp_path):
+    calls = []
+    stems, hit = stem_cache_fetch("k", _separator(calls), tmp_path / "job1")
+    assert not hit and len(calls) == 1
+    assert sorted(stems) == ["bass", "drums", "other", "vocals"]
+    assert stems["vocals"].parent == tmp_path / "job1"
+    assert not calls[0].exists()  # the work dir is gone once the stems moved into the cache
+    stems, hit = stem_cache_fetch("k", _separator(calls), tmp_path / "job2")
+    assert hit and len(calls) == 1
+    assert stems["vocals"].read_bytes().startswith(b"vocals")
+    assert cache.stem_cache_stats()["hits"] == 1
+
+
+def test_concurrent_fetches_of_one_key_separate_once(cache, tmp_path):
+    calls = []
+    slow = _separator(calls)
+
+    def separate(out_dir):
+        time.sleep(0.2)
+        slow(out_dir)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(stem_cache_fetch("k", separate, tmp_path / f"job{i}")))
+        for i in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True]
+    assert cache._KEY_LOCKS == {}
+
+
+def test_eviction_is_lru_and_linked_stems_survive_it(cache, monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "_CACHE_MAX_BYTES", 9000)
+    calls = []
+    first, _ = stem_cache_fetch("a", _separator(calls), tmp_path / "a")
+    stem_cache_fetch("b", _separator(calls), tmp_path / "b")
+    assert stem_cache_get("a") is not None  # a is now the most recently used
+    stem_cache_fetch("c", _separator(calls), tmp_path / "c")
+    assert list(cache._ENTRIES) == ["a", "c"]
+    assert cache.stem_cache_stats()["evictions"] == 1
+    monkeypatch.setattr(cache, "_CACHE_MAX_BYTES", 1)
+    stem_cache_fetch("d", _separator(calls), tmp_path / "d")
+    assert list(cache._ENTRIES) == ["d"]  # the entry just written is never evicted
+    assert first["vocals"].read_bytes().startswith(b"vocals")
+
+
+def test_index_is_rebuilt_from_disk(cache, tmp_path):
+    calls = []
+    for key in ("old", "new"):
+        stem_cache_put(key, _make_output(tmp_path / key, calls))
+    os.utime(cache._CACHE_DIR / "old" / "manifest.json", (1, 1))
+    (cache._CACHE_DIR / ".staging_leftover").mkdir()
+    cache._ENTRIES.clear()
+    cache._LOADED = False
+    assert cache.stem_cache_stats()["entries"] == 2
+    assert list(cache._ENTRIES) == ["old", "new"]
+    assert not (cache._CACHE_DIR / ".staging_leftover").exists()
+
+
+def test_entry_with_missing_files_is_a_miss(cache, tmp_path):
+    stems = stem_cache_put("k", _make_output(tmp_path / "out", []))
+    stems["drums"].unlink()
+    assert stem_cache_get("k") is None
+    assert not (cache._CACHE_DIR / "k").exists()
+
+
+def test_put_without_stems_raises(cache, tmp_path):
+    (tmp_path / "empty").mkdir()
+    with pytest.raises(RuntimeError, match="no stem files"):
+        stem_cache_put("k", tmp_path / "empty")
+
+
+def _make_output(out_dir, calls):
+    out_dir.mkdir(parents=True)
+    _separator(calls)(out_dir)
+    return out_dir
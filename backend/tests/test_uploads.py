@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import io
+import time
+
+import numpy as np
+import pytest
+
+from services import uploads
+from services.uploads import UploadNotFound, acquire_audio_input, ingest_upload, upload_acquire, upload_expire, upload_get, upload_release
+
+
+class _Upload:
+    """The part of fastapi.UploadFile the store reads."""
+
+    def __init__(self, data, filename):
+        self.filename = filename
+        self._buf = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._buf.read(size)
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "_STORE_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(uploads, "_INDEX", {})
+    monkeypatch.setattr(uploads, "_STATS", {"ingested": 0, "deduplicated": 0, "bytes_saved": 0})
+    monkeypatch.setattr(uploads, "_CHUNK_SIZE", 7)  # several chunks even for tiny payloads
+    return uploads
+
+
+def _ingest(data, filename="song.WAV"):
+    return asyncio.run(ingest_upload(_Upload(data, filename)))
+
+
+def test_ingest_hashes_while_streaming_and_deduplicates(store):
+    data = b"RIFF" + bytes(range(200))
+    first = _ingest(data)
+    assert first["audio_id"] == hashlib.sha256(data).hexdigest()
+    assert first["path"].name == first["audio_id"] + ".wav"
+    assert first["path"].read_bytes() == data and not first["deduplicated"]
+    second = _ingest(data, "copy.mp3")
+    assert second["deduplicated"] and second["filename"] == "copy.mp3"
+    assert second["path"] == first["path"]  # stored once, under the first upload's name
+    assert sorted(p.name for p in store._STORE_DIR.iterdir()) == sorted([first["path"].name, first["audio_id"] + ".json"])
+    stats = store.upload_store_stats()
+    assert (stats["ingested"], stats["deduplicated"], stats["bytes_saved"], stats["entries"]) == (1, 1, len(data), 1)
+
+
+def test_odd_suffixes_are_dropped(store):
+    assert _ingest(b"a", "../../evil.sh;rm")["path"].suffix == ""
+    assert _ingest(b"b", "")["filename"] == "input"
+
+
+def test_refcounts_keep_uploads_from_expiring(store, monkeypatch):
+    info = _ingest(b"audio")
+    audio_id = info["audio_id"]
+    upload_acquire(audio_id)
+    upload_acquire(audio_id)
+    upload_release(audio_id)
+    assert upload_get(audio_id)["refs"] == 1
+    monkeypatch.setattr(store, "_UPLOAD_TTL_SECONDS", -1)
+    assert upload_expire() == 0
+    upload_release(audio_id)
+    upload_release(audio_id)  # never below zero
+    assert upload_get(audio_id)["refs"] == 0
+    assert upload_expire() == 1
+    assert upload_get(audio_id) is None and not info["path"].exists()
+    with pytest.raises(UploadNotFound):
+        upload_acquire(audio_id)
+
+
+def test_idle_uploads_within_the_ttl_are_kept(store, monkeypatch):
+    audio_id = _ingest(b"audio")["audio_id"]
+    monkeypatch.setattr(store, "_UPLOAD_TTL_SECONDS", 3600)
+    store._INDEX[audio_id]["last_used"] = time.time() - 60
+    assert upload_expire() == 0
+
+
+def test_index_is_reloaded_without_references(store):
+    kept = _ingest(b"kept")
+    lost = _ingest(b"lost")
+    upload_acquire(kept["audio_id"])
+    lost["path"].unlink()
+    store._INDEX.clear()
+    store._load_index()
+    assert upload_get(kept["audio_id"])["refs"] == 0
+    assert upload_get(lost["audio_id"]) is None
+
+
+def test_acquire_audio_input(store):
+    audio_id = _ingest(b"audio")["audio_id"]
+    acquired = asyncio.run(acquire_audio_input(audio_id=f"  {audio_id.upper()} "))
+    assert acquired["audio_id"] == audio_id and acquired["refs"] == 1
+    fresh = asyncio.run(acquire_audio_input(_Upload(b"audio", "again.flac")))
+    assert fresh["deduplicated"] and fresh["filename"] == "again.flac" and fresh["refs"] == 2
+    with pytest.raises(ValueError):
+        asyncio.run(acquire_audio_input())
+    with pytest.raises(UploadNotFound):
+        asyncio.run(acquire_audio_input(audio_id="0" * 64))
+    assert upload_get("not-a-hash") is None
+
+
+def test_requests_release_their_reference(client, ffmpeg_exe, write_wav):
+    data = write_wav(np.zeros(4800)).read_bytes()
+    response = client.post("/api/audio/peaks", files={"file": ("silence.wav", data, "audio/wav")})
+    audio_id = response.json()["audio_hash"]
+    assert response.status_code == 200
+    assert upload_get(audio_id)["refs"] == 0
+    assert client.post("/api/audio/peaks", params={"audio_id": "0" * 64}).status_code == 404
@@ -0,0 +1,57 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+from services.visualization import build_visualization_filter, parse_color, resolve_layers
+
+
+def test_parse_color_accepts_hash_and_0x():
+    assert parse_color("#ff8000") == (255, 128, 0)
+    assert parse_color("0x0000FF") == (0, 0, 255)
+    assert parse_color("nope", (1, 2, 3)) == (1, 2, 3)
+
+
+def test_resolve_layers_pairs_colors_and_drops_duplicates():
+    layers = resolve_layers("bars,spectrum,bars,unknown", "#ff0000,#00ff00", "#0000ff")
+    assert layers == [("bars", (255, 0, 0)), ("spectrum", (0, 255, 0)), ("line", (0, 0, 255))]
+
+
+def test_resolve_layers_falls_back_to_line_without_the_filter():
+    assert resolve_layers("spectrogram", "", "#ffffff", available_filters={"showwaves"}) == [("line", (255, 255, 255))]
+    assert resolve_layers("", "", "#ffffff") == [("line", (255, 255, 255))]
+
+
+def test_graph_decodes_once_and_overlays_every_layer():
+    graph = build_visualization_filter(640, 360, 30, "#000000", [("line", (255, 0, 0)), ("spectrum", (0, 255, 0)), ("circular", (0, 0, 255))])
+    assert graph.count("asplit=3") == 1
+    assert graph.count("overlay=") == 3
+    assert graph.count(":shortest=1") == 1
+    assert graph.endswith("format=yuv420p[vout]")
+
+
+def _render(ffmpeg_exe, layers):
+    graph = build_visualization_filter(160, 90, 10, "#000000", layers).replace("format=yuv420p[vout]", "format=rgb24[vout]")
+    out = subprocess.run(
+        [ffmpeg_exe, "-v", "error", "-f", "lavfi", "-i", "sine=f=1000:d=2", "-filter_complex", graph,
+         "-map", "[vout]", "-frames:v", "15", "-f", "rawvideo", "-"],
+        capture_output=True, check=True,
+    )
+    pixels = np.frombuffer(out.stdout, dtype=np.uint8).reshape(-1, 3)
+    return pixels[pixels.max(axis=1) > 40]
+
+
+@pytest.mark.parametrize("layer", ["spectrogram", "wave3d"])
+def test_spectrogram_layers_take_the_configured_color(ffmpeg_exe, layer):
+    # white and yellow keep more than one channel, so any hue from showspectrum's palette would show
+    lit = _render(ffmpeg_exe, [(layer, (255, 255, 255))]).astype(int)
+    assert len(lit)
+    assert np.abs(lit[:, 0] - lit[:, 1]).max() <= 2 and np.abs(lit[:, 1] - lit[:, 2]).max() <= 2
+    lit = _render(ffmpeg_exe, [(layer, (255, 255, 0))]).astype(int)
+    assert np.abs(lit[:, 0] - lit[:, 1]).max() <= 2 and lit[:, 2].max() == 0
+
+
+def test_waveform_layer_renders_in_its_color(ffmpeg_exe):
+    lit = _render(ffmpeg_exe, [("line", (0, 255, 0))])
+    assert len(lit)
+    assert lit[:, 1].mean() > 4 * max(lit[:, 0].mean(), lit[:, 2].mean(), 1)
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from services import whisper_models
+from services.whisper_models import whisper_model, whisper_registry_stats
+
+
+class _FakeModel:
+    loads = 0
+
+    def __init__(self, key):
+        type(self).loads += 1
+        self.key = key
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(whisper_models, "_load_instance", _FakeModel)
+    monkeypatch.setattr(whisper_models, "_REGISTRY", type(whisper_models._REGISTRY)())
+    monkeypatch.setattr(_FakeModel, "loads", 0)
+    return whisper_models
+
+
+def test_model_is_loaded_once_and_shared(registry):
+    with whisper_model("small", device="cpu", compute_type="int8") as first:
+        pass
+    with whisper_model("small", device="cpu", compute_type="int8") as second:
+        pass
+    assert first is second
+    assert _FakeModel.loads == 1
+    assert [entry["model"] for entry in whisper_registry_stats()["loaded"]] == ["small"]
+
+
+def test_concurrent_borrowers_wait_for_the_single_instance(registry):
+    holding = threading.Event()
+    release = threading.Event()
+    seen = []
+
+    def _hold():
+        with whisper_model("base", device="cpu", compute_type="int8") as model:
+            seen.append(model)
+            holding.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=_hold)
+    worker.start()
+    holding.wait(5)
+    waiter = threading.Thread(target=lambda: seen.append(whisper_model("base", device="cpu", compute_type="int8").__enter__()))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    release.set()
+    worker.join(5)
+    waiter.join(5)
+    assert seen[0] is seen[1]
+    assert _FakeModel.loads == 1
+
+
+def test_idle_models_are_evicted_over_budget(registry, monkeypatch):
+    monkeypatch.setattr(registry, "_BUDGET_MB", 1500)
+    with whisper_model("small", device="cpu", compute_type="int8"):
+        pass
+    with whisper_model("medium", device="cpu", compute_type="int8"):
+        pass
+    assert [entry["model"] for entry in whisper_registry_stats()["loaded"]] == ["medium"]
+
+
+def test_models_in_use_are_not_evicted(registry, monkeypatch):
+    monkeypatch.setattr(registry, "_BUDGET_MB", 1500)
+    with whisper_model("small", device="cpu", compute_type="int8"):
+        with whisper_model("medium", device="cpu", compute_type="int8"):
+            loaded = [entry["model"] for entry in whisper_registry_stats()["loaded"]]
+    assert loaded == ["small", "medium"]
@@ -0,0 +1,111 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from services import workspace
+from services.files import acquire_temp_dir, create_temp_dir, release_temp_dir, safe_rmtree
+from services.workspace import WorkspaceFull, workspace_stats, workspace_sweep
+
+
+@pytest.fixture
+def small_quota(monkeypatch):
+    monkeypatch.setattr(workspace, "_QUOTA_BYTES", 1024 * 1024)
+    monkeypatch.setattr(workspace, "_MIN_FREE_BYTES", 0)
+
+
+def _fill(path, size):
+    (path / "blob.bin").write_bytes(os.urandom(size))
+
+
+def test_released_dir_is_swept_after_ttl(monkeypatch):
+    path = create_temp_dir("ttl_")
+    release_temp_dir(path)
+    workspace_sweep()
+    assert path.is_dir()
+    monkeypatch.setattr(workspace, "_TTL_SECONDS", 0.0)
+    time.sleep(0.01)
+    workspace_sweep()
+    assert not path.exists()
+    assert acquire_temp_dir(path) is False
+
+
+def test_active_dir_is_never_swept(monkeypatch):
+    monkeypatch.setattr(workspace, "_TTL_SECONDS", 0.0)
+    path = create_temp_dir("pinned_")
+    time.sleep(0.01)
+    workspace_sweep()
+    assert path.is_dir()
+    safe_rmtree(path)
+
+
+def test_heavy_create_evicts_idle_dirs_then_rejects(small_quota):
+    idle = create_temp_dir("idle_")
+    _fill(idle, 1100 * 1024)
+    release_temp_dir(idle)
+    pinned = create_temp_dir("heavy_", heavy=True)
+    assert not idle.exists()
+    _fill(pinned, 1100 * 1024)
+    rejected = workspace_stats()["rejected"]
+    with pytest.raises(WorkspaceFull):
+        create_temp_dir("heavy_", heavy=True)
+    assert workspace_stats()["rejected"] == rejected + 1
+    safe_rmtree(pinned)
+    create_temp_dir("heavy_", heavy=True)
+
+
+def test_acquire_pins_a_released_dir(monkeypatch):
+    path = create_temp_dir("retry_")
+    release_temp_dir(path)
+    assert acquire_temp_dir(path) is True
+    monkeypatch.setattr(workspace, "_TTL_SECONDS", 0.0)
+    time.sleep(0.01)
+    workspace_sweep()
+    assert path.is_dir()
+    safe_rmtree(path)
+
+
+def _big_zip(path):
+    path.write_bytes(os.urandom(1100 * 1024))
+    return path
+
+
+def test_sync_score_releases_its_work_dir(client, monkeypatch, small_quota, write_wav):
+    from routers import score
+
+    monkeypatch.setattr(score, "_DEMUCS_AVAILABLE", True)
+    monkeypatch.setattr(score, "pitch_engine_available", lambda name: True)
+    monkeypatch.setattr(score, "_score_pipeline", lambda tmp_dir, *args: _big_zip(tmp_dir / "vocal_score.zip"))
+    wav = write_wav(np.zeros(4800))
+    for _ in range(2):
+        with wav.open("rb") as f:
+            resp = client.post("/api/audio/generate-score", files={"file": ("x.wav", f, "audio/wav")})
+        assert resp.status_code == 200
+        assert len(resp.content) == 1100 * 1024
+
+
+def test_sync_align_releases_its_work_dir(client, monkeypatch, small_quota, write_wav):
+    from routers import lyrics
+
+    monkeypatch.setattr(lyrics, "_align_pipeline", lambda work, input_path, zip_path, *args: _big_zip(zip_path))
+    wav = write_wav(np.zeros(4800))
+    for _ in range(2):
+        with wav.open("rb") as f:
+            resp = client.post("/api/audio/align-lyrics", data={"lyrics_text": "la la"}, files={"file": ("x.wav", f, "audio/wav")})
+        assert resp.status_code == 200
+
+
+def test_sync_extract_releases_its_work_dir(client, monkeypatch, small_quota, write_wav):
+    from routers import lyrics
+
+    def _pipeline(work, input_path, out_dir, *args):
+        return out_dir / "x.lrc", _big_zip(out_dir / "lyrics.zip")
+
+    monkeypatch.setattr(lyrics, "_DEMUCS_AVAILABLE", True)
+    monkeypatch.setattr(lyrics, "_extract_pipeline", _pipeline)
+    wav = write_wav(np.zeros(4800))
+    for _ in range(2):
+        with wav.open("rb") as f:
+            resp = client.post("/api/audio/extract-lyrics", files={"file": ("x.wav", f, "audio/wav")})
+        assert resp.status_code == 200
@@ -307,6 +307,8 @@ function App() {
       <VocalScoreGenerator
         selectedFile={audioPlayer.selectedFile}
         isGeneratingScore={lyricsProcessing.isGeneratingScore}
+        scoreProgress={lyricsProcessing.scoreProgress}
+        scoreStage={lyricsProcessing.scoreStage}
         generateScore={lyricsProcessing.generateScore}
         isCollapsed={colScore}
         onToggleCollapse={() => setColScore(v => !v)}
@@ -3,6 +3,8 @@ import React from 'react'
 const VocalScoreGenerator = ({ 
   selectedFile, 
   isGeneratingScore, 
+  scoreProgress,
+  scoreStage,
   generateScore, 
   isCollapsed, 
   onToggleCollapse,
@@ -29,7 +31,7 @@ const VocalScoreGenerator = ({
             style={isGeneratingScore ? { animation: 'pulse 1s infinite', background: '#365dfb' } : undefined}
             onClick={handleGenerateScore}
           >
-            {isGeneratingScore ? 'In progress...' : 'Generate Vocal Score (MIDI + MusicXML/PDF)'}
+            {isGeneratingScore ? `In progress... ${scoreStage ? scoreStage + ' ' : ''}${Math.round(scoreProgress || 0)}%` : 'Generate Vocal Score (MIDI + MusicXML/PDF)'}
           </button>
         </div>
       )}
@@ -10,6 +10,10 @@ export const DEFAULT_COMPRESSOR_SETTINGS = {
   release: 200
 }
 
+// Normalize output: the server can pipe these formats straight through; WAV always goes via a temp file
+export const NORMALIZE_FORMAT = 'wav'
+export const STREAMABLE_FORMATS = new Set(['flac', 'opus', 'mp3'])
+
 export const LUFS_RANGE = {
   MIN: -48,
   MAX: 0
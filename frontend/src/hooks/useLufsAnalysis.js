@@ -1,5 +1,5 @@
-import { useState, useCallback } from 'react'
-import { DEFAULT_LUFS_TARGET, DEFAULT_TP_TARGET, DEFAULT_LRA_TARGET, DEFAULT_COMPRESSOR_SETTINGS } from '../constants/audio'
+import { useState, useCallback, useRef } from 'react'
+import { DEFAULT_LUFS_TARGET, DEFAULT_TP_TARGET, DEFAULT_LRA_TARGET, DEFAULT_COMPRESSOR_SETTINGS, NORMALIZE_FORMAT, STREAMABLE_FORMATS } from '../constants/audio'
 
 export const useLufsAnalysis = () => {
   const [isMeasuring, setIsMeasuring] = useState(false)
@@ -14,6 +14,8 @@ export const useLufsAnalysis = () => {
   const [compRatio, setCompRatio] = useState(DEFAULT_COMPRESSOR_SETTINGS.ratio)
   const [compAttack, setCompAttack] = useState(DEFAULT_COMPRESSOR_SETTINGS.attack)
   const [compRelease, setCompRelease] = useState(DEFAULT_COMPRESSOR_SETTINGS.release)
+  // file the current lufsData belongs to; normalize reuses its audio_id/measurement_id instead of re-uploading
+  const measuredFileRef = useRef(null)
 
   const measureLUFS = useCallback(async (selectedFile) => {
     if (!selectedFile) return
@@ -22,23 +24,27 @@ export const useLufsAnalysis = () => {
       setLufsData(null)
       const form = new FormData()
       form.append('file', selectedFile)
-      const resp = await fetch('http://localhost:8000/api/audio/measure-lufs', { method: 'POST', body: form })
+      const qs = new URLSearchParams({
+        target_lufs: String(targetLufs),
+        target_tp: String(targetTp),
+        target_lra: String(targetLra),
+      })
+      const resp = await fetch('http://localhost:8000/api/audio/measure-lufs?' + qs.toString(), { method: 'POST', body: form })
       if (!resp.ok) throw new Error(await resp.text())
       const data = await resp.json()
+      measuredFileRef.current = selectedFile
       setLufsData(data)
     } catch (e) {
       alert('LUFS 측정 실패: ' + (e?.message || e))
     } finally {
       setIsMeasuring(false)
     }
-  }, [])
+  }, [targetLufs, targetTp, targetLra])
 
   const normalizeToTarget = useCallback(async (selectedFile) => {
     if (!selectedFile) return
     try {
       setIsNormalizing(true)
-      const form = new FormData()
-      form.append('file', selectedFile)
       const qs = new URLSearchParams({
         target_lufs: String(targetLufs),
         target_tp: String(targetTp),
@@ -48,8 +54,27 @@ export const useLufsAnalysis = () => {
         compress_ratio: String(compRatio),
         compress_attack_ms: String(compAttack),
         compress_release_ms: String(compRelease),
+        format: NORMALIZE_FORMAT,
       })
-      const resp = await fetch('http://localhost:8000/api/audio/normalize?' + qs.toString(), { method: 'POST', body: form })
+      // only formats that tolerate an unknown length can be piped; WAV needs its header sizes,
+      // so the server renders it to a temp file
+      if (STREAMABLE_FORMATS.has(NORMALIZE_FORMAT)) qs.set('stream', 'true')
+      const upload = () => {
+        const form = new FormData()
+        form.append('file', selectedFile)
+        return fetch('http://localhost:8000/api/audio/normalize?' + qs.toString(), { method: 'POST', body: form })
+      }
+      let resp
+      if (lufsData?.measurement_id && measuredFileRef.current === selectedFile) {
+        // already measured: the server skips the upload and pass 1
+        const reuse = new URLSearchParams(qs)
+        reuse.set('audio_id', lufsData.audio_id)
+        reuse.set('measurement_id', lufsData.measurement_id)
+        resp = await fetch('http://localhost:8000/api/audio/normalize?' + reuse.toString(), { method: 'POST' })
+        if (resp.status === 404) resp = await upload()  // server restarted or upload expired
+      } else {
+        resp = await upload()
+      }
       if (!resp.ok) throw new Error(await resp.text())
       const blob = await resp.blob()
       const url = URL.createObjectURL(blob)
@@ -57,7 +82,7 @@ export const useLufsAnalysis = () => {
       // Auto download
       const a = document.createElement('a')
       a.href = url
-      a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + `_norm_${targetLufs}LUFS.wav`
+      a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + `_norm_${targetLufs}LUFS.${NORMALIZE_FORMAT}`
       document.body.appendChild(a)
       a.click()
       a.remove()
@@ -66,7 +91,7 @@ export const useLufsAnalysis = () => {
     } finally {
       setIsNormalizing(false)
     }
-  }, [targetLufs, targetTp, targetLra, preCompress, compThreshold, compRatio, compAttack, compRelease])
+  }, [targetLufs, targetTp, targetLra, preCompress, compThreshold, compRatio, compAttack, compRelease, lufsData])
 
   const extractNumber = useCallback((obj, a, b) => {
     if (!obj) return undefined
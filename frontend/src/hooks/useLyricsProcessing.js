@@ -1,7 +1,11 @@
 import { useState, useCallback } from 'react'
 
+const TERMINAL_STATUSES = ['completed', 'failed', 'cancelled']
+
 export const useLyricsProcessing = () => {
   const [isGeneratingScore, setIsGeneratingScore] = useState(false)
+  const [scoreProgress, setScoreProgress] = useState(0)
+  const [scoreStage, setScoreStage] = useState(null)
   const [isExtractingLyrics, setIsExtractingLyrics] = useState(false)
   const [lyricsLang, setLyricsLang] = useState('auto')
   const [alignLyricsText, setAlignLyricsText] = useState('')
@@ -11,29 +15,94 @@ export const useLyricsProcessing = () => {
   const [lastLrcText, setLastLrcText] = useState('')
   const [parsedLrc, setParsedLrc] = useState([])
 
+  const finishScore = useCallback(async (jobId, selectedFile, data) => {
+    try {
+      if (data.status === 'completed') {
+        const resp = await fetch('http://localhost:8000/api/audio/score/result?job_id=' + encodeURIComponent(jobId))
+        if (!resp.ok) throw new Error(await resp.text())
+        const blob = await resp.blob()
+        const url = URL.createObjectURL(blob)
+        const a = document.createElement('a')
+        a.href = url
+        a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + '_vocal_score.zip'
+        document.body.appendChild(a)
+        a.click()
+        a.remove()
+        URL.revokeObjectURL(url)
+      } else if (data.status === 'failed') {
+        alert('악보 생성 실패' + (data.failed_stage ? ' (' + data.failed_stage + ' 단계)' : '') + ': ' + (data.error || 'unknown error'))
+      }
+    } catch (e) {
+      alert('악보 생성 실패: ' + (e?.message || e))
+    }
+    setIsGeneratingScore(false)
+    setScoreStage(null)
+  }, [])
+
+  const applyScoreStatus = useCallback((data) => {
+    setScoreProgress(Number(data.progress || 0) * 100)
+    setScoreStage(data.stage || null)
+  }, [])
+
+  // Poll score progress (fallback when the event stream is unavailable)
+  const pollScoreProgress = useCallback(async (jobId, selectedFile) => {
+    while (true) {
+      await new Promise(r => setTimeout(r, 1000))
+      let data
+      try {
+        const resp = await fetch('http://localhost:8000/api/audio/score/progress?job_id=' + encodeURIComponent(jobId))
+        if (!resp.ok) throw new Error(await resp.text())
+        data = await resp.json()
+      } catch (e) {
+        alert('악보 생성 진행률 조회 실패: ' + (e?.message || e))
+        setIsGeneratingScore(false)
+        setScoreStage(null)
+        return
+      }
+      applyScoreStatus(data)
+      if (TERMINAL_STATUSES.includes(data.status)) return finishScore(jobId, selectedFile, data)
+    }
+  }, [applyScoreStatus, finishScore])
+
+  // Stage-by-stage progress pushed by the server over Server-Sent Events
+  const watchScoreProgress = useCallback((jobId, selectedFile) => {
+    if (typeof EventSource === 'undefined') return pollScoreProgress(jobId, selectedFile)
+    const source = new EventSource('http://localhost:8000/api/audio/score/events?job_id=' + encodeURIComponent(jobId))
+    let settled = false
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data)
+      applyScoreStatus(data)
+      if (TERMINAL_STATUSES.includes(data.status)) {
+        settled = true
+        source.close()
+        finishScore(jobId, selectedFile, data)
+      }
+    }
+    source.onerror = () => {
+      if (settled) return
+      settled = true
+      source.close()
+      pollScoreProgress(jobId, selectedFile)
+    }
+  }, [applyScoreStatus, pollScoreProgress, finishScore])
+
   const generateScore = useCallback(async (selectedFile) => {
     if (!selectedFile) return
     try {
       setIsGeneratingScore(true)
+      setScoreProgress(0)
+      setScoreStage(null)
       const form = new FormData()
       form.append('file', selectedFile)
-      const resp = await fetch('http://localhost:8000/api/audio/generate-score', { method: 'POST', body: form })
+      const resp = await fetch('http://localhost:8000/api/audio/score/start', { method: 'POST', body: form })
       if (!resp.ok) throw new Error(await resp.text())
-      const blob = await resp.blob()
-      const url = URL.createObjectURL(blob)
-      const a = document.createElement('a')
-      a.href = url
-      a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + '_vocal_score.zip'
-      document.body.appendChild(a)
-      a.click()
-      a.remove()
-      URL.revokeObjectURL(url)
+      const data = await resp.json()
+      watchScoreProgress(data.job_id, selectedFile)
     } catch (e) {
       alert('악보 생성 실패: ' + (e?.message || e))
-    } finally {
       setIsGeneratingScore(false)
     }
-  }, [])
+  }, [watchScoreProgress])
 
   const extractLyrics = useCallback(async (selectedFile, language) => {
     if (!selectedFile) return
@@ -189,6 +258,8 @@ export const useLyricsProcessing = () => {
 
   return {
     isGeneratingScore,
+    scoreProgress,
+    scoreStage,
     isExtractingLyrics,
     lyricsLang,
     alignLyricsText,
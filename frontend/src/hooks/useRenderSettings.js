@@ -1,6 +1,8 @@
 import { useState, useCallback, useEffect } from 'react'
 import { DEFAULT_RENDER_SETTINGS, PRESET_DIMENSIONS, RENDER_PRESETS } from '../constants/audio'
 
+const TERMINAL_STATUSES = ['completed', 'failed', 'cancelled']
+
 export const useRenderSettings = () => {
   const [widthPx, setWidthPx] = useState(DEFAULT_RENDER_SETTINGS.width)
   const [heightPx, setHeightPx] = useState(DEFAULT_RENDER_SETTINGS.height)
@@ -10,6 +12,7 @@ export const useRenderSettings = () => {
   const [preset, setPreset] = useState(DEFAULT_RENDER_SETTINGS.preset)
   const [jobProgress, setJobProgress] = useState(0)
   const [jobStatus, setJobStatus] = useState('idle')
+  const [jobId, setJobId] = useState(null)
 
   const applyPreset = useCallback((value) => {
     setPreset(value)
@@ -33,40 +36,92 @@ export const useRenderSettings = () => {
     return '0x' + hex
   }, [])
 
+  const finishRender = useCallback(async (id, selectedFile, data) => {
+    try {
+      if (data.status === 'completed') {
+        const res = await fetch('http://localhost:8000/api/render/result?job_id=' + encodeURIComponent(id))
+        if (!res.ok) throw new Error(await res.text())
+        const blob = await res.blob()
+        const url = URL.createObjectURL(blob)
+        const a = document.createElement('a')
+        a.href = url
+        a.download = `waveform_${selectedFile.name.replace(/\.[^/.]+$/, '')}.mp4`
+        document.body.appendChild(a)
+        a.click()
+        a.remove()
+        URL.revokeObjectURL(url)
+      } else if (data.status === 'failed') {
+        alert('Render failed: ' + (data.error || 'unknown error'))
+      }
+    } catch (e) {
+      setJobStatus('failed')
+      alert('Progress error: ' + (e?.message || e))
+    }
+    setJobId(null)
+  }, [])
+
   const pollProgress = useCallback(async (id, selectedFile) => {
-    let done = false
-    while (!done) {
+    while (true) {
       await new Promise(r => setTimeout(r, 800))
+      let data
       try {
         const resp = await fetch('http://localhost:8000/api/render/progress?job_id=' + encodeURIComponent(id))
         if (!resp.ok) throw new Error(await resp.text())
-        const data = await resp.json()
-        setJobProgress(Number(data.progress || 0))
-        setJobStatus(String(data.status))
-        if (data.status === 'completed') {
-          done = true
-          const res = await fetch('http://localhost:8000/api/render/result?job_id=' + encodeURIComponent(id))
-          if (!res.ok) throw new Error(await res.text())
-          const blob = await res.blob()
-          const url = URL.createObjectURL(blob)
-          const a = document.createElement('a')
-          a.href = url
-          a.download = `waveform_${selectedFile.name.replace(/\.[^/.]+$/, '')}.mp4`
-          document.body.appendChild(a)
-          a.click()
-          a.remove()
-          URL.revokeObjectURL(url)
-        } else if (data.status === 'failed' || data.status === 'cancelled') {
-          done = true
-          alert('Render failed: ' + (data.error || 'unknown error'))
-        }
+        data = await resp.json()
       } catch (e) {
-        done = true
         setJobStatus('failed')
+        setJobId(null)
         alert('Progress error: ' + (e?.message || e))
+        return
       }
+      setJobProgress(Number(data.progress || 0))
+      setJobStatus(String(data.status))
+      if (TERMINAL_STATUSES.includes(data.status)) return finishRender(id, selectedFile, data)
     }
-  }, [])
+  }, [finishRender])
+
+  // the server pushes progress over Server-Sent Events; polling is the fallback when the stream fails
+  const watchProgress = useCallback((id, selectedFile) => {
+    if (typeof EventSource === 'undefined') return pollProgress(id, selectedFile)
+    const source = new EventSource('http://localhost:8000/api/render/events?job_id=' + encodeURIComponent(id))
+    let settled = false
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data)
+      setJobProgress(Number(data.progress || 0))
+      setJobStatus(String(data.status))
+      if (TERMINAL_STATUSES.includes(data.status)) {
+        settled = true
+        source.close()
+        finishRender(id, selectedFile, data)
+      }
+    }
+    source.onerror = () => {
+      if (settled) return
+      settled = true
+      source.close()
+      pollProgress(id, selectedFile)
+    }
+  }, [pollProgress, finishRender])
+
+  const cancelRender = useCallback(async () => {
+    if (!jobId) return
+    try {
+      await fetch('http://localhost:8000/api/render/' + encodeURIComponent(jobId), { method: 'DELETE' })
+      setJobStatus('cancelled')
+    } catch (e) {
+      alert('Cancel failed: ' + (e?.message || e))
+    }
+  }, [jobId])
+
+  // closing the tab stops the render instead of leaving it to the server's idle timeout
+  useEffect(() => {
+    if (!jobId) return
+    const onHide = () => {
+      fetch('http://localhost:8000/api/render/' + encodeURIComponent(jobId), { method: 'DELETE', keepalive: true })
+    }
+    window.addEventListener('pagehide', onHide)
+    return () => window.removeEventListener('pagehide', onHide)
+  }, [jobId])
 
   const startRenderAsync = useCallback(async (selectedFile, selectedVis = ['line'], visSettings = {}) => {
     if (!selectedFile) return
@@ -92,12 +147,13 @@ export const useRenderSettings = () => {
       if (!resp.ok) throw new Error(await resp.text())
       const data = await resp.json()
       setJobStatus('running')
-      pollProgress(data.job_id, selectedFile)
+      setJobId(data.job_id)
+      watchProgress(data.job_id, selectedFile)
     } catch (e) {
       setJobStatus('failed')
       alert('Start failed: ' + (e?.message || e))
     }
-  }, [widthPx, heightPx, fps, waveColor, bgColor, toHex0x, pollProgress])
+  }, [widthPx, heightPx, fps, waveColor, bgColor, toHex0x, watchProgress])
 
   return {
     widthPx,
@@ -114,6 +170,7 @@ export const useRenderSettings = () => {
     setWaveColor,
     setBgColor,
     applyPreset,
-    startRenderAsync
+    startRenderAsync,
+    cancelRender
   }
 }
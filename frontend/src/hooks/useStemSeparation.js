@@ -1,5 +1,7 @@
 import { useState, useCallback, useEffect } from 'react'
 
+const TERMINAL_STATUSES = ['completed', 'failed', 'cancelled']
+
 export const useStemSeparation = () => {
   const [stemModels, setStemModels] = useState([])
   const [selectedStemModel, setSelectedStemModel] = useState('demucs:4stems')
@@ -24,6 +26,72 @@ export const useStemSeparation = () => {
     }
   }, [])
 
+  const finishSeparation = useCallback(async (jobId, selectedFile, data) => {
+    try {
+      if (data.status === 'completed') {
+        const res = await fetch('http://localhost:8000/api/audio/stem-separation/result?job_id=' + encodeURIComponent(jobId))
+        if (!res.ok) throw new Error(await res.text())
+        const blob = await res.blob()
+        const url = URL.createObjectURL(blob)
+        const a = document.createElement('a')
+        a.href = url
+        a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + '_stems.zip'
+        document.body.appendChild(a)
+        a.click()
+        a.remove()
+        URL.revokeObjectURL(url)
+      } else if (data.status === 'failed') {
+        alert('Stem 분리 실패: ' + (data.error || 'unknown error'))
+      }
+    } catch (e) {
+      alert('Stem 분리 진행률 조회 실패: ' + (e?.message || e))
+    }
+    setIsSeparating(false)
+    setSeparationJobId(null)
+  }, [])
+
+  // Poll separation progress (fallback when the event stream is unavailable)
+  const pollSeparationProgress = useCallback(async (jobId, selectedFile) => {
+    while (true) {
+      await new Promise(r => setTimeout(r, 1000))
+      let data
+      try {
+        const resp = await fetch('http://localhost:8000/api/audio/stem-separation/progress?job_id=' + encodeURIComponent(jobId))
+        if (!resp.ok) throw new Error(await resp.text())
+        data = await resp.json()
+      } catch (e) {
+        alert('Stem 분리 진행률 조회 실패: ' + (e?.message || e))
+        setIsSeparating(false)
+        setSeparationJobId(null)
+        return
+      }
+      setSeparationProgress(Number(data.progress || 0) * 100)
+      if (TERMINAL_STATUSES.includes(data.status)) return finishSeparation(jobId, selectedFile, data)
+    }
+  }, [finishSeparation])
+
+  // Progress pushed by the server over Server-Sent Events
+  const watchSeparationProgress = useCallback((jobId, selectedFile) => {
+    if (typeof EventSource === 'undefined') return pollSeparationProgress(jobId, selectedFile)
+    const source = new EventSource('http://localhost:8000/api/audio/stem-separation/events?job_id=' + encodeURIComponent(jobId))
+    let settled = false
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data)
+      setSeparationProgress(Number(data.progress || 0) * 100)
+      if (TERMINAL_STATUSES.includes(data.status)) {
+        settled = true
+        source.close()
+        finishSeparation(jobId, selectedFile, data)
+      }
+    }
+    source.onerror = () => {
+      if (settled) return
+      settled = true
+      source.close()
+      pollSeparationProgress(jobId, selectedFile)
+    }
+  }, [pollSeparationProgress, finishSeparation])
+
   // Separate stems
   const separateStems = useCallback(async (selectedFile) => {
     if (!selectedFile) return
@@ -47,49 +115,31 @@ export const useStemSeparation = () => {
       
       const data = await resp.json()
       setSeparationJobId(data.job_id)
-      pollSeparationProgress(data.job_id, selectedFile)
+      watchSeparationProgress(data.job_id, selectedFile)
     } catch (e) {
       alert('Stem 분리 시작 실패: ' + (e?.message || e))
       setIsSeparating(false)
     }
-  }, [selectedStemModel])
+  }, [selectedStemModel, watchSeparationProgress])
 
-  // Poll separation progress
-  const pollSeparationProgress = useCallback(async (jobId, selectedFile) => {
-    let done = false
-    while (!done) {
-      await new Promise(r => setTimeout(r, 1000))
-      try {
-        const resp = await fetch('http://localhost:8000/api/audio/stem-separation/progress?job_id=' + encodeURIComponent(jobId))
-        if (!resp.ok) throw new Error(await resp.text())
-        const data = await resp.json()
-        setSeparationProgress(Number(data.progress || 0) * 100)
-        
-        if (data.status === 'completed') {
-          done = true
-          const res = await fetch('http://localhost:8000/api/audio/stem-separation/result?job_id=' + encodeURIComponent(jobId))
-          if (!res.ok) throw new Error(await res.text())
-          const blob = await res.blob()
-          const url = URL.createObjectURL(blob)
-          const a = document.createElement('a')
-          a.href = url
-          a.download = (selectedFile?.name?.replace(/\.[^/.]+$/, '') || 'audio') + '_stems.zip'
-          document.body.appendChild(a)
-          a.click()
-          a.remove()
-          URL.revokeObjectURL(url)
-        } else if (data.status === 'failed' || data.status === 'cancelled') {
-          done = true
-          alert('Stem 분리 실패: ' + (data.error || 'unknown error'))
-        }
-      } catch (e) {
-        done = true
-        alert('Stem 분리 진행률 조회 실패: ' + (e?.message || e))
-      }
+  const cancelSeparation = useCallback(async () => {
+    if (!separationJobId) return
+    try {
+      await fetch('http://localhost:8000/api/audio/stem-separation/' + encodeURIComponent(separationJobId), { method: 'DELETE' })
+    } catch (e) {
+      alert('Stem 분리 취소 실패: ' + (e?.message || e))
     }
-    setIsSeparating(false)
-    setSeparationJobId(null)
-  }, [])
+  }, [separationJobId])
+
+  // closing the tab stops Demucs instead of leaving it to the server's idle timeout
+  useEffect(() => {
+    if (!separationJobId) return
+    const onHide = () => {
+      fetch('http://localhost:8000/api/audio/stem-separation/' + encodeURIComponent(separationJobId), { method: 'DELETE', keepalive: true })
+    }
+    window.addEventListener('pagehide', onHide)
+    return () => window.removeEventListener('pagehide', onHide)
+  }, [separationJobId])
 
   // Load stem models on mount
   useEffect(() => {
@@ -103,6 +153,7 @@ export const useStemSeparation = () => {
     separationProgress,
     separationJobId,
     setSelectedStemModel,
-    separateStems
+    separateStems,
+    cancelSeparation
   }
 }